@@ -1,21 +1,74 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, BackgroundTasks
+from typing import Literal, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+import asyncio
+import json
+import logging
 import shutil
 import os
 import uuid
 from pathlib import Path
+from pydantic import ValidationError
 from app.models.schemas import AnalysisReport, AnalysisStatus
 from app.services.analyzer import CodebaseAnalyzer
+from app.services.job_profiler import profile_store
+from app.services.job_trace import trace_store
+from app.services.prefetch import research_prefetcher
+from app.services.insight_extractor import extraction_flight
+from app.services.llm_router import llm_router
+from app.services.paper_index import paper_index_store
+from app.services.report_payload import EncodedReport, etag_matches
+from app.services.research_retriever import research_sources, search_flight
+from app.services.result_cache import insight_cache, search_cache
+from app.services.rule_engine import rule_registry
+from app.services.trace_aggregator import TraceAggregator
 from app.config import settings
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # In-memory storage for demo (use Redis/DB in production)
 analysis_jobs = {}
 
+# Finished reports serialized once, by job id; kept apart so /status stays plain JSON
+report_payloads = {}
+
+# Served by /result and /jobs/{job_id}/events; /status stays small for polling
+STATUS_EXCLUDED = ("result", "events")
+
+def drop_old_jobs():
+    """Forget the oldest finished jobs, and their reports, beyond report_retention_jobs"""
+    finished = [job_id for job_id, job in analysis_jobs.items() if job["status"] in ("completed", "failed")]
+    for job_id in finished[:max(0, len(finished) - settings.report_retention_jobs)]:
+        del analysis_jobs[job_id]
+        report_payloads.pop(job_id, None)
+
+def report_response(payload: EncodedReport, accept_encoding: Optional[str], if_none_match: Optional[str]) -> Response:
+    """Send pre-serialized report bytes, compressed as the client accepts, or 304 if it has them already"""
+    # no-cache: clients may keep the report but must revalidate, which costs a 304
+    headers = {"ETag": payload.etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, payload.etag):
+        return Response(status_code=304, headers=headers)
+
+    coding, body = payload.encoded(accept_encoding)
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def require_profiling(admin_token: Optional[str]):
+    """Profiling is an admin feature: it must be enabled and, if configured, token-protected"""
+    if not settings.profiling_enabled:
+        raise HTTPException(status_code=403, detail="Profiling is disabled")
+    if settings.admin_token and admin_token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
 @router.post("/upload")
 async def upload_codebase(
     file: UploadFile = File(...),
+    mode: Literal["fast", "standard", "deep"] = Form("standard"),
+    deadline: Optional[float] = Form(None),
+    profile: bool = Form(False),
+    x_admin_token: Optional[str] = Header(None),
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
     """Upload a codebase ZIP file for analysis"""
@@ -24,6 +77,12 @@ async def upload_codebase(
     if not file.filename.endswith('.zip'):
         raise HTTPException(status_code=400, detail="Only ZIP files are supported")
 
+    if deadline is not None and deadline <= 0:
+        raise HTTPException(status_code=400, detail="Deadline must be a positive number of seconds")
+
+    if profile:
+        require_profiling(x_admin_token)
+
     # Create upload directory
     upload_dir = Path(settings.upload_dir)
     upload_dir.mkdir(exist_ok=True)
@@ -45,16 +104,28 @@ async def upload_codebase(
         "progress": 0,
         "message": "Upload complete, starting analysis...",
         "result": None,
-        "error": None
+        "error": None,
+        "events": []  # Failure modes and recommendations as they are extracted
     }
 
     # Start analysis in background
-    background_tasks.add_task(analyze_codebase, job_id, file_path, file.filename)
+    background_tasks.add_task(analyze_codebase, job_id, file_path, file.filename, mode, deadline, profile)
 
     return {"job_id": job_id, "message": "Upload successful, analysis started"}
 
-async def analyze_codebase(job_id: str, file_path: Path, filename: str):
+async def analyze_codebase(
+    job_id: str,
+    file_path: Path,
+    filename: str,
+    mode: str = "standard",
+    deadline: Optional[float] = None,
+    profile: bool = False
+):
     """Background task to analyze codebase"""
+    profile_store.register(job_id)
+    if profile:
+        profile_store.start(job_id)
+
     try:
         # Update status
         analysis_jobs[job_id]["status"] = "processing"
@@ -62,15 +133,31 @@ async def analyze_codebase(job_id: str, file_path: Path, filename: str):
         analysis_jobs[job_id]["message"] = "Extracting files..."
 
         # Initialize analyzer
-        analyzer = CodebaseAnalyzer(file_path, filename)
+        analyzer = CodebaseAnalyzer(file_path, filename, mode, deadline)
 
         # Progress callback
         def update_progress(progress: int, message: str):
             analysis_jobs[job_id]["progress"] = progress
             analysis_jobs[job_id]["message"] = message
 
-        # Run analysis
-        result = await analyzer.analyze(progress_callback=update_progress)
+        # Streamed findings; kept in order so /events readers can resume by index
+        def add_event(event: dict):
+            events = analysis_jobs[job_id]["events"]
+            if len(events) < settings.job_max_events:
+                events.append(event)
+
+        # Run analysis, recording a span tree for /jobs/{job_id}/trace
+        trace = trace_store.create(job_id)
+        with trace.activate(), trace.span("analysis", "stage", codebase=filename):
+            result = await analyzer.analyze(progress_callback=update_progress, event_callback=add_event)
+
+        # The pipeline passes records between stages; check the finished report once, here.
+        # A mismatch is our bug to fix, not a reason to withhold the user's report
+        try:
+            AnalysisReport.model_validate(result)
+        except ValidationError as e:
+            logger.warning("Report for job %s does not match AnalysisReport: %s", job_id, e)
+        report_payloads[job_id] = EncodedReport(result)
 
         # Update with results
         analysis_jobs[job_id]["status"] = "completed"
@@ -84,6 +171,9 @@ async def analyze_codebase(job_id: str, file_path: Path, filename: str):
         analysis_jobs[job_id]["message"] = f"Analysis failed: {str(e)}"
 
     finally:
+        profile_store.finish(job_id)
+        drop_old_jobs()
+
         # Cleanup uploaded file
         try:
             os.remove(file_path)
@@ -96,10 +186,15 @@ async def get_analysis_status(job_id: str):
     if job_id not in analysis_jobs:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    return analysis_jobs[job_id]
+    job = analysis_jobs[job_id]
+    return {key: value for key, value in job.items() if key not in STATUS_EXCLUDED}
 
 @router.get("/result/{job_id}")
-async def get_analysis_result(job_id: str):
+async def get_analysis_result(
+    job_id: str,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
     """Get the complete analysis result"""
     if job_id not in analysis_jobs:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -112,10 +207,167 @@ async def get_analysis_result(job_id: str):
             detail=f"Analysis not complete. Current status: {job['status']}"
         )
 
-    return job["result"]
+    return report_response(report_payloads[job_id], accept_encoding, if_none_match)
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Stream a job's failure modes and recommendations as Server-Sent Events while it runs"""
+    if job_id not in analysis_jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        job = analysis_jobs[job_id]
+        sent = 0
+        while True:
+            finished = job["status"] in ("completed", "failed")
+            for event in job["events"][sent:]:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            sent = len(job["events"])
+            if finished:
+                yield f"event: status\ndata: {json.dumps({'status': job['status'], 'error': job['error']})}\n\n"
+                return
+            await asyncio.sleep(settings.job_events_poll_interval)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.get("/jobs/{job_id}/trace")
+async def get_job_trace(job_id: str):
+    """Get a job's execution trace in Chrome trace format (open in Perfetto or chrome://tracing)"""
+    trace = trace_store.get(job_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (unknown job or past the retention budget)")
+
+    return trace.to_chrome_trace()
+
+@router.post("/jobs/{job_id}/profile")
+async def toggle_job_profile(
+    job_id: str,
+    enabled: bool = True,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Start or stop the sampling profiler for a running job"""
+    require_profiling(x_admin_token)
+    if job_id not in analysis_jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if enabled:
+        profiler = profile_store.start(job_id)
+        if profiler is None:
+            raise HTTPException(status_code=400, detail="Job is not running")
+    else:
+        profiler = profile_store.stop(job_id)
+        if profiler is None:
+            raise HTTPException(status_code=404, detail="Job has no profile")
+
+    return {"profiling": profiler.running, "samples": profiler.samples}
+
+@router.get("/jobs/{job_id}/profile")
+async def get_job_profile(
+    job_id: str,
+    format: Literal["collapsed", "speedscope"] = "speedscope",
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Download a job's CPU profile as collapsed stacks or speedscope JSON"""
+    require_profiling(x_admin_token)
+    profiler = profile_store.get(job_id)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Job has no profile")
+
+    if format == "collapsed":
+        return PlainTextResponse(
+            profiler.collapsed(),
+            headers={"Content-Disposition": f'attachment; filename="{job_id}.collapsed.txt"'}
+        )
+    return JSONResponse(
+        profiler.speedscope(f"analysis {job_id}"),
+        headers={"Content-Disposition": f'attachment; filename="{job_id}.speedscope.json"'}
+    )
 
 @router.get("/demo-report")
-async def get_demo_report():
+async def get_demo_report(
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
     """Get a pre-generated demo report for showcase"""
-    from app.services.demo import generate_demo_report
-    return generate_demo_report()
+    from app.services.demo import demo_report_payload
+    return report_response(demo_report_payload(), accept_encoding, if_none_match)
+
+@router.get("/rules")
+async def get_rules():
+    """List the loaded detection rule packs"""
+    rules = rule_registry.get()
+    return {
+        "packs": rules.packs,
+        "techniques": sorted(rules.techniques),
+        "rule_count": len(rules.rule_kinds),
+        "last_error": rule_registry.last_error
+    }
+
+@router.post("/rules/reload")
+async def reload_rules():
+    """Recompile detection rule packs from disk without a restart"""
+    rules = rule_registry.reload()
+    if rule_registry.last_error:
+        raise HTTPException(status_code=422, detail=f"Rule packs not reloaded: {rule_registry.last_error}")
+    return {"packs": rules.packs, "rule_count": len(rules.rule_kinds)}
+
+@router.get("/llm/providers")
+async def get_llm_providers():
+    """Health, time-to-first-chunk percentiles and hedging counts per LLM provider"""
+    return llm_router.status()
+
+@router.get("/metrics")
+async def get_metrics():
+    """Process-wide state of external dependencies: rate limiters, circuit breakers, caches, prefetch, request coalescing and LLM providers"""
+    return {
+        "research_sources": {name: source.to_dict() for name, source in research_sources.items()},
+        "search_cache": search_cache.to_dict(),
+        "insight_cache": insight_cache.to_dict(),
+        "prefetch": research_prefetcher.status(),
+        "paper_index": paper_index_store.status(),
+        "single_flight": {flight.name: flight.to_dict() for flight in (search_flight, extraction_flight)},
+        "llm": llm_router.status()
+    }
+
+@router.post("/traces")
+async def ingest_traces(
+    file: UploadFile = File(...),
+    job_id: Optional[str] = Form(None)
+):
+    """Aggregate a runtime trace file (JSONL or OTLP/JSON spans, optionally gzipped) per call site"""
+    job = None
+    if job_id is not None:
+        job = analysis_jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] != "completed":
+            raise HTTPException(status_code=400, detail=f"Analysis not complete. Current status: {job['status']}")
+
+    async def chunks():
+        # Read in fixed-size steps so multi-GB traces never sit in memory
+        while True:
+            chunk = await file.read(settings.trace_chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    aggregator = TraceAggregator()
+    try:
+        await aggregator.consume(chunks(), compressed=file.filename.endswith(".gz"))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read trace: {str(e)}")
+
+    call_sites = aggregator.summary(job["result"]["techniques"] if job else None)
+    if job:
+        job["result"]["runtime_call_sites"] = call_sites
+        # The report changed, so its bytes and ETag do too; unless the job was dropped while we read
+        if job_id in analysis_jobs:
+            report_payloads[job_id] = EncodedReport(job["result"])
+
+    return {
+        "lines": aggregator.lines,
+        "records": aggregator.records,
+        "skipped": aggregator.skipped,
+        "sites": len(call_sites),
+        "call_sites": call_sites
+    }
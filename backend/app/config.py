@@ -28,7 +28,110 @@ class Settings(BaseSettings):
     # Analysis Configuration
     max_papers_per_technique: int = 5
     paper_min_year: int = 2022
-    similarity_threshold: float = 0.7
+    similarity_threshold: float = 0.7  # Cosine similarity at which recommendations and failure modes are merged
+    near_duplicate_threshold: float = 0.6  # Estimated abstract similarity (Jaccard) at which papers are merged
+    max_locations_per_technique: int = 20  # Cap on stored path:line hits
+
+    heuristic_confidence_threshold: float = 0.6  # Papers scoring lower locally go to the LLM
+    insight_batch_size: int = 5  # Papers per LLM extraction request (1 = one request per paper)
+    insight_batch_token_budget: int = 6000  # Prompt tokens per extraction request
+
+    # Research Sources (limits are shared by all jobs in the process)
+    semantic_scholar_rate_with_key: float = 1.0  # Requests/second allowed with an API key
+    semantic_scholar_rate_public: float = 0.3  # Without a key requests come out of a pool shared by all users
+    arxiv_rate: float = 1 / 3  # arXiv API terms: one request every 3 seconds
+    research_burst: float = 1.0
+    research_max_retries: int = 3  # Retries on 429/5xx/timeouts, honouring Retry-After
+    research_backoff_base: float = 1.0  # Seconds; full-jitter exponential backoff
+    research_backoff_max: float = 30.0
+    research_breaker_failures: int = 5  # Consecutive failed requests before the source is skipped
+    research_breaker_reset: float = 60.0  # Seconds before a skipped source is probed again
+    research_cache_ttl: float = 6 * 3600  # Fresh search results are reused for this long
+    research_cache_max_entries: int = 1000
+    insight_cache_ttl: float = 24 * 3600  # LLM-extracted findings per paper are reused for this long
+    insight_cache_max_entries: int = 5000
+
+    # Local Paper Index (BM25 over an on-disk corpus, searched before live APIs)
+    paper_index_dir: str = "paper_index"  # Build with: python -m app.services.paper_index build <dumps>
+    paper_index_min_results: int = 3  # Fewer local hits than this per technique falls back to live search
+    paper_index_accumulate: bool = True  # Add papers from live search results to the index
+    paper_index_merge_min_new: int = 500  # New live-search papers held back until this many, then one rebuild
+    paper_index_merge_max_delay: float = 3600.0  # Seconds a held-back paper waits before a rebuild anyway
+    embedding_index_enabled: bool = True  # Also write embedding vectors for vector search
+    # Sentence embedding model for vector search, e.g. "all-MiniLM-L6-v2" (needs sentence-transformers);
+    # empty, or without the package, vectors are hashed TF-IDF: lexical, like BM25. Rebuild the index after changing it
+    embedding_model: str = ""
+    embedding_dim: int = 256  # Hashed TF-IDF vectors only; a model sets its own
+    embedding_ivf_min_papers: int = 200000  # Larger corpora are partitioned into IVF lists
+    embedding_ivf_probe: int = 16  # IVF lists scanned per query
+    embedding_vector_k: int = 10  # Papers taken per technique from vector search
+    # Cosine similarity below which vector hits are dropped; sentence models score unrelated text higher, try 0.3
+    embedding_min_similarity: float = 0.1
+
+    # Paper Ranking (weighted features scaled to 0-1; tune with python -m benchmarks.bench_paper_ranking)
+    max_papers_total: int = 15  # Papers kept across all techniques
+    ranking_weight_text_match: float = 0.6
+    ranking_weight_recency: float = 0.15
+    ranking_weight_citations: float = 0.15
+    ranking_weight_experimental: float = 0.1
+    ranking_recency_half_life: float = 3.0  # Years
+    ranking_citation_scale: float = 1000.0  # Citation count that scores as highly as any
+    ranking_term_cache_entries: int = 20000  # Papers whose term counts are kept; jobs keep meeting the same papers
+
+    # Research Prefetch (refreshes the known technique queries in the background)
+    prefetch_enabled: bool = True
+    prefetch_interval: float = 300.0  # Seconds between sweeps over the known queries
+    prefetch_refresh_after: float = 0.8  # Refresh entries older than this share of research_cache_ttl
+    prefetch_idle_poll: float = 1.0  # Seconds to wait while jobs are using a source's rate limit
+    prefetch_insights: bool = False  # Also extract insights for prefetched papers (spends LLM tokens unprompted)
+
+    # LLM Providers
+    llm_providers: str = "openai,anthropic,local"  # Order tried; only those with credentials are used
+    openai_extraction_model: str = "gpt-4o-mini"
+    anthropic_extraction_model: str = "claude-3-5-haiku-latest"
+    anthropic_max_tokens: int = 4096
+    llm_local_base_url: str = ""  # OpenAI-compatible endpoint, e.g. http://localhost:11434/v1
+    llm_local_model: str = "llama3.1"
+    llm_local_api_key: str = ""
+    llm_failure_threshold: int = 3  # Consecutive failures before a provider cools down
+    llm_failure_cooldown: float = 30.0  # Seconds an unhealthy provider is skipped
+    llm_hedging_enabled: bool = False  # Start a second provider when the first is slower than its p95
+    llm_hedge_min_samples: int = 20  # Latencies needed before the p95 is trusted
+    llm_hedge_max_fraction: float = 0.1  # Cap on hedged requests as a share of all requests
+    llm_latency_window: int = 200  # Recent time-to-first-chunk samples kept per provider
+
+    cost_default_output_tokens: int = 256  # Assumed completion size when max_tokens isn't set
+
+    # Detection Rules
+    rules_dir: str = ""  # Defaults to the packs bundled in app/rules
+    rules_reload_interval: float = 5.0  # Seconds between rule pack change checks
+
+    # Runtime Traces
+    trace_max_sites: int = 10000  # Further call sites are pooled under "<other>"
+    trace_sketch_accuracy: float = 0.01  # Relative error of latency/token percentiles
+    trace_chunk_size: int = 1024 * 1024  # Bytes read per step while ingesting
+    trace_max_line_bytes: int = 1024 * 1024  # Longer lines are skipped
+
+    # Job Traces
+    job_trace_max_spans: int = 5000  # Per job; later spans are counted, not kept
+    job_trace_retention_jobs: int = 50  # Traces kept for the most recent jobs
+
+    # Job Events
+    job_max_events: int = 200  # Streamed findings kept per job
+    job_events_poll_interval: float = 0.25  # Seconds between checks for new events
+
+    # Report Delivery
+    report_compression_min_bytes: int = 1024  # Smaller reports are sent uncompressed
+    report_gzip_level: int = 6  # Each report is compressed once per coding, on first request
+    report_brotli_quality: int = 5  # Used when the brotli package is installed
+    report_retention_jobs: int = 200  # Finished jobs (with their reports) kept; the oldest are dropped first
+
+    # Profiling (admin only, off by default)
+    profiling_enabled: bool = False
+    admin_token: str = ""  # When set, profiling requests need a matching X-Admin-Token header
+    profiling_interval_ms: float = 5.0  # Sampling interval; lower means more overhead
+    profiling_max_stacks: int = 20000  # Distinct stacks kept per profile
+    profiling_retention_jobs: int = 20
 
     class Config:
         env_file = ".env"
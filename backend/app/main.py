@@ -1,12 +1,26 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.api.routes import router
+from app.services.prefetch import research_prefetcher
+from app.services.rule_engine import rule_registry
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Compile detection rule packs once at startup
+    rule_registry.reload()
+    # Warm research results for the known technique queries in the background
+    if settings.prefetch_enabled:
+        research_prefetcher.start()
+    yield
+    await research_prefetcher.stop()
 
 app = FastAPI(
     title="GenAI Profiler API",
     description="Research-aware profiling system for GenAI architectures",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration
@@ -0,0 +1,110 @@
+import re
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+# Pipeline stages hand each other these compact records instead of loose
+# dicts: fields live in a tuple rather than a per-instance dict, and fields
+# drawn from a handful of values (confidence, severity, technique, source)
+# are interned, so every record shares one copy of each string. They are
+# turned into plain dicts once, when the report is built, and Pydantic
+# validates that report once at the API boundary (schemas.AnalysisReport).
+
+intern = sys.intern
+
+SEVERITIES = ("Critical", "High", "Medium", "Low")
+LEVELS = ("High", "Medium", "Low")  # Impact, effort and confidence
+
+
+def normalize_level(value, allowed=LEVELS, default: str = "Medium") -> str:
+    """Map a free-form LLM value ("high", "critical", "High/Medium", null) onto one of `allowed`
+
+    The first word that names an allowed value wins; anything else becomes `default`.
+    """
+    if isinstance(value, str):
+        for word in re.findall(r"[a-z]+", value.lower()):
+            for level in allowed:
+                if word == level.lower():
+                    return level
+    return default
+
+
+class TechniqueRecord(NamedTuple):
+    name: str  # Display name, e.g. "Retrieval-Augmented Generation"
+    type: str  # Rule-pack technique id, e.g. "RAG"
+    confidence: str
+    indicators: List[str]
+    locations: List[str]
+    description: str
+    findings: List[Dict[str, str]]  # Anti-pattern hits: kind, location, call, message
+
+    @classmethod
+    def from_dict(cls, technique: Dict) -> "TechniqueRecord":
+        return cls(
+            name=intern(technique["name"]),
+            type=intern(technique["type"]),
+            confidence=intern(technique["confidence"]),
+            indicators=technique.get("indicators", []),
+            locations=technique.get("locations", []),
+            description=technique.get("description", ""),
+            findings=technique.get("findings", []),
+        )
+
+
+class PaperRecord(NamedTuple):
+    title: str
+    abstract: str
+    year: int
+    authors: List[str]
+    citation_count: int
+    url: str
+    is_experimental: bool
+    relevance_score: float
+    technique: str  # Display name of the technique it was found for
+    source: str  # Where the leading copy came from: semantic_scholar, arxiv or a dump name
+    urls: List[str]  # Every copy's URL, for papers found through several sources
+    sources: List[str]
+
+    @classmethod
+    def from_dict(cls, paper: Dict) -> "PaperRecord":
+        """From the dicts search results and the paper index produce"""
+        url = paper.get("url") or ""
+        source = paper.get("source") or ""
+        return cls(
+            title=paper["title"],
+            abstract=paper.get("abstract") or "",
+            year=paper.get("year") or 0,
+            authors=paper.get("authors") or [],
+            citation_count=paper.get("citation_count") or 0,
+            url=url,
+            is_experimental=bool(paper.get("is_experimental")),
+            relevance_score=paper.get("relevance_score") or 0.0,
+            technique=intern(paper.get("technique") or ""),
+            source=intern(source),
+            urls=paper.get("urls") or ([url] if url else []),
+            sources=[intern(name) for name in paper.get("sources") or ([source] if source else [])],
+        )
+
+
+class FailureModeRecord(NamedTuple):
+    description: str
+    conditions: str
+    severity: str
+    mitigation: str
+    source_paper: str
+    supporting_papers: List[str] = []  # Other papers describing the same failure; never mutated
+
+
+class RecommendationRecord(NamedTuple):
+    type: str  # Critical, Important or Nice-to-have
+    title: str
+    description: str
+    action_steps: List[str]
+    code_example: Optional[str]
+    evidence: Dict[str, str]  # paper, finding, year
+    impact: str
+    effort: str
+    confidence: str
+    caveats: List[str]
+    code_locations: List[str]
+    priority: int
+    supporting_evidence: List[Dict[str, str]] = []  # Same shape as evidence, from other papers; never mutated
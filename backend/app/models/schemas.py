@@ -8,6 +8,8 @@ class TechniqueDetection(BaseModel):
     indicators: List[str]
     locations: List[str]  # File paths and line numbers
     description: str
+    type: str = ""  # Rule-pack technique id
+    findings: List[Dict[str, str]] = []  # Anti-pattern hits: kind, location, call, message
 
 class Paper(BaseModel):
     title: str
@@ -18,6 +20,10 @@ class Paper(BaseModel):
     url: str
     is_experimental: bool
     relevance_score: float
+    technique: str = ""
+    source: str = ""
+    urls: List[str] = []  # Every source's URL for papers found more than once
+    sources: List[str] = []
 
 class FailureMode(BaseModel):
     description: str
@@ -25,6 +31,7 @@ class FailureMode(BaseModel):
     severity: Literal["Critical", "High", "Medium", "Low"]
     mitigation: str
     source_paper: str
+    supporting_papers: List[str] = []  # Other papers describing the same failure
 
 class Recommendation(BaseModel):
     type: Literal["Critical", "Important", "Nice-to-have"]
@@ -33,6 +40,7 @@ class Recommendation(BaseModel):
     action_steps: List[str]
     code_example: Optional[str] = None
     evidence: Dict[str, str]  # paper, finding, year
+    supporting_evidence: List[Dict[str, str]] = []  # Same shape, from other papers agreeing
     impact: Literal["High", "Medium", "Low"]
     effort: Literal["High", "Medium", "Low"]
     confidence: Literal["High", "Medium", "Low"]
@@ -40,6 +48,41 @@ class Recommendation(BaseModel):
     code_locations: List[str]
     priority: int
 
+class RuleStat(BaseModel):
+    rule_id: str
+    technique: str
+    kind: str
+    matches: int
+    cpu_ms: float
+
+class LLMCallSite(BaseModel):
+    location: str
+    call: str
+    provider: str
+    operation: Literal["chat", "completion", "embedding"]
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+    stream: Optional[bool] = None
+    prompt_tokens: int  # Estimated tokens per request
+    output_tokens: int
+    prompt_resolution: Literal["full", "partial", "none"]
+    estimated_cost_usd: float  # Per request
+    relative_cost: float  # 1.0 = most expensive call site
+
+class RuntimeCallSite(BaseModel):
+    site: str  # path:line from the runtime trace
+    provider: str
+    operation: str
+    model: Optional[str] = None
+    calls: int  # Estimated, scaled up by sample rate
+    sampled_calls: int
+    error_rate: float
+    retries_per_call: float
+    latency_ms: Dict[str, Optional[float]]  # p50, p95, p99
+    prompt_tokens: Dict[str, Optional[float]]
+    completion_tokens: Dict[str, Optional[float]]
+    techniques: List[str] = []  # Detected techniques at this location
+
 class AnalysisReport(BaseModel):
     timestamp: datetime
     codebase_name: str
@@ -56,10 +99,16 @@ class AnalysisReport(BaseModel):
     failure_modes: List[FailureMode]
     recommendations: List[Recommendation]
     papers: List[Paper]
+    llm_call_sites: List[LLMCallSite] = []  # Most expensive first
+    runtime_call_sites: List[RuntimeCallSite] = []  # From ingested traces, slowest p95 first
 
     # Metadata
+    analysis_mode: Literal["fast", "standard", "deep"] = "standard"
+    time_to_first_recommendation: Optional[float] = None  # Seconds until the first streamed recommendation
     confidence_notes: List[str]
     limitations: List[str]
+    rule_packs: List[str] = []
+    rule_stats: List[RuleStat] = []  # Per-rule match counts and CPU time
 
 class AnalysisRequest(BaseModel):
     codebase_name: str
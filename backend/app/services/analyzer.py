@@ -3,59 +3,104 @@ import zipfile
 import shutil
 from pathlib import Path
 from datetime import datetime
-from typing import Callable, Optional
-from app.models.schemas import AnalysisReport, TechniqueDetection, Recommendation, Paper, FailureMode
+from typing import Callable, List, Optional
+from app.models.records import FailureModeRecord, PaperRecord, RecommendationRecord, TechniqueRecord
 from app.services.code_parser import CodeParser
+from app.services.budget import AnalysisBudget
+from app.services.cost_profiler import LLMCostProfiler
+from app.services.job_trace import span
+from app.services.symbol_index import SymbolIndex
 from app.services.technique_detector import TechniqueDetector
 from app.services.research_retriever import ResearchRetriever
 from app.services.insight_extractor import InsightExtractor
 from app.services.recommendation_generator import RecommendationGenerator
 
 class CodebaseAnalyzer:
-    def __init__(self, zip_path: Path, codebase_name: str):
+    def __init__(self, zip_path: Path, codebase_name: str, mode: str = "standard", deadline: Optional[float] = None):
         self.zip_path = zip_path
         self.codebase_name = codebase_name.replace('.zip', '')
         self.extract_dir = None
+        self.budget = AnalysisBudget(mode, deadline)
+        # Seconds from start until the first recommendation was streamed out
+        self.time_to_first_recommendation: Optional[float] = None
 
-    async def analyze(self, progress_callback: Optional[Callable] = None) -> dict:
-        """Main analysis pipeline"""
+    async def analyze(self, progress_callback: Optional[Callable] = None, event_callback: Optional[Callable] = None) -> dict:
+        """Main analysis pipeline
+
+        `event_callback` receives failure modes and recommendations as soon as
+        each is extracted, ahead of the final ranked report.
+        """
         start_time = datetime.now()
 
         try:
             # Step 1: Extract files (10-20%)
             if progress_callback:
                 progress_callback(10, "Extracting files...")
-            self.extract_dir = await self._extract_zip()
+            with span("extract", "cpu"):
+                self.extract_dir = await self._extract_zip()
 
             # Step 2: Parse codebase (20-30%)
             if progress_callback:
                 progress_callback(20, "Parsing codebase...")
-            parser = CodeParser(self.extract_dir)
-            parsed_data = await parser.parse()
+            with span("parse", "cpu") as args:
+                parser = CodeParser(self.extract_dir)
+                parsed_data = await parser.parse()
+                args["files"] = len(parsed_data.get("code_patterns", {}))
+
+            # Index symbols and call sites once for all detectors
+            with span("symbol_index", "cpu"):
+                symbol_index = SymbolIndex.build(parsed_data)
 
             # Step 3: Detect techniques (30-40%)
             if progress_callback:
                 progress_callback(30, "Detecting GenAI techniques...")
-            detector = TechniqueDetector(parsed_data)
-            techniques = await detector.detect()
+            with span("detect_techniques", "cpu") as args:
+                detector = TechniqueDetector(parsed_data, symbol_index=symbol_index)
+                techniques = await detector.detect()
+                args["techniques"] = len(techniques)
+
+            # Estimate tokens and cost for each LLM call site
+            if progress_callback:
+                progress_callback(35, "Profiling LLM call sites...")
+            with span("profile_llm_calls", "cpu"):
+                llm_call_sites = await LLMCostProfiler(parsed_data, symbol_index).profile()
 
             # Step 4: Retrieve research papers (40-60%)
             if progress_callback:
                 progress_callback(40, "Retrieving research papers...")
-            retriever = ResearchRetriever()
-            papers = await retriever.retrieve_for_techniques(techniques)
+            with span("retrieve_papers", "stage") as args:
+                retriever = ResearchRetriever(self.budget)
+                papers = await retriever.retrieve_for_techniques(techniques)
+                args["papers"] = len(papers)
 
             # Step 5: Extract insights (60-75%)
             if progress_callback:
                 progress_callback(60, "Extracting insights from papers...")
-            extractor = InsightExtractor()
-            insights = await extractor.extract_from_papers(papers)
+            generator = RecommendationGenerator(techniques, parsed_data, [], symbol_index)
+
+            def on_item(insight: dict, section: str, item: dict):
+                failure_mode, recommendation = generator.preview(insight, section, item)
+                if recommendation and self.time_to_first_recommendation is None:
+                    self.time_to_first_recommendation = round((datetime.now() - start_time).total_seconds(), 3)
+                if event_callback:
+                    if failure_mode:
+                        event_callback({"type": "failure_mode", "paper": insight["paper_title"], "failure_mode": failure_mode._asdict()})
+                    if recommendation:
+                        event_callback({"type": "recommendation", "paper": insight["paper_title"], "recommendation": recommendation._asdict()})
+
+            with span("extract_insights", "stage") as args:
+                extractor = InsightExtractor(self.budget, on_item=on_item)
+                insights = await extractor.extract_from_papers(papers)
+                args["insights"] = len(insights)
+                args["time_to_first_recommendation"] = self.time_to_first_recommendation
+                args.update(extractor.stats)
 
             # Step 6: Generate recommendations (75-90%)
             if progress_callback:
                 progress_callback(75, "Generating recommendations...")
-            generator = RecommendationGenerator(techniques, parsed_data, insights)
-            recommendations, failure_modes = await generator.generate()
+            with span("generate_recommendations", "cpu"):
+                generator.insights = insights
+                recommendations, failure_modes = await generator.generate()
 
             # Step 7: Build report (90-100%)
             if progress_callback:
@@ -66,9 +111,12 @@ class CodebaseAnalyzer:
             report = self._build_report(
                 techniques=techniques,
                 papers=papers,
+                llm_call_sites=llm_call_sites,
                 recommendations=recommendations,
                 failure_modes=failure_modes,
-                duration=duration
+                duration=duration,
+                rule_packs=detector.rules.packs,
+                rule_stats=detector.get_rule_stats()
             )
 
             if progress_callback:
@@ -93,16 +141,23 @@ class CodebaseAnalyzer:
 
     def _build_report(
         self,
-        techniques: list,
-        papers: list,
-        recommendations: list,
-        failure_modes: list,
-        duration: float
+        techniques: List[TechniqueRecord],
+        papers: List[PaperRecord],
+        llm_call_sites: list,
+        recommendations: List[RecommendationRecord],
+        failure_modes: List[FailureModeRecord],
+        duration: float,
+        rule_packs: list,
+        rule_stats: list
     ) -> dict:
-        """Build final analysis report"""
+        """Build final analysis report
+
+        Records become plain dicts here, once; the API validates the result
+        against AnalysisReport when the job completes.
+        """
 
         # Calculate risk level
-        critical_count = sum(1 for r in recommendations if r["type"] == "Critical")
+        critical_count = sum(1 for r in recommendations if r.type == "Critical")
         if critical_count >= 3:
             risk = "High"
         elif critical_count >= 1:
@@ -118,26 +173,31 @@ class CodebaseAnalyzer:
             "critical_issues": critical_count,
             "techniques_detected": len(techniques),
             "papers_analyzed": len(papers),
-            "techniques": techniques,
-            "failure_modes": failure_modes,
-            "recommendations": sorted(recommendations, key=lambda x: x["priority"]),
-            "papers": papers,
+            "techniques": [t._asdict() for t in techniques],
+            "failure_modes": [fm._asdict() for fm in failure_modes],
+            "recommendations": [r._asdict() for r in sorted(recommendations, key=lambda x: x.priority)],
+            "papers": [p._asdict() for p in papers],
+            "llm_call_sites": llm_call_sites,
+            "analysis_mode": self.budget.mode,
+            "time_to_first_recommendation": self.time_to_first_recommendation,
             "confidence_notes": self._generate_confidence_notes(techniques),
             "limitations": [
                 "Analysis based on static code patterns (may miss runtime behavior)",
                 "Research findings may not apply to your specific use case",
                 "Recommendations are suggestions, not requirements",
                 "Manual verification recommended for critical changes"
-            ]
+            ],
+            "rule_packs": rule_packs,
+            "rule_stats": rule_stats
         }
 
-    def _generate_confidence_notes(self, techniques: list) -> list:
+    def _generate_confidence_notes(self, techniques: List[TechniqueRecord]) -> list:
         """Generate notes about confidence levels"""
         notes = []
 
-        high_conf = sum(1 for t in techniques if t["confidence"] == "High")
-        medium_conf = sum(1 for t in techniques if t["confidence"] == "Medium")
-        low_conf = sum(1 for t in techniques if t["confidence"] == "Low")
+        high_conf = sum(1 for t in techniques if t.confidence == "High")
+        medium_conf = sum(1 for t in techniques if t.confidence == "Medium")
+        low_conf = sum(1 for t in techniques if t.confidence == "Low")
 
         if high_conf > 0:
             notes.append(f"{high_conf} technique(s) detected with high confidence")
@@ -146,4 +206,7 @@ class CodebaseAnalyzer:
         if low_conf > 0:
             notes.append(f"{low_conf} technique(s) detected with low confidence - may be false positives")
 
+        # Stages cut short by the latency budget
+        notes.extend(self.budget.degradations)
+
         return notes
@@ -0,0 +1,68 @@
+import time
+from typing import List, Optional
+
+# Analysis profiles: default deadline (seconds, None = unbounded), Semantic
+# Scholar queries per technique, arXiv fallback, and papers sent to the LLM
+ANALYSIS_MODES = {
+    "fast": {"deadline": 5.0, "queries_per_technique": 1, "arxiv_fallback": False, "llm_papers": 0},
+    "standard": {"deadline": 120.0, "queries_per_technique": 2, "arxiv_fallback": True, "llm_papers": 10},
+    "deep": {"deadline": None, "queries_per_technique": 3, "arxiv_fallback": True, "llm_papers": 15},
+}
+
+# Below this share of the deadline left, stages cut their fan-out
+LOW_BUDGET_FRACTION = 0.25
+
+
+class AnalysisBudget:
+    """Latency budget for one analysis: mode limits, a deadline and a record of what was cut"""
+
+    def __init__(self, mode: str = "standard", deadline: Optional[float] = None):
+        if mode not in ANALYSIS_MODES:
+            raise ValueError(f"Unknown analysis mode: {mode}")
+        self.mode = mode
+        self.limits = ANALYSIS_MODES[mode]
+        self.deadline = deadline if deadline is not None else self.limits["deadline"]
+        self.started = time.monotonic()
+        self.degradations: List[str] = []
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None if there is no deadline"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - (time.monotonic() - self.started))
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def low(self) -> bool:
+        """True once less than LOW_BUDGET_FRACTION of the deadline is left"""
+        remaining = self.remaining()
+        return remaining is not None and remaining < self.deadline * LOW_BUDGET_FRACTION
+
+    def timeout(self, default: float) -> float:
+        """Cap a per-call timeout to the time left (never below 0.1s)"""
+        remaining = self.remaining()
+        return default if remaining is None else max(0.1, min(default, remaining))
+
+    def queries_per_technique(self) -> int:
+        """Research queries to run per technique, halved to one when time runs low"""
+        limit = self.limits["queries_per_technique"]
+        if limit > 1 and self.low():
+            self.degrade("Reduced research queries to 1 per technique (latency budget running low)")
+            return 1
+        return limit
+
+    def arxiv_fallback(self) -> bool:
+        if not self.limits["arxiv_fallback"]:
+            self.degrade(f"Skipped arXiv fallback ({self.mode} mode)")
+            return False
+        if self.low():
+            self.degrade("Skipped arXiv fallback (latency budget running low)")
+            return False
+        return True
+
+    def degrade(self, note: str):
+        """Record a degraded stage once for the report's confidence notes"""
+        if note not in self.degradations:
+            self.degradations.append(note)
@@ -2,6 +2,8 @@ import ast
 from pathlib import Path
 from typing import Dict, List, Set
 import re
+from app.config import settings
+from app.services.line_index import LineIndex, format_location
 
 class CodeParser:
     """Parse Python codebase to extract structure and patterns"""
@@ -10,6 +12,7 @@ class CodeParser:
         self.codebase_dir = Path(codebase_dir)
         self.python_files = []
         self.imports = set()
+        self.import_locations = {}
         self.dependencies = {}
         self.code_patterns = {}
 
@@ -28,6 +31,7 @@ class CodeParser:
         return {
             "files": [str(f.relative_to(self.codebase_dir)) for f in self.python_files],
             "imports": list(self.imports),
+            "import_locations": self.import_locations,
             "dependencies": self.dependencies,
             "code_patterns": self.code_patterns
         }
@@ -40,27 +44,55 @@ class CodeParser:
 
             # Parse AST
             tree = ast.parse(content)
+            rel_path = str(file_path.relative_to(self.codebase_dir))
 
             # Extract imports
             for node in ast.walk(tree):
                 if isinstance(node, ast.Import):
                     for alias in node.names:
-                        self.imports.add(alias.name.split('.')[0])
+                        self._add_import(alias.name.split('.')[0], rel_path, node.lineno)
                 elif isinstance(node, ast.ImportFrom):
                     if node.module:
-                        self.imports.add(node.module.split('.')[0])
+                        self._add_import(node.module.split('.')[0], rel_path, node.lineno)
 
-            # Store code content for pattern matching
-            rel_path = str(file_path.relative_to(self.codebase_dir))
+            # Extract definitions, import aliases and call sites for the symbol index
+            visitor = _SymbolVisitor(self._module_name(rel_path), rel_path.endswith("__init__.py"))
+            visitor.visit(tree)
+
+            # Store code content and its line index for pattern matching
+            line_index = LineIndex(content)
             self.code_patterns[rel_path] = {
                 "content": content,
-                "lines": len(content.split('\n'))
+                "lines": len(line_index),
+                "line_index": line_index,
+                "module": visitor.module,
+                "definitions": visitor.definitions,
+                "aliases": visitor.aliases,
+                "calls": visitor.calls,
+                "llm_calls": visitor.llm_calls,
+                "client_constructions": visitor.client_constructions,
+                "constructors": visitor.constructors,
+                "strings": visitor.strings
             }
 
         except Exception as e:
             # Skip files that can't be parsed
             pass
 
+    def _module_name(self, rel_path: str) -> str:
+        """Get the dotted module name for a file path relative to the codebase root"""
+        parts = list(Path(rel_path).with_suffix("").parts)
+        if parts and parts[-1] == "__init__":
+            parts.pop()
+        return ".".join(parts)
+
+    def _add_import(self, module: str, rel_path: str, line: int):
+        """Record an imported top-level module and where it was imported"""
+        self.imports.add(module)
+        locations = self.import_locations.setdefault(module, [])
+        if len(locations) < settings.max_locations_per_technique:
+            locations.append(format_location(rel_path, line))
+
     async def _parse_dependencies(self):
         """Parse requirements.txt, pyproject.toml, etc."""
         # Check requirements.txt
@@ -90,3 +122,214 @@ class CodeParser:
         for imp in self.imports:
             if imp not in self.dependencies:
                 self.dependencies[imp] = "import"
+
+
+# Methods whose arguments are captured for LLM call-site profiling
+ARGUMENT_CAPTURE_METHODS = {
+    "create", "parse", "stream", "chat", "generate", "embed",
+    "invoke", "ainvoke", "predict", "apredict", "batch", "abatch", "astream",
+    "embed_documents", "embed_query", "aembed_documents", "aembed_query",
+}
+
+# SDK client classes whose construction sites are recorded for anti-pattern checks
+CLIENT_CLASSES = {
+    "OpenAI", "AsyncOpenAI", "AzureOpenAI", "AsyncAzureOpenAI",
+    "Anthropic", "AsyncAnthropic", "Client", "AsyncClient", "ClientV2", "AsyncClientV2",
+    "ChatOpenAI", "AzureChatOpenAI", "ChatAnthropic", "ChatCohere", "OpenAIEmbeddings", "CohereEmbeddings",
+}
+
+# Decorator suffixes marking web request handlers (FastAPI, Flask, Starlette)
+HANDLER_DECORATORS = ("get", "post", "put", "patch", "delete", "websocket", "route", "api_route")
+
+
+class _SymbolVisitor(ast.NodeVisitor):
+    """Collect definitions, import aliases and scoped call sites from one module"""
+
+    def __init__(self, module: str, is_package: bool):
+        self.module = module
+        self.package = module if is_package else module.rpartition('.')[0]
+        self.scope: List[str] = []
+        self.definitions = []  # (qualified name, kind, line)
+        self.aliases = {}  # local name -> qualified name
+        self.calls = []  # (dotted call name, line, enclosing scope)
+        self.llm_calls = []  # Candidate LLM calls with their argument facts
+        self.client_constructions = []  # (client class call name, line, scope, inside a function)
+        self.constructors = {}  # assigned name -> (constructor call name, line, keyword facts)
+        self.strings = {}  # (scope, name) -> string or message-list fact
+        # Execution context per enclosing function: async, request handler, loop depth
+        self.context = [{"function": False, "async": False, "handler": False, "loops": 0}]
+        self.awaited = set()
+
+    def _qualify(self, name: str) -> str:
+        return ".".join(filter(None, [self.module] + self.scope + [name]))
+
+    def _visit_definition(self, node, kind: str):
+        self.definitions.append((self._qualify(node.name), kind, node.lineno))
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+
+    def _visit_function(self, node, is_async: bool):
+        handler = any(
+            call_name(d.func if isinstance(d, ast.Call) else d).rpartition('.')[2] in HANDLER_DECORATORS
+            for d in node.decorator_list
+        )
+        self.context.append({"function": True, "async": is_async, "handler": handler, "loops": 0})
+        self._visit_definition(node, "function")
+        self.context.pop()
+
+    def visit_FunctionDef(self, node: ast.FunctionDef):
+        self._visit_function(node, False)
+
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef):
+        self._visit_function(node, True)
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        # Class bodies run once at import, like module level
+        self.context.append({"function": False, "async": False, "handler": False, "loops": 0})
+        self._visit_definition(node, "class")
+        self.context.pop()
+
+    def _visit_loop(self, node, header_fields: tuple):
+        for field in header_fields:
+            value = getattr(node, field, None)
+            if value is not None:
+                self.visit(value)
+        self.context[-1]["loops"] += 1
+        for stmt in node.body + node.orelse:
+            self.visit(stmt)
+        self.context[-1]["loops"] -= 1
+
+    def visit_For(self, node: ast.For):
+        self._visit_loop(node, ("target", "iter"))
+
+    def visit_AsyncFor(self, node: ast.AsyncFor):
+        self._visit_loop(node, ("target", "iter"))
+
+    def visit_While(self, node: ast.While):
+        self._visit_loop(node, ("test",))
+
+    def _visit_comprehension(self, node):
+        self.context[-1]["loops"] += 1
+        self.generic_visit(node)
+        self.context[-1]["loops"] -= 1
+
+    visit_ListComp = visit_SetComp = visit_DictComp = visit_GeneratorExp = _visit_comprehension
+
+    def visit_Await(self, node: ast.Await):
+        if isinstance(node.value, ast.Call):
+            self.awaited.add(id(node.value))
+        self.generic_visit(node)
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            if alias.asname:
+                self.aliases[alias.asname] = alias.name
+            else:
+                top = alias.name.split('.')[0]
+                self.aliases[top] = top
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        base = node.module or ""
+        if node.level:
+            # Resolve relative imports against this module's package
+            package = self.package.split('.') if self.package else []
+            if node.level > 1:
+                package = package[:len(package) - (node.level - 1)]
+            base = ".".join(filter(None, package + [base]))
+        for alias in node.names:
+            if alias.name != "*":
+                self.aliases[alias.asname or alias.name] = f"{base}.{alias.name}" if base else alias.name
+
+    def visit_Assign(self, node: ast.Assign):
+        if len(node.targets) == 1:
+            target = call_name(node.targets[0])
+            value = node.value
+            if target and isinstance(value, ast.Call):
+                ctor = call_name(value.func)
+                # Only class instantiations (e.g. client = OpenAI(...)) matter here
+                if ctor and ctor.rpartition('.')[2][:1].isupper() and target not in self.constructors:
+                    self.constructors[target] = (ctor, node.lineno, _keyword_facts(value))
+            elif target:
+                fact = value_fact(value)
+                if fact[0] in ("str", "seq"):
+                    self.strings[(self._qualify(""), target)] = fact
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):
+        name = call_name(node.func)
+        if name:
+            scope = self._qualify("")
+            self.calls.append((name, node.lineno, scope))
+            context = self.context[-1]
+            method = name.rpartition('.')[2]
+            if method in ARGUMENT_CAPTURE_METHODS:
+                self.llm_calls.append({
+                    "name": name,
+                    "line": node.lineno,
+                    "scope": scope,
+                    "args": [value_fact(arg) for arg in node.args[:2]],
+                    "kwargs": _keyword_facts(node),
+                    "awaited": id(node) in self.awaited,
+                    "in_loop": context["loops"] > 0,
+                    "in_async": context["async"],
+                    "in_handler": context["handler"]
+                })
+            if method in CLIENT_CLASSES:
+                self.client_constructions.append((name, node.lineno, scope, context["function"]))
+        self.generic_visit(node)
+
+
+def value_fact(node: ast.AST) -> tuple:
+    """Summarize an argument expression for static prompt resolution
+
+    Facts are ("str", text, complete) for literals and templates (with "{}"
+    placeholders), ("const", value), ("name", identifier), ("format", fact)
+    for name.format(...), ("seq", [facts]) for lists and message dicts, or
+    ("unknown",).
+    """
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, str):
+            return ("str", node.value, True)
+        return ("const", node.value)
+    if isinstance(node, ast.JoinedStr):
+        parts = [v.value if isinstance(v, ast.Constant) else "{}" for v in node.values]
+        return ("str", "".join(parts), all(isinstance(v, ast.Constant) for v in node.values))
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, right = value_fact(node.left), value_fact(node.right)
+        if "str" in (left[0], right[0]):
+            text = "".join(f[1] if f[0] == "str" else "{}" for f in (left, right))
+            return ("str", text, left[0] == right[0] == "str" and left[2] and right[2])
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "format":
+        base = value_fact(node.func.value)
+        if base[0] == "str":
+            return ("str", base[1], False)
+        if base[0] == "name":
+            return ("format", base)
+    if isinstance(node, ast.Name):
+        return ("name", node.id)
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return ("seq", [value_fact(elt) for elt in node.elts])
+    if isinstance(node, ast.Dict):
+        for key, value in zip(node.keys, node.values):
+            if isinstance(key, ast.Constant) and key.value == "content":
+                return ("seq", [value_fact(value)])
+        return ("seq", [value_fact(value) for value in node.values])
+    return ("unknown",)
+
+
+def _keyword_facts(node: ast.Call) -> Dict[str, tuple]:
+    return {kw.arg: value_fact(kw.value) for kw in node.keywords if kw.arg}
+
+
+def call_name(func: ast.AST) -> str:
+    """Get the dotted name of a called expression (e.g. client.chat.completions.create)"""
+    if isinstance(func, ast.Name):
+        return func.id
+    if isinstance(func, ast.Attribute):
+        base = call_name(func.value)
+        return f"{base}.{func.attr}" if base else func.attr
+    if isinstance(func, ast.Call):
+        base = call_name(func.func)
+        return f"{base}()" if base else ""
+    return ""
@@ -0,0 +1,293 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.line_index import format_location
+from app.services.symbol_index import SymbolIndex
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character-based estimate
+    tiktoken = None
+
+# Call-name suffix -> (provider, operation) for direct SDK calls
+SDK_OPERATIONS = {
+    "chat.completions.create": ("openai", "chat"),
+    "chat.completions.parse": ("openai", "chat"),
+    "responses.create": ("openai", "chat"),
+    "completions.create": ("openai", "completion"),
+    "embeddings.create": ("openai", "embedding"),
+    "messages.create": ("anthropic", "chat"),
+    "messages.stream": ("anthropic", "chat"),
+    "chat": ("cohere", "chat"),
+    "generate": ("cohere", "completion"),
+    "embed": ("cohere", "embedding"),
+}
+
+# LangChain model classes -> (provider, operation); calls go through invoke() and friends
+LANGCHAIN_MODELS = {
+    "ChatOpenAI": ("openai", "chat"),
+    "AzureChatOpenAI": ("openai", "chat"),
+    "OpenAI": ("openai", "completion"),
+    "ChatAnthropic": ("anthropic", "chat"),
+    "ChatCohere": ("cohere", "chat"),
+    "OpenAIEmbeddings": ("openai", "embedding"),
+    "CohereEmbeddings": ("cohere", "embedding"),
+}
+LANGCHAIN_METHODS = {
+    "invoke": "chat", "ainvoke": "chat", "predict": "chat", "apredict": "chat",
+    "stream": "chat", "astream": "chat", "batch": "chat", "abatch": "chat",
+    "embed_documents": "embedding", "embed_query": "embedding",
+    "aembed_documents": "embedding", "aembed_query": "embedding",
+}
+
+# Approximate list prices in USD per 1M tokens (input, output), matched by model prefix
+MODEL_PRICING = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o1-mini": (3.00, 12.00),
+    "o1": (15.00, 60.00),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "text-embedding-ada-002": (0.10, 0.0),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-opus": (15.00, 75.00),
+    "claude-3-haiku": (0.25, 1.25),
+    "command-r-plus": (2.50, 10.00),
+    "command-r": (0.15, 0.60),
+    "embed-english": (0.10, 0.0),
+}
+
+# Assumed model when a call site doesn't name one literally
+DEFAULT_MODELS = {
+    ("openai", "chat"): "gpt-4o",
+    ("openai", "completion"): "gpt-3.5-turbo",
+    ("openai", "embedding"): "text-embedding-3-small",
+    ("anthropic", "chat"): "claude-3-5-sonnet",
+    ("cohere", "chat"): "command-r",
+    ("cohere", "completion"): "command-r",
+    ("cohere", "embedding"): "embed-english",
+}
+
+PROVIDER_MODULES = {"openai": "openai", "anthropic": "anthropic", "cohere": "cohere"}
+PROMPT_ARGUMENTS = ("messages", "prompt", "input", "message", "texts", "documents", "system")
+PLACEHOLDER = re.compile(r"\{[^{}]*\}")
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    """Get a tiktoken encoding for a model, or None when unavailable (e.g. offline)"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Encodings are downloaded on first use; don't retry per call site
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Count tokens with tiktoken, estimating from length if no encoding is available"""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def model_pricing(model: str) -> Tuple[float, float]:
+    """Get (input, output) USD per 1M tokens by longest matching model prefix"""
+    for prefix in sorted(MODEL_PRICING, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_PRICING[prefix]
+    return (0.0, 0.0)
+
+
+def literal_value(fact: Optional[tuple]):
+    """Get a literal value from an argument fact, or None"""
+    if not fact:
+        return None
+    if fact[0] == "const":
+        return fact[1]
+    if fact[0] == "str" and fact[2]:
+        return fact[1]
+    return None
+
+
+class LLMCostProfiler:
+    """Estimate per-request token counts and cost for static LLM call sites"""
+
+    def __init__(self, parsed_data: Dict, symbol_index: Optional[SymbolIndex] = None):
+        self.parsed_data = parsed_data
+        self.symbol_index = symbol_index or SymbolIndex.build(parsed_data)
+
+    async def profile(self) -> List[Dict]:
+        """Find LLM call sites and rank them by estimated cost per request"""
+        call_sites = []
+
+        for path, data in self.parsed_data.get("code_patterns", {}).items():
+            for call in data.get("llm_calls", []):
+                site = self._profile_call(path, data, call)
+                if site:
+                    call_sites.append(site)
+
+        most_expensive = max((s["estimated_cost_usd"] for s in call_sites), default=0.0)
+        for site in call_sites:
+            site["relative_cost"] = round(site["estimated_cost_usd"] / most_expensive, 4) if most_expensive else 0.0
+
+        return sorted(call_sites, key=lambda s: s["estimated_cost_usd"], reverse=True)
+
+    def _profile_call(self, path: str, data: Dict, call: Dict) -> Optional[Dict]:
+        """Build a cost row for one call site, or None if it isn't an LLM call"""
+        identified = self.identify(path, data, call)
+        if not identified:
+            return None
+        provider, operation, config, _ = identified
+
+        # Call arguments override settings passed to a LangChain model constructor
+        kwargs = {**config, **call["kwargs"]}
+        model = literal_value(kwargs.get("model") or kwargs.get("model_name"))
+        max_tokens = literal_value(kwargs.get("max_tokens") or kwargs.get("max_output_tokens"))
+        stream = literal_value(kwargs.get("stream") or kwargs.get("streaming"))
+        if call["name"].endswith(("stream", "astream")):
+            stream = True
+
+        prompt_facts = [kwargs[name] for name in PROMPT_ARGUMENTS if name in kwargs] or call["args"][:1]
+        texts, resolution, messages = self._resolve_prompt(prompt_facts, data, call["scope"])
+
+        priced_model = model if isinstance(model, str) else DEFAULT_MODELS.get((provider, operation), "")
+        prompt_tokens = sum(count_tokens(text, priced_model) for text in texts)
+        if operation == "chat":
+            prompt_tokens += MESSAGE_OVERHEAD_TOKENS * max(messages, 1)
+
+        if operation == "embedding":
+            output_tokens = 0
+        elif isinstance(max_tokens, int):
+            output_tokens = max_tokens
+        else:
+            output_tokens = settings.cost_default_output_tokens
+
+        input_price, output_price = model_pricing(priced_model)
+        cost = (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+        return {
+            "location": format_location(path, call["line"]),
+            "call": call["name"],
+            "provider": provider,
+            "operation": operation,
+            "model": model if isinstance(model, str) else None,
+            "max_tokens": max_tokens if isinstance(max_tokens, int) else None,
+            "stream": stream if isinstance(stream, bool) else None,
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "prompt_resolution": resolution,
+            "estimated_cost_usd": round(cost, 8),
+            "relative_cost": 0.0
+        }
+
+    def identify(self, path: str, data: Dict, call: Dict) -> Optional[Tuple[str, str, Dict, str]]:
+        """Work out provider, operation, constructor config and client class for a candidate call"""
+        name = call["name"]
+        receiver, _, method = name.rpartition('.')
+        constructors = data.get("constructors", {})
+        ctor, _, ctor_kwargs = self._constructor_for(receiver, constructors)
+        ctor_resolved = self.resolve_alias(path, ctor) if ctor else ""
+
+        # LangChain models: llm = ChatOpenAI(...); llm.invoke(prompt)
+        ctor_class = ctor.rpartition('.')[2].rstrip("()") if ctor else ""
+        if method in LANGCHAIN_METHODS and ctor_class in LANGCHAIN_MODELS and ctor_resolved.startswith("langchain"):
+            provider, operation = LANGCHAIN_MODELS[ctor_class]
+            if LANGCHAIN_METHODS[method] == "embedding":
+                operation = "embedding"
+            return provider, operation, ctor_kwargs, ctor_resolved
+
+        for suffix, (provider, operation) in SDK_OPERATIONS.items():
+            if name != suffix and not name.endswith('.' + suffix):
+                continue
+            # The client must come from the provider's SDK (directly or via its constructor)
+            resolved = self.resolve_alias(path, name)
+            root = (ctor_resolved or resolved).split('.')[0]
+            if PROVIDER_MODULES.get(provider) == root:
+                return provider, operation, {}, ctor_resolved
+            # Chat completions are unambiguous even when the client's origin is unknown
+            if suffix in ("chat.completions.create", "embeddings.create", "messages.create") and not ctor_resolved:
+                return provider, operation, {}, ctor_resolved
+        return None
+
+    def _constructor_for(self, receiver: str, constructors: Dict) -> Tuple[str, int, Dict]:
+        """Find the constructor behind a receiver like 'client' or 'client.chat.completions'"""
+        parts = receiver.split('.')
+        for end in range(len(parts), 0, -1):
+            found = constructors.get('.'.join(parts[:end]))
+            if found:
+                return found
+        # Inline construction, e.g. OpenAI().chat.completions.create
+        head = parts[0]
+        if head.endswith("()"):
+            return head[:-2], 0, {}
+        return "", 0, {}
+
+    def resolve_alias(self, path: str, name: str) -> str:
+        """Resolve the first segment of a dotted name through the file's import aliases"""
+        head, _, rest = name.partition('.')
+        head = head.rstrip("()")
+        resolved = self.symbol_index.aliases.get(path, {}).get(head, head)
+        return f"{resolved}.{rest}" if rest else resolved
+
+    def _resolve_prompt(self, facts: List[tuple], data: Dict, scope: str) -> Tuple[List[str], str, int]:
+        """Resolve prompt facts to text; returns (texts, resolution, message count)"""
+        strings = data.get("strings", {})
+        module = data.get("module", "")
+        texts = []
+        complete = True
+        messages = 0
+        pending = [(fact, 0) for fact in facts]
+
+        while pending:
+            fact, depth = pending.pop()
+            kind = fact[0]
+            if kind == "str":
+                # Only the template text is counted; placeholders resolve at runtime
+                texts.append(fact[1] if fact[2] else PLACEHOLDER.sub("", fact[1]))
+                complete = complete and fact[2]
+            elif kind == "format":
+                # TEMPLATE.format(...): count the template without its placeholders
+                base = fact[1]
+                if base[0] == "name":
+                    base = strings.get((scope, base[1])) or strings.get((module, base[1])) or base
+                if base[0] == "str":
+                    base = ("str", base[1], False)
+                pending.append((base, depth + 1))
+                complete = False
+            elif kind == "seq" and depth < 4:
+                # The outermost list is the message list for chat calls
+                if not messages:
+                    messages = len(fact[1])
+                pending.extend((item, depth + 1) for item in fact[1])
+            elif kind == "name" and depth < 4:
+                # Look the name up in the calling scope, then at module level
+                resolved = strings.get((scope, fact[1])) or strings.get((module, fact[1]))
+                if resolved:
+                    pending.append((resolved, depth + 1))
+                else:
+                    complete = False
+            else:
+                complete = False
+
+        if not texts:
+            return texts, "none", messages
+        return texts, "full" if complete else "partial", messages
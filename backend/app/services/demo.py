@@ -1,4 +1,11 @@
 from datetime import datetime
+from functools import lru_cache
+from app.services.report_payload import EncodedReport
+
+@lru_cache(maxsize=1)
+def demo_report_payload() -> EncodedReport:
+    """The demo report, built and serialized once per process"""
+    return EncodedReport(generate_demo_report())
 
 def generate_demo_report():
     """Generate a pre-made demo report for showcase"""
@@ -0,0 +1,342 @@
+import json
+import math
+import os
+import zlib
+from array import array
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Only the hashing embedder, so vector search stays lexical
+    SentenceTransformer = None
+
+# Two embedders fill the same int8 (optionally IVF) vector storage:
+# - SentenceEmbedder runs a sentence embedding model on the CPU (with
+#   sentence-transformers installed and `embedding_model` set), so papers are
+#   found by meaning: "hallucination" finds "confabulation".
+# - HashingEmbedder, the fallback, hashes words, word prefixes and word pairs
+#   into a dense TF-IDF vector. That is lexical: a paper sharing no word or
+#   five-letter prefix with a query scores zero, much as with BM25. What it
+#   adds is a second, batched ranking over the whole index.
+# embedding.json records which embedder wrote the vectors; queries are
+# embedded with the same one, or vector search is off.
+
+EMBEDDING_FORMAT = EMBEDDING_FORMAT = "embedding-index/1"
+
+# Papers embedded, assigned or scored per block, so memory stays flat whatever the corpus size
+BLOCK_SIZE = 16384
+
+# Words longer than this also count through their prefix, a crude stem ("retrieval", "retrieving")
+STEM_LENGTH = 5
+
+# IVF training: k-means over a sample of this many vectors per list
+SAMPLE_PER_LIST = 64
+KMEANS_ITERATIONS = 8
+
+
+class HashingEmbedder:
+    """Dense text vectors without a model, a GPU or network calls
+
+    Words, their prefixes and adjacent word pairs are hashed into `dim`
+    signed buckets, weighted by IDF and sublinear term frequency, then
+    L2-normalised; a dot product of two vectors approximates the cosine
+    similarity of their TF-IDF vectors. crc32 keeps the hashing identical
+    across processes, so vectors written at build time match query vectors.
+    Papers sharing no word or prefix with a query get a zero score.
+    """
+
+    name = "hashing-tfidf/1"
+    tokenized = True  # Embeds token lists (paper_index.tokenize), not raw text
+
+    def __init__(self, dim: int, idf: Callable[[str], float], pairs: bool = True):
+        self.dim = dim
+        self.pairs = pairs  # Word pairs favour shared phrasing; off, paraphrases score closer
+        self.vocabulary = _Vocabulary(idf)
+
+    def embed(self, token_lists: Sequence[Sequence[str]]) -> np.ndarray:
+        """(len(token_lists), dim) float32 unit vectors; inputs with no known words give zero vectors"""
+        token_ids = array("q")
+        for tokens in token_lists:
+            token_ids.extend(map(self.vocabulary.__getitem__, tokens))
+        rows = np.repeat(np.arange(len(token_lists)), [len(tokens) for tokens in token_lists])
+        token_ids = np.frombuffer(token_ids, dtype=np.int64)
+        words, stems, idf = (np.frombuffer(table, dtype=dtype)[token_ids] for table, dtype in (
+            (self.vocabulary.hashes, np.int64), (self.vocabulary.stems, np.int64), (self.vocabulary.idf, np.float64)
+        ))
+        known = idf > 0  # Words not in the corpus can't match anything
+        rows, words, stems, idf = rows[known], words[known], stems[known], idf[known]
+
+        # Features: words, word prefixes at half weight, and adjacent word pairs at their mean weight
+        has_stem = stems != 0
+        pairs = np.flatnonzero(rows[1:] == rows[:-1]) if self.pairs else np.empty(0, dtype=np.int64)
+        pair_hashes = ((words[pairs] * 0x9E3779B1) ^ words[pairs + 1]) & 0xFFFFFFFF
+        feature_rows = np.concatenate([rows, rows[has_stem], rows[pairs]])
+        features = np.concatenate([words, stems[has_stem], pair_hashes])
+        weights = np.concatenate([idf, idf[has_stem] * 0.5, (idf[pairs] + idf[pairs + 1]) * 0.5])
+
+        # Sublinear term frequency per (row, feature)
+        keys, first, counts = np.unique((feature_rows << 32) | features, return_index=True, return_counts=True)
+        weights = (1 + np.log(counts)) * weights[first]
+        features = keys & 0xFFFFFFFF
+        signs = np.where(features & 0x80000000, 1.0, -1.0)
+        cells = (keys >> 32) * self.dim + features % self.dim
+        vectors = np.bincount(cells, weights=signs * weights, minlength=len(token_lists) * self.dim)
+        vectors = vectors.reshape(len(token_lists), self.dim).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class SentenceEmbedder:
+    """A sentence embedding model run on the CPU; paper text in, unit vectors out
+
+    Models come from the sentence-transformers hub, e.g. "all-MiniLM-L6-v2"
+    (384 dimensions, a few hundred papers a second on one core), and are
+    downloaded on first use. Text beyond the model's sequence length is cut,
+    so papers are embedded as title plus the start of the abstract.
+    """
+
+    tokenized = False
+    prefix = "sentence-transformers:"
+
+    def __init__(self, model: str):
+        self.model = model
+        self.name = self.prefix + model
+        self._encoder = _load_model(model)
+        self.dim = self._encoder.get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), dim) float32 unit vectors"""
+        vectors = self._encoder.encode(list(texts), batch_size=64, convert_to_numpy=True,
+                                       normalize_embeddings=True, show_progress_bar=False)
+        return vectors.astype(np.float32, copy=False)
+
+
+@lru_cache(maxsize=2)
+def _load_model(model: str):
+    # Loading takes seconds, so the writer and every index reopened share one copy
+    return SentenceTransformer(model, device="cpu")
+
+
+Embedder = Union[HashingEmbedder, SentenceEmbedder]
+
+
+def model_embedder(model: str) -> Optional[SentenceEmbedder]:
+    """The configured model's embedder, or None to fall back to hashing"""
+    if not model:
+        return None
+    if SentenceTransformer is None:
+        print(f"Embedding model {model!r} needs sentence-transformers; using the hashing embedder")
+        return None
+    return SentenceEmbedder(model)
+
+
+def query_embedder(meta: Dict, idf: Callable[[str], float]) -> Optional[Embedder]:
+    """An embedder matching the one that wrote an index's vectors, or None if it can't run here"""
+    name = meta.get("embedder", "")
+    if name == HashingEmbedder.name:
+        return HashingEmbedder(meta["dim"], idf)
+    if name.startswith(SentenceEmbedder.prefix) and SentenceTransformer is not None:
+        return SentenceEmbedder(name[len(SentenceEmbedder.prefix):])
+    return None
+
+
+class _Vocabulary(dict):
+    """Token -> id, with each token's hashes and IDF computed once in flat tables"""
+
+    def __init__(self, idf: Callable[[str], float]):
+        super().__init__()
+        self._idf = idf
+        self.hashes = array("q")
+        self.stems = array("q")  # Prefix hash, 0 for short words
+        self.idf = array("d")
+
+    def __missing__(self, token: str) -> int:
+        token_id = self[token] = len(self.hashes)
+        self.hashes.append(zlib.crc32(token.encode()))
+        self.stems.append(zlib.crc32(token[:STEM_LENGTH].encode() + b"*") if len(token) > STEM_LENGTH else 0)
+        self.idf.append(self._idf(token))
+        return token_id
+
+
+def write_embeddings(path: Path, documents: Iterable, count: int, embedder: Embedder, ivf_min_papers: int):
+    """Embed `count` documents (token lists or texts, as the embedder takes) into `path`, an index being built
+
+    Files, all NumPy .npy so they can be memory-mapped:
+    - vectors.npy: int8 unit vectors, one row per paper, with scales.npy
+      holding each row's float32 scale (a quarter of float32's size, and
+      far cheaper than float16 to widen for the matrix product)
+    - with IVF (corpora of at least `ivf_min_papers`), rows are grouped by
+      list: ids.npy maps rows to paper ids, centroids.npy holds the list
+      centroids and list_offsets.npy the first row of each list
+    - embedding.json: format, embedder, dimensions and list count
+    """
+    path = Path(path)
+    raw_path = path / "vectors.raw.npy"
+    vectors = np.lib.format.open_memmap(raw_path, mode="w+", dtype=np.int8, shape=(count, embedder.dim))
+    scales = np.empty(count, dtype=np.float32)
+    batch: list = []
+    row = 0
+    for document in documents:
+        batch.append(document)
+        if len(batch) == BLOCK_SIZE:
+            vectors[row:row + len(batch)], scales[row:row + len(batch)] = _quantize(embedder.embed(batch))
+            row += len(batch)
+            batch = []
+    if batch:
+        vectors[row:row + len(batch)], scales[row:row + len(batch)] = _quantize(embedder.embed(batch))
+    vectors.flush()
+
+    lists = 0
+    if count >= ivf_min_papers:
+        lists = min(4096, int(math.sqrt(count)))
+        centroids = _train_centroids(vectors, scales, lists)
+        labels = np.concatenate([
+            _nearest(vectors[start:start + BLOCK_SIZE], centroids) for start in range(0, count, BLOCK_SIZE)
+        ])
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=lists))])
+
+        grouped = np.lib.format.open_memmap(path / "vectors.npy", mode="w+", dtype=np.int8, shape=vectors.shape)
+        for start in range(0, count, BLOCK_SIZE):
+            rows = order[start:start + BLOCK_SIZE]
+            # Read in file order, then put back in list order
+            by_position = np.argsort(rows)
+            block = np.empty((len(rows), embedder.dim), dtype=np.int8)
+            block[by_position] = vectors[rows[by_position]]
+            grouped[start:start + len(rows)] = block
+        grouped.flush()
+        del grouped, vectors
+        os.remove(raw_path)
+        np.save(path / "scales.npy", scales[order])
+        np.save(path / "ids.npy", order.astype(np.uint32))
+        np.save(path / "centroids.npy", centroids)
+        np.save(path / "list_offsets.npy", offsets.astype(np.int64))
+    else:
+        del vectors
+        os.replace(raw_path, path / "vectors.npy")
+        np.save(path / "scales.npy", scales)
+
+    with open(path / "embedding.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "format": EMBEDDING_FORMAT,
+            "embedder": embedder.name,
+            "dim": embedder.dim,
+            "papers": count,
+            "lists": lists,
+            "built": datetime.now().isoformat(),
+        }, f)
+
+
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """int8 rows and the float32 scale that restores each"""
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _nearest(block: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # Row scales are positive, so they don't change which centroid is nearest
+    return np.argmax(block.astype(np.float32) @ centroids.T, axis=1)
+
+
+def _train_centroids(vectors: np.ndarray, scales: np.ndarray, lists: int) -> np.ndarray:
+    """Spherical k-means on a sample: unit centroids maximising cosine similarity"""
+    rng = np.random.default_rng(0)
+    size = min(len(vectors), lists * SAMPLE_PER_LIST)
+    rows = np.sort(rng.choice(len(vectors), size, replace=False))
+    sample = vectors[rows].astype(np.float32) * scales[rows, None]
+    centroids = sample[rng.choice(size, lists, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        labels = np.concatenate([
+            _nearest(sample[start:start + BLOCK_SIZE], centroids) for start in range(0, size, BLOCK_SIZE)
+        ])
+        order = np.argsort(labels, kind="stable")
+        members = np.bincount(labels, minlength=lists)
+        filled = np.flatnonzero(members)
+        starts = np.concatenate([[0], np.cumsum(members)[:-1]])[filled]
+        # Lists left empty keep their previous centroid
+        sums = np.add.reduceat(sample[order], starts, axis=0)
+        centroids[filled] = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+class EmbeddingIndex:
+    """Read-only cosine similarity search over an index directory's vectors
+
+    Vectors stay memory-mapped; a search streams them in blocks (or, with
+    IVF, only the lists nearest each query) through one matrix product for
+    the whole batch of queries.
+    """
+
+    def __init__(self, path: Path):
+        path = Path(path)
+        with open(path / "embedding.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != EMBEDDING_FORMAT:
+            raise ValueError(f"Unsupported embedding index format: {self.meta.get('format')}")
+        self.dim = self.meta["dim"]
+        self.vectors = np.load(path / "vectors.npy", mmap_mode="r")
+        self.scales = np.load(path / "scales.npy", mmap_mode="r")
+        self.ids = self.centroids = self.list_offsets = None
+        if self.meta["lists"]:
+            self.ids = np.load(path / "ids.npy", mmap_mode="r")
+            self.centroids = np.load(path / "centroids.npy")
+            self.list_offsets = np.load(path / "list_offsets.npy")
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def search(self, queries: np.ndarray, k: int, allowed: Optional[np.ndarray] = None,
+               probe: int = 16) -> List[List[Tuple[int, float]]]:
+        """Top-k (paper id, cosine similarity) per query row, best first
+
+        `allowed` is an optional boolean mask over paper ids; `probe` is how
+        many IVF lists each query scans.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        best_ids = [np.empty(0, dtype=np.int64) for _ in queries]
+        best_scores = [np.empty(0, dtype=np.float32) for _ in queries]
+
+        for start, end, members in self._spans(queries, probe):
+            block = np.asarray(self.vectors[start:end], dtype=np.float32)
+            doc_ids = np.asarray(self.ids[start:end], dtype=np.int64) if self.ids is not None \
+                else np.arange(start, end, dtype=np.int64)
+            scores = (block @ queries[members].T) * self.scales[start:end, None]
+            if allowed is not None:
+                scores[~allowed[doc_ids]] = -np.inf
+            if len(block) > k:
+                top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            else:
+                top = np.broadcast_to(np.arange(len(block))[:, None], scores.shape)
+            for column, query in enumerate(members):
+                rows = top[:, column]
+                ids = np.concatenate([best_ids[query], doc_ids[rows]])
+                values = np.concatenate([best_scores[query], scores[rows, column]])
+                if len(ids) > k:
+                    keep = np.argpartition(-values, k - 1)[:k]
+                    ids, values = ids[keep], values[keep]
+                best_ids[query], best_scores[query] = ids, values
+
+        results = []
+        for ids, values in zip(best_ids, best_scores):
+            order = np.argsort(-values, kind="stable")
+            results.append([(int(ids[i]), float(values[i])) for i in order if np.isfinite(values[i])])
+        return results
+
+    def _spans(self, queries: np.ndarray, probe: int) -> Iterable[Tuple[int, int, np.ndarray]]:
+        """(first row, end row, query positions) blocks to score"""
+        everyone = np.arange(len(queries))
+        if self.centroids is None:
+            for start in range(0, len(self), BLOCK_SIZE):
+                yield start, min(start + BLOCK_SIZE, len(self)), everyone
+            return
+        probe = min(probe, len(self.centroids))
+        nearest = np.argpartition(-(queries @ self.centroids.T), probe - 1, axis=1)[:, :probe]
+        for lst in np.unique(nearest):
+            members = np.flatnonzero((nearest == lst).any(axis=1))
+            start, end = int(self.list_offsets[lst]), int(self.list_offsets[lst + 1])
+            if end > start:
+                yield start, end, members
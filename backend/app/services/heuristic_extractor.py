@@ -0,0 +1,143 @@
+import re
+from bisect import bisect_right
+from typing import Dict, List, Tuple
+from app.config import settings
+from app.models.records import PaperRecord
+
+# Papers are joined into one corpus so each pattern runs once for the whole batch
+PAPER_SEPARATOR = "\n\x00\n"
+
+# A sentence ends at . ! or ? followed by whitespace, so "3.5%" stays in one piece
+SENTENCE_PATTERN = re.compile(r"(?:[^.!?\x00]|[.!?](?=\S))+[.!?]*")
+
+QUANTITY_PATTERNS = {
+    "percentage": re.compile(r"\b\d+(?:\.\d+)?\s?%"),
+    "latency": re.compile(r"\b\d+(?:\.\d+)?\s?(?:ms|milliseconds?|seconds?|s)\b", re.IGNORECASE),
+    "speedup": re.compile(r"\b\d+(?:\.\d+)?\s?(?:x|×|-fold|\s?times)\b", re.IGNORECASE),
+    "points": re.compile(r"\b\d+(?:\.\d+)?\s?(?:points?|pp)\b", re.IGNORECASE),
+}
+
+METRIC_PATTERN = re.compile(
+    r"\b(accuracy|F1|recall|precision|BLEU|ROUGE(?:-[L12])?|latency|throughput|exact match|"
+    r"hallucination rate|MRR|nDCG|perplexity|cost|token usage|success rate|faithfulness)\b",
+    re.IGNORECASE,
+)
+
+FAILURE_PATTERN = re.compile(
+    r"\b(fail\w*|degrad\w*|hallucinat\w*|struggl\w*|vulnerab\w*|brittle|limitation\w*|"
+    r"unreliab\w*|inconsisten\w*|bias\w*|drops?)\b",
+    re.IGNORECASE,
+)
+SEVERE_PATTERN = re.compile(r"\b(hallucinat\w*|vulnerab\w*|attack\w*|leak\w*|unsafe|security)\b", re.IGNORECASE)
+
+PRACTICE_PATTERN = re.compile(
+    r"\b(improv\w*|outperform\w*|reduc\w*|increas\w*|boost\w*|mitigat\w*|recommend\w*|"
+    r"we propose|we show|enables?)\b",
+    re.IGNORECASE,
+)
+
+MAX_ITEMS = 3
+MAX_SENTENCE_CHARS = 300
+
+
+class HeuristicExtractor:
+    """Pull quantitative findings and failure-mode sentences out of abstracts without an LLM
+
+    Every pattern runs once over all abstracts joined into one corpus;
+    matches map back to their paper and sentence by offset. Each paper gets
+    a confidence score in [0, 1] for how much usable evidence was found.
+    """
+
+    def extract(self, papers: List[PaperRecord]) -> List[Dict]:
+        """Get one insight per paper, in input order, with "confidence" set"""
+        corpus, paper_starts = self._corpus(papers)
+        sentences = [(m.start(), m.end()) for m in SENTENCE_PATTERN.finditer(corpus)]
+        sentence_starts = [start for start, _ in sentences]
+
+        def locate(offset: int) -> Tuple[int, int]:
+            return bisect_right(paper_starts, offset) - 1, bisect_right(sentence_starts, offset) - 1
+
+        # Per paper: sentence index -> what matched in it
+        quantities = [dict() for _ in papers]
+        metrics = [dict() for _ in papers]
+        failures = [dict() for _ in papers]
+        practices = [dict() for _ in papers]
+
+        for pattern in QUANTITY_PATTERNS.values():
+            for match in pattern.finditer(corpus):
+                paper, sentence = locate(match.start())
+                quantities[paper].setdefault(sentence, []).append(match.group().strip())
+        for match in METRIC_PATTERN.finditer(corpus):
+            paper, sentence = locate(match.start())
+            metrics[paper].setdefault(sentence, match.group())
+        for match in FAILURE_PATTERN.finditer(corpus):
+            paper, sentence = locate(match.start())
+            failures[paper].setdefault(sentence, match.group())
+        for match in PRACTICE_PATTERN.finditer(corpus):
+            paper, sentence = locate(match.start())
+            practices[paper].setdefault(sentence, match.group())
+
+        def text(sentence: int) -> str:
+            start, end = sentences[sentence]
+            return corpus[start:end].strip()[:MAX_SENTENCE_CHARS]
+
+        insights = []
+        for i, paper in enumerate(papers):
+            findings = [{
+                "finding": text(s),
+                "metric": metrics[i].get(s, ""),
+                "value": ", ".join(values)
+            } for s, values in sorted(quantities[i].items())][:MAX_ITEMS]
+
+            failure_modes = [{
+                "description": text(s),
+                "conditions": "",
+                "severity": "High" if SEVERE_PATTERN.search(text(s)) else "Medium",
+                "mitigation": "See the paper for mitigation details"
+            } for s in sorted(failures[i])][:MAX_ITEMS]
+
+            # Improvements backed by a number are the most actionable practices
+            backed = [s for s in sorted(practices[i]) if s in quantities[i] and s not in failures[i]]
+            best_practices = [{
+                "practice": text(s),
+                "rationale": "",
+                "evidence": ", ".join(quantities[i][s])
+            } for s in backed][:MAX_ITEMS]
+
+            insights.append({
+                "paper_title": paper.title,
+                "paper_year": paper.year,
+                "paper_url": paper.url,
+                "technique": paper.technique,
+                "failure_modes": failure_modes,
+                "best_practices": best_practices,
+                "performance_findings": findings,
+                "implementation_recommendations": [],
+                "extraction": "heuristic",
+                "confidence": self._confidence(findings, metrics[i], failure_modes, best_practices)
+            })
+
+        return insights
+
+    def _corpus(self, papers: List[PaperRecord]) -> Tuple[str, List[int]]:
+        """Join abstracts into one string and record where each paper starts"""
+        starts = []
+        parts = []
+        offset = 0
+        for paper in papers:
+            abstract = paper.abstract
+            starts.append(offset)
+            parts.append(abstract)
+            offset += len(abstract) + len(PAPER_SEPARATOR)
+        return PAPER_SEPARATOR.join(parts), starts
+
+    def _confidence(self, findings: List[Dict], metrics: Dict, failure_modes: List[Dict], best_practices: List[Dict]) -> float:
+        """Score how complete the local extraction is; low scores go to the LLM"""
+        score = 0.2 * min(len(findings), 2)
+        score += 0.15 if metrics else 0.0
+        score += 0.25 if failure_modes else 0.0
+        score += 0.2 if best_practices else 0.0
+        return round(min(score, 1.0), 2)
+
+    def is_confident(self, insight: Dict) -> bool:
+        return insight["confidence"] >= settings.heuristic_confidence_threshold
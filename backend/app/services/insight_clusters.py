@@ -0,0 +1,57 @@
+import math
+from collections import Counter
+from typing import List, Sequence
+import numpy as np
+from app.services.embedding_index import HashingEmbedder
+from app.services.paper_index import tokenize
+
+# Hash buckets per vector; insight texts are short, so fewer collisions beats a smaller matrix
+CLUSTER_DIM = 1024
+
+# Inflections stripped so "hallucinations", "hallucinated" and "hallucination" match, longest first
+SUFFIXES = ("ations", "ation", "ating", "ated", "ates", "ings", "ing", "ies", "ied", "es", "ed", "ly", "s", "e")
+MIN_STEM = 4
+
+
+def stem(token: str) -> str:
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM:
+            return token[:-len(suffix)]
+    return token
+
+
+def embed_texts(texts: Sequence[str]) -> np.ndarray:
+    """(len(texts), CLUSTER_DIM) unit TF-IDF vectors, IDF taken over the texts themselves
+
+    Smoothed IDF keeps words every text shares above zero: in a handful of
+    paraphrases the shared words are what makes them alike.
+    """
+    token_lists = [[stem(token) for token in tokenize(text)] for text in texts]
+    df = Counter(token for tokens in token_lists for token in set(tokens))
+    embedder = HashingEmbedder(CLUSTER_DIM, lambda token: 1 + math.log((1 + len(texts)) / (1 + df[token])), pairs=False)
+    return embedder.embed(token_lists)
+
+
+def cluster_texts(texts: Sequence[str], threshold: float) -> List[List[int]]:
+    """Indices of texts that say the same thing, grouped; the first text of each cluster leads
+
+    Texts are taken in order. Each joins the cluster whose leader it is most
+    similar to, if the cosine similarity reaches `threshold`, or leads a new
+    one. That is one matrix-vector product per text against the leaders, so
+    time grows with texts x clusters instead of with every pair.
+    """
+    if not texts:
+        return []
+    vectors = embed_texts(texts)
+    leaders = np.empty_like(vectors)
+    clusters: List[List[int]] = []
+    for i, vector in enumerate(vectors):
+        if clusters:
+            similarity = leaders[:len(clusters)] @ vector
+            best = int(np.argmax(similarity))
+            if similarity[best] >= threshold:
+                clusters[best].append(i)
+                continue
+        leaders[len(clusters)] = vector
+        clusters.append([i])
+    return clusters
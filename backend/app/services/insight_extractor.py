@@ -1,124 +1,326 @@
-from typing import List, Dict
-from openai import AsyncOpenAI
+import asyncio
+import hashlib
+import logging
+from typing import Callable, List, Dict, Optional, Tuple
 from app.config import settings
+from app.models.records import PaperRecord
+from app.services.budget import AnalysisBudget
+from app.services.cost_profiler import count_tokens
+from app.services.heuristic_extractor import HeuristicExtractor
+from app.services.job_trace import span
+from app.services.json_stream import IncrementalJSONParser
+from app.services.llm_router import LLMRouter, llm_router
+from app.services.result_cache import insight_cache
+from app.services.single_flight import SingleFlight
 import json
 
+# Batches are sized with this model's tokenizer whichever provider serves them
+EXTRACTION_MODEL = settings.openai_extraction_model
+
+EXTRACTION_SYSTEM = "You are an expert at extracting actionable engineering insights from research papers. Extract only concrete, practical findings."
+
+# Sections whose items are handed on while the response is still streaming
+STREAMED_SECTIONS = ("failure_modes", "best_practices", "recommendations")
+
+# Shared instructions, sent once per request however many papers it carries
+EXTRACTION_INSTRUCTIONS = """Analyze each research paper below and extract actionable engineering insights.
+
+Return a JSON object with one entry per paper, keyed by the paper's label (e.g. "P3"):
+
+{
+  "P3": {
+    "failure_modes": [
+      {
+        "description": "What can go wrong",
+        "conditions": "When does it happen",
+        "severity": "Critical/High/Medium/Low",
+        "mitigation": "How to prevent or fix it"
+      }
+    ],
+    "best_practices": [
+      {
+        "practice": "What to do",
+        "rationale": "Why it helps",
+        "evidence": "What the paper found"
+      }
+    ],
+    "performance_findings": [
+      {
+        "finding": "Performance characteristic",
+        "metric": "What was measured",
+        "value": "Quantitative result if available"
+      }
+    ],
+    "recommendations": [
+      {
+        "recommendation": "Concrete action",
+        "impact": "High/Medium/Low",
+        "effort": "High/Medium/Low"
+      }
+    ]
+  }
+}
+
+Focus on:
+- Concrete, actionable findings
+- Experimental results (if available)
+- Practical engineering implications
+- Specific numbers and metrics
+
+Be concise and specific. Keep each paper's findings to that paper. If information isn't in an abstract, leave it empty.
+"""
+
+extraction_flight = SingleFlight("insight_extraction")
+
+logger = logging.getLogger(__name__)
+
 class InsightExtractor:
-    """Extract actionable insights from research papers using LLM"""
+    """Extract actionable insights from research papers, using an LLM for what local extraction misses"""
 
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key) if settings.openai_api_key else None
+    def __init__(
+        self,
+        budget: Optional[AnalysisBudget] = None,
+        on_item: Optional[Callable[[Dict, str, Dict], None]] = None,
+        router: Optional[LLMRouter] = None
+    ):
+        # Shared across jobs so provider health and latency history carry over
+        self.router = router or llm_router
+        self.budget = budget or AnalysisBudget()
+        # Called with (paper metadata, section, item) as each failure mode or recommendation is ready
+        self.on_item = on_item
+        self._emitted = set()
+        self.stats = {"requests": 0, "papers": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0}
 
-    async def extract_from_papers(self, papers: List[Dict]) -> List[Dict]:
-        """Extract insights from all papers"""
-        if not self.client:
-            # Return mock insights if no API key
-            return self._mock_insights(papers)
+    async def extract_from_papers(self, papers: List[PaperRecord]) -> List[Dict]:
+        """Extract insights locally first, sending only low-confidence papers to the LLM"""
+        heuristic = HeuristicExtractor()
+        with span("heuristic_extraction", "cpu") as args:
+            local = heuristic.extract(papers)
+            args["papers"] = len(papers)
 
-        insights = []
-        for paper in papers[:10]:  # Limit to avoid cost
+        if not self.router.configured():
+            # Without an LLM provider use whatever the local pass found, or mock insights
+            found = [insight for insight in local if insight["confidence"] > 0] or self._mock_insights(papers)
+            self._emit_insights(dict(enumerate(found)))
+            return found
+
+        pending = [i for i, insight in enumerate(local) if not heuristic.is_confident(insight)]
+        insights = {i: insight for i, insight in enumerate(local) if heuristic.is_confident(insight)}
+
+        # Papers the LLM extracted recently (for another job or the prefetcher) skip the request
+        for i in pending:
+            cached = insight_cache.get(self._paper_key(papers[i]))
+            if cached is not None:
+                insights[i] = {**self._paper_meta(papers[i]), **cached}
+                self.stats["cached"] += 1
+        pending = [i for i in pending if i not in insights]
+        self._emit_insights(insights)
+
+        llm_pending = pending[:self.budget.limits["llm_papers"]]  # Limit to avoid cost
+        if pending and not llm_pending:
+            self.budget.degrade(f"Skipped LLM insight extraction ({self.budget.mode} mode); using local extraction")
+
+        if llm_pending:
+            insights.update(await self._extract_batched(papers, llm_pending))
+
+        # Papers the LLM didn't cover keep any local findings
+        fallback = {i: local[i] for i in pending if i not in insights and local[i]["confidence"] > 0}
+        self._emit_insights(fallback)
+        insights.update(fallback)
+
+        return [insights[i] for i in sorted(insights)]
+
+    async def _extract_batched(self, papers: List[PaperRecord], indices: List[int]) -> Dict[int, Dict]:
+        """Extract insights in packed multi-paper requests
+
+        Papers missing or invalid in a response that parsed are split into
+        halves and retried. A request that fails outright (timeout, or every
+        provider erroring after LLMRouter's failover) stops LLM extraction:
+        smaller requests would fail the same way and spend the deadline.
+        """
+        results = {}
+        queue = self._pack_batches(papers, indices)
+        done = 0
+
+        while queue:
+            batch = queue.pop(0)
+            if self.budget.expired():
+                self.budget.degrade(
+                    f"LLM insight extraction stopped after {done} of {len(indices)} papers (deadline reached); "
+                    "using local extraction for the rest"
+                )
+                break
             try:
-                paper_insights = await self._extract_from_paper(paper)
-                insights.append(paper_insights)
+                extracted, parsed = await asyncio.wait_for(
+                    self._extract_batch(papers, batch), timeout=self.budget.timeout(60.0)
+                )
             except Exception as e:
-                print(f"Error extracting from paper: {e}")
-                continue
+                logger.warning("LLM insight extraction failed (%s: %s)", type(e).__name__, e)
+                self.budget.degrade(
+                    f"LLM insight extraction failed after {done} of {len(indices)} papers "
+                    f"({type(e).__name__}); using local extraction for the rest"
+                )
+                break
 
-        return insights
+            results.update(extracted)
+            done += len(extracted)
+            failed = [i for i in batch if i not in extracted]
+            # Retry only what the model got wrong, in halves, so one bad paper can't sink the rest
+            if parsed and failed and len(batch) > 1:
+                middle = (len(failed) + 1) // 2
+                queue[:0] = [part for part in (failed[:middle], failed[middle:]) if part]
+
+        return results
 
-    async def _extract_from_paper(self, paper: Dict) -> Dict:
-        """Extract insights from a single paper"""
-        prompt = self._build_extraction_prompt(paper)
-
-        response = await self.client.chat.completions.create(
-            model="gpt-4o-mini",  # Cheaper model for extraction
-            messages=[
-                {"role": "system", "content": "You are an expert at extracting actionable engineering insights from research papers. Extract only concrete, practical findings."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.3
+    def _pack_batches(self, papers: List[PaperRecord], indices: List[int]) -> List[List[int]]:
+        """Greedily pack papers into requests within the token budget and batch size"""
+        budget = settings.insight_batch_token_budget - count_tokens(EXTRACTION_INSTRUCTIONS, EXTRACTION_MODEL)
+        batches = []
+        batch, used = [], 0
+        for i in indices:
+            tokens = count_tokens(self._paper_block(f"P{i}", papers[i]), EXTRACTION_MODEL)
+            if batch and (used + tokens > budget or len(batch) >= settings.insight_batch_size):
+                batches.append(batch)
+                batch, used = [], 0
+            batch.append(i)
+            used += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _extract_batch(self, papers: List[PaperRecord], batch: List[int]) -> Tuple[Dict[int, Dict], bool]:
+        """Extract insights for several papers in one streamed request
+
+        Returns the valid results and whether the response was a JSON object at all.
+        """
+        keys = {f"P{i}": i for i in batch}
+        prompt = self._build_extraction_prompt({key: papers[i] for key, i in keys.items()})
+
+        def on_value(path, item):
+            # ("P3", "failure_modes", 0) -> item closed while the rest still streams
+            if isinstance(item, dict):
+                index = keys[path[0]]
+                self._emit(index, self._paper_meta(papers[index]), path[1], item)
+
+        parser = IncrementalJSONParser(
+            on_value, match=lambda path: len(path) == 3 and path[0] in keys and path[1] in STREAMED_SECTIONS
         )
 
+        with span("llm.chat", "llm", papers=len(batch)) as args:
+            # Jobs extracting the same batch at the same time share one request
+            key = hashlib.sha256(prompt.encode()).hexdigest()
+            coalesced = args["coalesced"] = extraction_flight.in_flight(key)
+            content, usage = await extraction_flight.do(key, lambda: self._complete(prompt, parser.feed))
+            args["bytes"] = len(content.encode())
+            if coalesced:
+                # The shared request streamed into the first job's parser; replay it here
+                parser.feed(content)
+            else:
+                args.update(usage)
+                self.stats["requests"] += 1
+                self.stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                self.stats["completion_tokens"] += usage.get("completion_tokens", 0)
+
         try:
-            result = json.loads(response.choices[0].message.content)
-        except:
+            result = json.loads(content)
+        except ValueError:
+            result = None
+        parsed = isinstance(result, dict)
+        if not parsed:
             result = {}
 
+        extracted = {}
+        for key, i in keys.items():
+            entry = result.get(key)
+            if not self._is_valid(entry):
+                continue
+            found = {
+                "failure_modes": entry.get("failure_modes", []),
+                "best_practices": entry.get("best_practices", []),
+                "performance_findings": entry.get("performance_findings", []),
+                "implementation_recommendations": entry.get("recommendations", []),
+                "extraction": "llm"
+            }
+            insight_cache.set(self._paper_key(papers[i]), found)
+            extracted[i] = {**self._paper_meta(papers[i]), **found}
+        self.stats["papers"] += len(extracted)
+        return extracted, parsed
+
+    async def _complete(self, prompt: str, on_text: Callable[[str], None]) -> Tuple[str, Dict]:
+        """Stream one completion, passing text on as it arrives; returns the content and provider details"""
+        usage = {}
+        parts = []
+        async for text in self.router.stream(EXTRACTION_SYSTEM, prompt, usage):
+            parts.append(text)
+            on_text(text)
+        return "".join(parts), usage
+
+    def _paper_key(self, paper: PaperRecord) -> str:
+        """Cache key for a paper's extracted findings, independent of the job that found it"""
+        return hashlib.sha256(f"{paper.title}\0{paper.abstract}".encode()).hexdigest()
+
+    def _paper_meta(self, paper: PaperRecord) -> Dict:
         return {
-            "paper_title": paper["title"],
-            "paper_year": paper["year"],
-            "paper_url": paper["url"],
-            "technique": paper["technique"],
-            "failure_modes": result.get("failure_modes", []),
-            "best_practices": result.get("best_practices", []),
-            "performance_findings": result.get("performance_findings", []),
-            "implementation_recommendations": result.get("recommendations", [])
+            "paper_title": paper.title,
+            "paper_year": paper.year,
+            "paper_url": paper.url,
+            "technique": paper.technique
         }
 
-    def _build_extraction_prompt(self, paper: Dict) -> str:
-        """Build prompt for insight extraction"""
-        return f"""Analyze this research paper and extract actionable engineering insights.
-
-Title: {paper['title']}
-Year: {paper['year']}
-Abstract: {paper['abstract']}
-
-Extract the following in JSON format:
-
-{{
-  "failure_modes": [
-    {{
-      "description": "What can go wrong",
-      "conditions": "When does it happen",
-      "severity": "Critical/High/Medium/Low",
-      "mitigation": "How to prevent or fix it"
-    }}
-  ],
-  "best_practices": [
-    {{
-      "practice": "What to do",
-      "rationale": "Why it helps",
-      "evidence": "What the paper found"
-    }}
-  ],
-  "performance_findings": [
-    {{
-      "finding": "Performance characteristic",
-      "metric": "What was measured",
-      "value": "Quantitative result if available"
-    }}
-  ],
-  "recommendations": [
-    {{
-      "recommendation": "Concrete action",
-      "impact": "High/Medium/Low",
-      "effort": "High/Medium/Low"
-    }}
-  ]
-}}
+    def _emit_insights(self, insights: Dict[int, Dict]):
+        """Hand on the items of insights that are already complete (local extraction)"""
+        for index, insight in insights.items():
+            meta = {key: insight[key] for key in ("paper_title", "paper_year", "paper_url", "technique")}
+            for section, field in (("failure_modes", "failure_modes"), ("best_practices", "best_practices"),
+                                   ("recommendations", "implementation_recommendations")):
+                for item in insight.get(field, []):
+                    self._emit(index, meta, section, item)
 
-Focus on:
-- Concrete, actionable findings
-- Experimental results (if available)
-- Practical engineering implications
-- Specific numbers and metrics
+    def _emit(self, index: int, meta: Dict, section: str, item: Dict):
+        """Pass a finished item to on_item once, even if its paper is retried"""
+        if not self.on_item:
+            return
+        key = (index, section, json.dumps(item, sort_keys=True))
+        if key in self._emitted:
+            return
+        self._emitted.add(key)
+        self.on_item(meta, section, item)
+
+    def _is_valid(self, entry) -> bool:
+        """A paper's entry must be an object whose sections are lists of objects"""
+        if not isinstance(entry, dict):
+            return False
+        for section in ("failure_modes", "best_practices", "performance_findings", "recommendations"):
+            items = entry.get(section, [])
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                return False
+        return True
+
+    def _paper_block(self, key: str, paper: PaperRecord) -> str:
+        return f"""[{key}]
+Title: {paper.title}
+Year: {paper.year}
+Abstract: {paper.abstract}
+"""
 
-Be concise and specific. If information isn't in the abstract, leave it empty."""
+    def _build_extraction_prompt(self, keyed_papers: Dict[str, PaperRecord]) -> str:
+        """Build one prompt for several papers: shared instructions, then each keyed abstract"""
+        blocks = "\n".join(self._paper_block(key, paper) for key, paper in keyed_papers.items())
+        return f"{EXTRACTION_INSTRUCTIONS}\nPapers:\n\n{blocks}"
 
-    def _mock_insights(self, papers: List[Dict]) -> List[Dict]:
+    def _mock_insights(self, papers: List[PaperRecord]) -> List[Dict]:
         """Generate mock insights for demo purposes"""
         insights = []
 
         for paper in papers[:5]:
-            technique = paper.get("technique", "")
+            technique = paper.technique
 
             # Create realistic mock insights based on technique
             if "RAG" in technique:
                 insights.append({
-                    "paper_title": paper["title"],
-                    "paper_year": paper["year"],
-                    "paper_url": paper["url"],
+                    "paper_title": paper.title,
+                    "paper_year": paper.year,
+                    "paper_url": paper.url,
                     "technique": technique,
                     "failure_modes": [
                         {
@@ -153,9 +355,9 @@ Be concise and specific. If information isn't in the abstract, leave it empty.""
 
             elif "LLM" in technique or "API" in technique:
                 insights.append({
-                    "paper_title": paper["title"],
-                    "paper_year": paper["year"],
-                    "paper_url": paper["url"],
+                    "paper_title": paper.title,
+                    "paper_year": paper.year,
+                    "paper_url": paper.url,
                     "technique": technique,
                     "failure_modes": [
                         {
@@ -190,9 +392,9 @@ Be concise and specific. If information isn't in the abstract, leave it empty.""
 
             elif "VECTOR" in technique or "EMBEDDINGS" in technique:
                 insights.append({
-                    "paper_title": paper["title"],
-                    "paper_year": paper["year"],
-                    "paper_url": paper["url"],
+                    "paper_title": paper.title,
+                    "paper_year": paper.year,
+                    "paper_url": paper.url,
                     "technique": technique,
                     "failure_modes": [
                         {
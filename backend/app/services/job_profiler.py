@@ -0,0 +1,168 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+
+TRUNCATED_STACK = "[truncated]"
+
+
+class SamplingProfiler:
+    """Sample one thread's Python stack on an interval into collapsed stacks
+
+    Runs in a daemon thread and reads the target thread's current frame via
+    sys._current_frames(), so the profiled code isn't instrumented; overhead
+    scales with the sampling rate. Jobs share the event loop thread, so
+    samples taken while several jobs run include all of them.
+    """
+
+    def __init__(self, thread_id: int, interval_ms: Optional[float] = None, max_stacks: Optional[int] = None):
+        self.thread_id = thread_id
+        self.interval = (interval_ms or settings.profiling_interval_ms) / 1000
+        self.max_stacks = max_stacks or settings.profiling_max_stacks
+        self.stacks: Dict[Tuple[str, ...], int] = {}
+        self.samples = 0
+        self.started: Optional[float] = None
+        self.duration = 0.0
+        self._frame_names: Dict[object, str] = {}
+        # Held by the sampler while it updates stacks, and by readers while they copy them
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="job-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self.duration += time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._sample(frame)
+
+    def _sample(self, frame):
+        stack = []
+        names = self._frame_names
+        while frame is not None:
+            code = frame.f_code
+            name = names.get(code)
+            if name is None:
+                name = names[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            stack.append(name)
+            frame = frame.f_back
+        stack.reverse()
+
+        key = tuple(stack)
+        with self._lock:
+            if key not in self.stacks and len(self.stacks) >= self.max_stacks:
+                key = (TRUNCATED_STACK,)
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], int]:
+        """A copy of the stack counts, safe to iterate while sampling continues"""
+        with self._lock:
+            return dict(self.stacks)
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed stack format, one 'a;b;c count' line per stack"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in
+                       sorted(self.snapshot().items(), key=lambda item: item[1], reverse=True))
+
+    def speedscope(self, name: str) -> Dict:
+        """Speedscope file format with one weighted sample per distinct stack"""
+        frame_index: Dict[str, int] = {}
+        frames: List[Dict] = []
+        samples: List[List[int]] = []
+        weights: List[float] = []
+        interval_ms = self.interval * 1000
+
+        for stack, count in self.snapshot().items():
+            indices = []
+            for frame_name in stack:
+                index = frame_index.get(frame_name)
+                if index is None:
+                    index = frame_index[frame_name] = len(frames)
+                    frames.append({"name": frame_name})
+                indices.append(index)
+            samples.append(indices)
+            weights.append(count * interval_ms)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "name": name,
+            "exporter": "genai-profiler",
+        }
+
+
+class ProfileStore:
+    """Profilers for recent jobs, keyed by job ID"""
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self._threads: Dict[str, int] = {}
+        self._profilers: "OrderedDict[str, SamplingProfiler]" = OrderedDict()
+
+    def register(self, job_id: str):
+        """Remember which thread runs a job so profiling can be switched on mid-run"""
+        self._threads[job_id] = threading.get_ident()
+
+    def finish(self, job_id: str):
+        """Stop profiling when a job ends; its profile stays downloadable"""
+        self._threads.pop(job_id, None)
+        profiler = self._profilers.get(job_id)
+        if profiler:
+            profiler.stop()
+
+    def start(self, job_id: str) -> Optional[SamplingProfiler]:
+        """Start (or resume) sampling a running job; None if it isn't running"""
+        thread_id = self._threads.get(job_id)
+        if thread_id is None:
+            return None
+        profiler = self._profilers.get(job_id)
+        if profiler is None:
+            profiler = self._profilers[job_id] = SamplingProfiler(thread_id)
+            while len(self._profilers) > self.max_jobs:
+                _, evicted = self._profilers.popitem(last=False)
+                evicted.stop()
+        profiler.start()
+        return profiler
+
+    def stop(self, job_id: str) -> Optional[SamplingProfiler]:
+        profiler = self._profilers.get(job_id)
+        if profiler:
+            profiler.stop()
+        return profiler
+
+    def get(self, job_id: str) -> Optional[SamplingProfiler]:
+        return self._profilers.get(job_id)
+
+
+profile_store = ProfileStore(settings.profiling_retention_jobs)
@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from app.config import settings
+
+# Trace of the job running in the current task; None outside analysis jobs
+_current_trace: contextvars.ContextVar[Optional["JobTrace"]] = contextvars.ContextVar("job_trace", default=None)
+_current_span: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("job_trace_span", default=None)
+
+
+class JobTrace:
+    """Span tree for one analysis job, exported in Chrome trace event format
+
+    Spans cover pipeline stages ("stage"), CPU-bound phases ("cpu") and
+    external calls ("http", "llm"). Each span records wall time, thread CPU
+    time and free-form args such as status, retries and bytes. Spans past
+    `job_trace_max_spans` are counted but not kept.
+    """
+
+    def __init__(self, job_id: str, max_spans: Optional[int] = None):
+        self.job_id = job_id
+        self.max_spans = max_spans or settings.job_trace_max_spans
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.dropped = 0
+        self._lanes: Dict[int, int] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self) -> Iterator["JobTrace"]:
+        """Make this the trace that `span()` records into for the current task"""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    @contextmanager
+    def span(self, name: str, category: str, **args) -> Iterator[Dict]:
+        """Time a block; the yielded args dict can be filled in while it runs"""
+        span_id = next(self._ids)
+        parent = _current_span.get()
+        token = _current_span.set(span_id)
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield args
+        except BaseException as e:
+            args.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            self._add({
+                "id": span_id,
+                "parent": parent,
+                "name": name,
+                "cat": category,
+                "ts": (started - self.started) * 1e6,
+                "dur": (time.perf_counter() - started) * 1e6,
+                "cpu_ms": round((time.thread_time() - cpu_started) * 1000, 3),
+                "lane": self._lane(),
+                "args": args,
+            })
+
+    def _add(self, span: Dict):
+        with self._lock:
+            if len(self.spans) >= self.max_spans:
+                self.dropped += 1
+            else:
+                self.spans.append(span)
+
+    def _lane(self) -> int:
+        """Chrome nests "X" events per thread id, so concurrent tasks get their own lane"""
+        try:
+            key = id(asyncio.current_task())
+        except RuntimeError:
+            key = threading.get_ident()
+        with self._lock:
+            return self._lanes.setdefault(key, len(self._lanes) + 1)
+
+    def to_chrome_trace(self) -> Dict:
+        """Export as Chrome trace JSON, loadable in Perfetto or chrome://tracing"""
+        events = [{
+            "name": "thread_name", "ph": "M", "pid": 1, "tid": lane,
+            "args": {"name": "pipeline" if lane == 1 else f"task {lane}"}
+        } for lane in sorted(set(self._lanes.values()))]
+        for span in sorted(self.spans, key=lambda s: s["ts"]):
+            events.append({
+                "name": span["name"],
+                "cat": span["cat"],
+                "ph": "X",
+                "ts": round(span["ts"], 1),
+                "dur": round(span["dur"], 1),
+                "pid": 1,
+                "tid": span["lane"],
+                "args": {**span["args"], "span_id": span["id"], "parent_id": span["parent"], "cpu_ms": span["cpu_ms"]},
+            })
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"job_id": self.job_id, "spans": len(self.spans), "dropped_spans": self.dropped},
+        }
+
+
+@contextmanager
+def span(name: str, category: str, **args) -> Iterator[Dict]:
+    """Record a span in the current job's trace; a no-op outside analysis jobs"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield args
+        return
+    with trace.span(name, category, **args) as span_args:
+        yield span_args
+
+
+class TraceStore:
+    """Keep traces for the most recent jobs within the retention budget"""
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self._traces: "OrderedDict[str, JobTrace]" = OrderedDict()
+
+    def create(self, job_id: str) -> JobTrace:
+        trace = JobTrace(job_id)
+        self._traces[job_id] = trace
+        while len(self._traces) > self.max_jobs:
+            self._traces.popitem(last=False)
+        return trace
+
+    def get(self, job_id: str) -> Optional[JobTrace]:
+        return self._traces.get(job_id)
+
+
+trace_store = TraceStore(settings.job_trace_retention_jobs)
@@ -0,0 +1,100 @@
+import json
+from typing import Callable, List, Optional, Tuple, Union
+
+PathPart = Union[str, int]
+
+
+class IncrementalJSONParser:
+    """Report JSON values as soon as they close while the document is still streaming
+
+    Feed text chunks as they arrive; whenever an object or array ends at a
+    path accepted by `match`, it is decoded on its own and passed to
+    `on_value(path, value)`. Paths list object keys and array indexes from
+    the root, e.g. ("P3", "failure_modes", 0). Only structure is tracked
+    between values, and text is kept only from the oldest open container
+    that will be decoded, so the buffer stays the size of one value rather
+    than the whole response.
+    """
+
+    def __init__(self, on_value: Callable[[Tuple[PathPart, ...], object], None],
+                 match: Optional[Callable[[Tuple[PathPart, ...]], bool]] = None):
+        self.on_value = on_value
+        self.match = match or (lambda path: True)
+        self.buffer = ""
+        self._pos = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        # Open containers: [kind, start offset (None unless it will be decoded), key or index, expecting a key]
+        self._stack: List[list] = []
+
+    def feed(self, chunk: str):
+        self.buffer += chunk
+        buffer = self.buffer
+        stack = self._stack
+        i = self._pos
+        end = len(buffer)
+
+        while i < end:
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    top = stack[-1] if stack else None
+                    if top and top[0] == "object" and top[3]:
+                        top[2] = json.loads(buffer[self._string_start:i + 1])
+                        top[3] = False
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+            elif char in "{[":
+                # A container's path cannot change while it is open, so decide now whether to keep its text
+                start = i if self.match(tuple(frame[2] for frame in stack)) else None
+                if char == "{":
+                    stack.append(["object", start, None, True])
+                else:
+                    stack.append(["array", start, 0, False])
+            elif char == ",":
+                if stack:
+                    top = stack[-1]
+                    if top[0] == "object":
+                        top[3] = True
+                    else:
+                        top[2] += 1
+            elif char in "}]":
+                if stack:
+                    closed = stack.pop()
+                    if closed[1] is not None:
+                        try:
+                            value = json.loads(buffer[closed[1]:i + 1])
+                        except ValueError:
+                            pass  # Malformed fragment; the final parse decides
+                        else:
+                            self.on_value(tuple(frame[2] for frame in stack), value)
+            i += 1
+
+        self._compact(i)
+
+    def _compact(self, pos: int):
+        """Drop buffered text that no open container or pending key can refer to"""
+        keep = pos
+        for frame in self._stack:
+            if frame[1] is not None:
+                keep = frame[1]
+                break
+        else:
+            top = self._stack[-1] if self._stack else None
+            if self._in_string and top and top[0] == "object" and top[3]:
+                keep = self._string_start
+
+        if keep:
+            self.buffer = self.buffer[keep:]
+            self._string_start -= keep
+            for frame in self._stack:
+                if frame[1] is not None:
+                    frame[1] -= keep
+        self._pos = pos - keep
@@ -0,0 +1,41 @@
+from functools import lru_cache
+from typing import Iterable, List, Optional, Set, Tuple
+
+# Keyword sets here are small (a dozen experimental keywords, a few dozen
+# library names), and one C-level substring search per keyword beats a
+# Python-level Aho-Corasick pass until a set reaches a few hundred keywords;
+# see benchmarks/bench_keyword_matcher.py
+
+
+class KeywordMatcher:
+    """Find which of a fixed set of keywords occur in a text"""
+
+    __slots__ = ("keywords",)
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = list(dict.fromkeys(k for k in keywords if k))
+
+    def find_all(self, text: str, limit: Optional[int] = None) -> Set[str]:
+        """Get the distinct keywords occurring in text, stopping early at limit"""
+        found = set()
+        for keyword in self.keywords:
+            if keyword in text:
+                found.add(keyword)
+                if limit is not None and len(found) >= limit:
+                    break
+        return found
+
+    def count_distinct(self, text: str, limit: Optional[int] = None) -> int:
+        """Count distinct keywords occurring in text (capped at limit if given)"""
+        return len(self.find_all(text, limit))
+
+
+@lru_cache(maxsize=32)
+def get_matcher(keywords: Tuple[str, ...]) -> KeywordMatcher:
+    """Get a process-wide matcher for a keyword set, building it on first use"""
+    return KeywordMatcher(keywords)
+
+
+def normalize_library(name: str) -> str:
+    """Normalize a package or import name for library lookups"""
+    return name.lower().replace('-', '').replace('_', '').replace('.', '')
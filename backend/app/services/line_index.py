@@ -0,0 +1,35 @@
+from bisect import bisect_right
+from typing import List, Tuple
+
+
+class LineIndex:
+    """Map character offsets in a source file to 1-based line and column numbers"""
+
+    __slots__ = ("offsets",)
+
+    def __init__(self, content: str):
+        # offsets[i] is the character offset where line i + 1 starts
+        offsets = [0]
+        find = content.find
+        pos = find('\n')
+        while pos != -1:
+            offsets.append(pos + 1)
+            pos = find('\n', pos + 1)
+        self.offsets: List[int] = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def line_of(self, offset: int) -> int:
+        """Get the 1-based line containing a character offset"""
+        return bisect_right(self.offsets, offset)
+
+    def line_col(self, offset: int) -> Tuple[int, int]:
+        """Get the 1-based (line, column) for a character offset"""
+        line = bisect_right(self.offsets, offset)
+        return line, offset - self.offsets[line - 1] + 1
+
+
+def format_location(path: str, line: int) -> str:
+    """Format a code location the way reports display it"""
+    return f"{path}:{line}"
@@ -0,0 +1,301 @@
+import abc
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+from anthropic import AsyncAnthropic
+from openai import AsyncOpenAI
+from app.config import settings
+
+
+async def _next_chunk(generator: AsyncIterator[str]) -> Optional[str]:
+    """Next chunk of a stream, or None at its end"""
+    try:
+        return await generator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class LLMProvider(abc.ABC):
+    """One chat backend that streams a JSON completion as text chunks
+
+    `stream()` fills the `args` dict it is given with status, retries and
+    token usage, so callers can pass a job trace span's args straight in.
+    """
+
+    name = "provider"
+
+    def __init__(self, model: str):
+        self.model = model
+
+    @abc.abstractmethod
+    def stream(self, system: str, prompt: str, args: Dict) -> AsyncIterator[str]:
+        """Stream the completion's text; implemented as an async generator"""
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI, or any OpenAI-compatible endpoint when `base_url` is set"""
+
+    def __init__(self, model: str, api_key: str, base_url: Optional[str] = None, name: str = "openai",
+                 client: Optional[AsyncOpenAI] = None):
+        super().__init__(model)
+        self.name = name
+        self.client = client or AsyncOpenAI(api_key=api_key, base_url=base_url or None)
+
+    async def stream(self, system: str, prompt: str, args: Dict) -> AsyncIterator[str]:
+        # The raw response exposes status and retries for the job trace
+        raw = await self.client.chat.completions.with_raw_response.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt}
+            ],
+            response_format={"type": "json_object"},
+            temperature=0.3,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        args["status"] = raw.status_code
+        args["retries"] = raw.retries_taken
+
+        stream = raw.parse()
+        try:
+            async for chunk in stream:
+                for choice in chunk.choices:
+                    if choice.delta.content:
+                        yield choice.delta.content
+                if chunk.usage:
+                    args["prompt_tokens"] = chunk.usage.prompt_tokens
+                    args["completion_tokens"] = chunk.usage.completion_tokens
+        finally:
+            # Release the connection when a hedge loser is cancelled mid-stream
+            await stream.close()
+
+
+class AnthropicProvider(LLMProvider):
+    """Anthropic Messages API; the reply is prefilled with "{" to keep it to JSON"""
+
+    name = "anthropic"
+
+    def __init__(self, model: str, api_key: str, client: Optional[AsyncAnthropic] = None):
+        super().__init__(model)
+        self.client = client or AsyncAnthropic(api_key=api_key)
+
+    async def stream(self, system: str, prompt: str, args: Dict) -> AsyncIterator[str]:
+        raw = await self.client.messages.with_raw_response.create(
+            model=self.model,
+            system=system,
+            messages=[
+                {"role": "user", "content": prompt},
+                {"role": "assistant", "content": "{"}
+            ],
+            max_tokens=settings.anthropic_max_tokens,
+            temperature=0.3,
+            stream=True
+        )
+        args["status"] = raw.status_code
+        args["retries"] = getattr(raw, "retries_taken", 0)
+
+        stream = raw.parse()
+        try:
+            yield "{"
+            async for event in stream:
+                if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                    yield event.delta.text
+                elif event.type == "message_start":
+                    args["prompt_tokens"] = event.message.usage.input_tokens
+                elif event.type == "message_delta":
+                    args["completion_tokens"] = event.usage.output_tokens
+        finally:
+            await stream.close()
+
+
+class ProviderHealth:
+    """Recent time-to-first-chunk and failure streak for one provider"""
+
+    def __init__(self):
+        self.latencies = deque(maxlen=settings.llm_latency_window)
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.hedge_wins = 0
+        self.unhealthy_until = 0.0
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def success(self, latency: float):
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.latencies.append(latency)
+
+    def failure(self):
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        # Sit out a cooldown after repeated failures instead of failing every job through it
+        if self.consecutive_failures >= settings.llm_failure_threshold:
+            self.unhealthy_until = time.monotonic() + settings.llm_failure_cooldown
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self) -> Optional[float]:
+        """Learned p95 time to first chunk; None until enough samples are in"""
+        if len(self.latencies) < settings.llm_hedge_min_samples:
+            return None
+        return self.quantile(0.95)
+
+    def to_dict(self) -> Dict:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "healthy": self.available(),
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "hedge_wins": self.hedge_wins,
+            "ttft_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "ttft_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+
+class LLMRouter:
+    """Route completions across providers with failover and hedged requests
+
+    Providers are tried in order, skipping ones cooling down after repeated
+    failures; an error before the first chunk fails over to the next. With
+    hedging on, a second provider is started once the first goes past its
+    learned p95 time to first chunk, and whichever starts streaming first
+    is kept. Hedges are capped at `llm_hedge_max_fraction` of requests.
+    Errors after streaming has started are raised to the caller, since
+    part of the response has already been consumed.
+    """
+
+    def __init__(self, providers: List[LLMProvider]):
+        self.providers = providers
+        self.health: Dict[str, ProviderHealth] = {p.name: ProviderHealth() for p in providers}
+        self.requests = 0
+        self.hedges = 0
+
+    def configured(self) -> bool:
+        return bool(self.providers)
+
+    def _candidates(self) -> List[LLMProvider]:
+        healthy = [p for p in self.providers if self.health[p.name].available()]
+        # With every provider cooling down, still try them all rather than fail outright
+        return healthy or list(self.providers)
+
+    def _hedge_allowed(self) -> bool:
+        return settings.llm_hedging_enabled and self.hedges < settings.llm_hedge_max_fraction * self.requests
+
+    async def stream(self, system: str, prompt: str, args: Dict) -> AsyncIterator[str]:
+        """Stream a completion from the fastest healthy provider; fills args like LLMProvider.stream"""
+        self.requests += 1
+        candidates = self._candidates()
+        error: Optional[BaseException] = None
+
+        while candidates:
+            primary = candidates.pop(0)
+            try:
+                winner, generator, first, provider_args = await self._first_chunk(primary, candidates, system, prompt)
+            except Exception as e:
+                error = e
+                continue  # Nothing streamed yet, so fail over to the next provider
+
+            args.update(provider_args, provider=winner.name, model=winner.model)
+            if winner is not primary:
+                candidates.remove(winner)
+            yield first
+            try:
+                async for chunk in generator:
+                    yield chunk
+            except Exception:
+                self.health[winner.name].failure()
+                raise
+            args.update(provider_args)
+            return
+
+        raise error or RuntimeError("No LLM providers configured")
+
+    async def _first_chunk(self, primary: LLMProvider, others: List[LLMProvider], system: str, prompt: str):
+        """Start `primary` (and maybe a hedge) and return the first provider to stream"""
+        started = time.monotonic()
+        attempts = {}
+
+        def start(provider: LLMProvider):
+            provider_args = {}
+            generator = provider.stream(system, prompt, provider_args)
+            task = asyncio.ensure_future(_next_chunk(generator))
+            attempts[task] = (provider, generator, provider_args, time.monotonic())
+
+        start(primary)
+        delay = self.health[primary.name].hedge_delay()
+        hedge = next((p for p in others if self.health[p.name].available()), None)
+        hedge_at = None if delay is None or hedge is None else started + delay
+
+        try:
+            while attempts:
+                timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    if self._hedge_allowed():
+                        self.hedges += 1
+                        start(hedge)
+                    continue
+
+                for task in done:
+                    provider, generator, provider_args, attempt_started = attempts.pop(task)
+                    try:
+                        first = task.result()
+                        if first is None:
+                            raise RuntimeError(f"{provider.name} returned an empty response")
+                    except Exception:
+                        self.health[provider.name].failure()
+                        if not attempts:
+                            raise
+                        continue
+
+                    self.health[provider.name].success(time.monotonic() - attempt_started)
+                    provider_args["hedged"] = bool(attempts) or provider is not primary
+                    if provider is not primary:
+                        self.health[provider.name].hedge_wins += 1
+                    return provider, generator, first, provider_args
+        finally:
+            # Cancel the losing call so it stops consuming tokens
+            for task, (_, generator, _, _) in attempts.items():
+                task.cancel()
+                try:
+                    await task
+                except BaseException:
+                    pass
+                await generator.aclose()
+
+    def status(self) -> Dict:
+        return {
+            "providers": [{"name": p.name, "model": p.model, **self.health[p.name].to_dict()} for p in self.providers],
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedging_enabled": settings.llm_hedging_enabled,
+        }
+
+
+def build_providers() -> List[LLMProvider]:
+    """Providers with credentials configured, in `llm_providers` order"""
+    available = {}
+    if settings.openai_api_key:
+        available["openai"] = lambda: OpenAIProvider(settings.openai_extraction_model, settings.openai_api_key)
+    if settings.anthropic_api_key:
+        available["anthropic"] = lambda: AnthropicProvider(settings.anthropic_extraction_model, settings.anthropic_api_key)
+    if settings.llm_local_base_url:
+        available["local"] = lambda: OpenAIProvider(
+            settings.llm_local_model, settings.llm_local_api_key or "local", settings.llm_local_base_url, name="local"
+        )
+    order = [name.strip() for name in settings.llm_providers.split(",") if name.strip()]
+    return [available[name]() for name in order if name in available]
+
+
+llm_router = LLMRouter(build_providers())
@@ -0,0 +1,144 @@
+import itertools
+import re
+import zlib
+from array import array
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from app.config import settings
+from app.services.paper_index import TOKEN_PATTERN, title_key
+
+# MinHash signature length and LSH banding: with 16 bands of 4 rows, pairs
+# whose abstracts are 0.7 similar (Jaccard) or more become candidates 99%
+# of the time, and pairs below 0.3 rarely do
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3  # Words per shingle
+
+# Multiply-shift hash functions: ((a * h + b) mod 2**64) >> 32 with odd a
+_rng = np.random.default_rng(1)
+_A = _rng.integers(0, 1 << 64, NUM_PERM, dtype=np.uint64, endpoint=False) | np.uint64(1)
+_B = _rng.integers(0, 1 << 64, NUM_PERM, dtype=np.uint64, endpoint=False)
+_EMPTY = np.uint64(1 << 32)  # Above every hash value
+
+# Trailing version markers on preprint titles ("... v2", "(extended version)")
+VERSION_SUFFIX = re.compile(r"(\s+v\d+|\s+(extended|full|long|preprint|arxiv) version)+$")
+
+
+def normalize_title(title: str) -> str:
+    return VERSION_SUFFIX.sub("", title_key(title))
+
+
+def minhash_signatures(texts: Sequence[str]) -> np.ndarray:
+    """(len(texts), NUM_PERM) MinHash signatures of word shingles, all texts in one pass
+
+    Texts shorter than a shingle get all-_EMPTY rows, which callers must not treat as similar.
+    """
+    word_hashes = array("q")
+    counts = np.zeros(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        words = TOKEN_PATTERN.findall(text.lower())
+        word_hashes.extend(map(zlib.crc32, map(str.encode, words)))
+        counts[i] = len(words)
+
+    signatures = np.full((len(texts), NUM_PERM), _EMPTY, dtype=np.uint64)
+    words = np.frombuffer(word_hashes, dtype=np.int64).astype(np.uint64)
+    owners = np.repeat(np.arange(len(texts)), counts)
+    # A shingle starts at every word followed by SHINGLE_SIZE - 1 more from the same text
+    starts = np.flatnonzero(owners[:len(owners) - SHINGLE_SIZE + 1] == owners[SHINGLE_SIZE - 1:]) \
+        if len(owners) >= SHINGLE_SIZE else np.empty(0, dtype=np.int64)
+    if not len(starts):
+        return signatures
+    shingles = np.zeros(len(starts), dtype=np.uint64)
+    for offset in range(SHINGLE_SIZE):
+        shingles = (shingles * np.uint64(0x9E3779B1) + words[starts + offset]) & np.uint64(0xFFFFFFFF)
+
+    # One row per hash function; uint64 arithmetic wraps, which is the mod 2**64
+    permuted = (np.outer(_A, shingles) + _B[:, None]) >> np.uint64(32)
+    shingle_owners = owners[starts]
+    first = np.flatnonzero(np.r_[True, shingle_owners[1:] != shingle_owners[:-1]])
+    signatures[shingle_owners[first]] = np.minimum.reduceat(permuted, first, axis=1).T
+    return signatures
+
+
+def duplicate_groups(papers: Sequence[Dict], threshold: float) -> List[List[int]]:
+    """Indices of papers that are the same work, grouped, in order of first appearance
+
+    Papers match on normalised titles, or when the MinHash estimate of
+    their abstracts' Jaccard similarity reaches `threshold`. LSH buckets
+    keep comparisons to likely pairs instead of every pair.
+    """
+    parent = list(range(len(papers)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int):
+        i, j = find(i), find(j)
+        if i != j:
+            parent[max(i, j)] = min(i, j)
+
+    by_title: Dict[str, int] = {}
+    for i, paper in enumerate(papers):
+        key = normalize_title(paper.get("title") or "")
+        if key:
+            union(by_title.setdefault(key, i), i)
+
+    signatures = minhash_signatures([paper.get("abstract") or "" for paper in papers])
+    with_text = np.flatnonzero(signatures[:, 0] != _EMPTY)
+    candidates = set()
+    for band in range(BANDS):
+        rows = np.ascontiguousarray(signatures[with_text, band * ROWS:(band + 1) * ROWS])
+        keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * ROWS))).ravel()
+        _, bucket, sizes = np.unique(keys, return_inverse=True, return_counts=True)
+        members = with_text[np.argsort(bucket, kind="stable")]
+        starts = np.concatenate([[0], np.cumsum(sizes)])
+        for shared in np.flatnonzero(sizes > 1):
+            candidates.update(itertools.combinations(members[starts[shared]:starts[shared + 1]].tolist(), 2))
+    for i, j in candidates:
+        if find(i) != find(j) and np.mean(signatures[i] == signatures[j]) >= threshold:
+            union(i, j)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(papers)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def merge_papers(group: Sequence[Dict]) -> Dict:
+    """One record for the same paper found through several sources
+
+    The best-cited copy leads (it usually carries the publisher's URL); the
+    record keeps the highest citation count, the fullest abstract and
+    author list, and every source's URL.
+    """
+    lead = max(group, key=lambda paper: paper.get("citation_count") or 0)
+    merged = dict(lead)
+    merged["technique"] = group[0].get("technique", lead.get("technique"))
+    merged["citation_count"] = max(paper.get("citation_count") or 0 for paper in group)
+    merged["abstract"] = max((paper.get("abstract") or "" for paper in group), key=len)
+    merged["authors"] = max((paper.get("authors") or [] for paper in group), key=len)
+    merged["is_experimental"] = any(paper.get("is_experimental") for paper in group)
+    merged["relevance_score"] = max(paper.get("relevance_score") or 0.0 for paper in group)
+    # Records merged earlier (e.g. per technique) bring every URL and source they already had
+    merged["urls"] = list(dict.fromkeys(
+        url for paper in group for url in paper.get("urls") or [paper.get("url")] if url
+    ))
+    merged["sources"] = list(dict.fromkeys(
+        source for paper in group for source in paper.get("sources") or [paper.get("source")] if source
+    ))
+    return merged
+
+
+def deduplicate_papers(papers: Sequence[Dict], threshold: Optional[float] = None) -> List[Dict]:
+    """Papers with near-duplicates merged, in order of first appearance"""
+    if len(papers) < 2:
+        return list(papers)
+    threshold = settings.near_duplicate_threshold if threshold is None else threshold
+    return [
+        papers[group[0]] if len(group) == 1 else merge_papers([papers[i] for i in group])
+        for group in duplicate_groups(papers, threshold)
+    ]
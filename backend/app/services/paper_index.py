@@ -0,0 +1,508 @@
+import argparse
+import gzip
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.services.embedding_index import (
+    EmbeddingIndex, HashingEmbedder, model_embedder, query_embedder, write_embeddings
+)
+
+INDEX_FORMAT = "paper-index/1"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+TOKEN_RUN = re.compile(r"[a-z0-9]{2,}")  # TOKEN_PATTERN matches longer than one character
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or our that the their this to "
+    "using via was we were which with".split()
+)
+
+# Title terms are counted this many times
+TITLE_WEIGHT = 2
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+
+def document_tokens(paper: Dict) -> List[str]:
+    """A paper's indexed tokens; title terms are repeated as a cheap field boost"""
+    return tokenize(paper["title"]) * TITLE_WEIGHT + tokenize(paper["abstract"])
+
+
+def term_counts(title: str, abstract: str) -> Tuple[Counter, int]:
+    """A paper's term frequencies and length exactly as document_tokens counts them, at C speed
+
+    Runs of two or more characters are the tokens tokenize keeps before
+    dropping stopwords, and Counter tallies them without a Python-level loop.
+    """
+    counts = Counter(TOKEN_RUN.findall(title.lower()) * TITLE_WEIGHT)
+    counts.update(TOKEN_RUN.findall(abstract.lower()))
+    for stopword in STOPWORDS & counts.keys():
+        del counts[stopword]
+    return counts, sum(counts.values())
+
+
+def document_text(paper: Dict) -> str:
+    """What a sentence embedding model reads for a paper"""
+    return f"{paper['title']}. {paper['abstract']}"
+
+
+def bm25_idf(papers: int, df: int) -> float:
+    return math.log(1 + (papers - df + 0.5) / (df + 0.5))
+
+
+def normalize_paper(record) -> Optional[Dict]:
+    """Map a paper from any supported source to the index's record shape, or None if unusable
+
+    Accepts Semantic Scholar Graph API items and dataset rows, arXiv
+    metadata snapshot rows, arxiv.Result objects and records already in
+    index shape.
+    """
+    if hasattr(record, "entry_id"):  # arxiv.Result
+        return _paper(record.title, record.summary, record.published.year,
+                      [a.name for a in record.authors], 0, record.entry_id, "arxiv")
+    if not isinstance(record, dict):
+        return None
+
+    if "versions" in record or "update_date" in record:  # arXiv metadata snapshot
+        year = None
+        if record.get("versions"):
+            created = record["versions"][0].get("created", "")
+            match = re.search(r"\b(19|20)\d{2}\b", created)
+            year = int(match.group()) if match else None
+        if year is None and record.get("update_date"):
+            year = int(record["update_date"][:4])
+        authors = record.get("authors_parsed")
+        names = [" ".join(reversed([part for part in a[:2] if part])) for a in authors] if authors \
+            else [name.strip() for name in (record.get("authors") or "").split(",")]
+        return _paper(record.get("title"), record.get("abstract"), year, names, 0,
+                      f"https://arxiv.org/abs/{record.get('id', '')}", "arxiv")
+
+    # Semantic Scholar (Graph API items, dataset rows) or index records
+    paper_id = record.get("paperId") or record.get("corpusid") or record.get("corpusId")
+    url = record.get("url") or (f"https://www.semanticscholar.org/paper/{paper_id}" if paper_id else "")
+    authors = [a.get("name", "") if isinstance(a, dict) else str(a) for a in record.get("authors") or []]
+    citations = record.get("citation_count", record.get("citationCount", record.get("citationcount", 0)))
+    return _paper(record.get("title"), record.get("abstract"), record.get("year"), authors, citations or 0,
+                  url, record.get("source", "semantic_scholar"))
+
+
+def _paper(title, abstract, year, authors, citations, url, source) -> Optional[Dict]:
+    if not title or not abstract or not year:
+        return None
+    return {
+        "title": " ".join(title.split()),
+        "abstract": " ".join(abstract.split()),
+        "year": int(year),
+        "authors": [a for a in authors if a][:3],
+        "citation_count": int(citations),
+        "url": url,
+        "source": source,
+    }
+
+
+def title_key(title: str) -> str:
+    return " ".join(TOKEN_PATTERN.findall(title.lower()))
+
+
+def read_dump(path: Path) -> Iterator[Dict]:
+    """Records from a JSON Lines dump (optionally gzipped) or a JSON array file"""
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == "[":
+            yield from json.load(f)
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # Skip truncated or malformed lines in large dumps
+
+
+class PaperIndexWriter:
+    """Build a paper index directory; papers whose titles repeat are kept once
+
+    Layout (integers in native byte order, as written by `array`):
+    - docs.jsonl: one paper per line, docs.offsets: uint64 line offsets
+    - years.bin: uint16 per paper, lengths.bin: uint32 weighted token count
+    - postings.bin: (paper, term frequency) uint32 pairs, grouped by term
+    - lexicon.json: term -> [offset into postings in pairs, document frequency]
+    - meta.json: format, counts and average length
+    - embedding vectors for vector search (see write_embeddings)
+
+    Papers are held in memory until `write`, so peak memory grows with the
+    corpus; embedding vectors are streamed to disk in blocks. This is why
+    PaperIndexStore.merge batches live-search papers instead of rebuilding
+    for each handful.
+    """
+
+    def __init__(self):
+        self.papers: List[Dict] = []
+        self._titles = set()
+
+    def add(self, record) -> bool:
+        paper = normalize_paper(record)
+        if paper is None:
+            return False
+        key = title_key(paper["title"])
+        if key in self._titles:
+            return False
+        self._titles.add(key)
+        self.papers.append(paper)
+        return True
+
+    def add_all(self, records: Iterable) -> int:
+        return sum(self.add(record) for record in records)
+
+    def write(self, path: Path):
+        """Write the index next to `path` and swap it in, so open readers never see a partial index"""
+        path = Path(path)
+        staging = path.with_name(path.name + ".tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+
+        postings: Dict[str, List[int]] = {}
+        offsets = array("Q")
+        years = array("H")
+        lengths = array("I")
+        with open(staging / "docs.jsonl", "wb") as docs:
+            for doc_id, paper in enumerate(self.papers):
+                offsets.append(docs.tell())
+                docs.write(json.dumps(paper, ensure_ascii=False).encode() + b"\n")
+                years.append(paper["year"])
+
+                counts: Dict[str, int] = {}
+                for token in document_tokens(paper):
+                    counts[token] = counts.get(token, 0) + 1
+                lengths.append(sum(counts.values()))
+                for token, count in counts.items():
+                    postings.setdefault(token, []).extend((doc_id, count))
+            offsets.append(docs.tell())
+
+        lexicon = {}
+        position = 0
+        with open(staging / "postings.bin", "wb") as f:
+            for term in sorted(postings):
+                pairs = array("I", postings[term])
+                lexicon[term] = [position, len(pairs) // 2]
+                position += len(pairs) // 2
+                pairs.tofile(f)
+
+        for name, values in (("docs.offsets", offsets), ("years.bin", years), ("lengths.bin", lengths)):
+            with open(staging / name, "wb") as f:
+                values.tofile(f)
+        with open(staging / "lexicon.json", "w", encoding="utf-8") as f:
+            json.dump(lexicon, f, separators=(",", ":"))
+        if settings.embedding_index_enabled and self.papers:
+            papers = len(self.papers)
+            embedder = model_embedder(settings.embedding_model) or HashingEmbedder(
+                settings.embedding_dim,
+                lambda term: bm25_idf(papers, lexicon[term][1]) if term in lexicon else 0.0
+            )
+            documents = map(document_tokens if embedder.tokenized else document_text, self.papers)
+            write_embeddings(staging, documents, papers, embedder, settings.embedding_ivf_min_papers)
+        with open(staging / "meta.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "format": INDEX_FORMAT,
+                "papers": len(self.papers),
+                "terms": len(lexicon),
+                "avg_length": sum(lengths) / len(lengths) if lengths else 0.0,
+                "built": datetime.now().isoformat(),
+            }, f)
+
+        previous = path.with_name(path.name + ".old")
+        shutil.rmtree(previous, ignore_errors=True)
+        if path.exists():
+            os.replace(path, previous)
+        os.replace(staging, path)
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+class PaperIndex:
+    """Read-only BM25 search over a paper index directory
+
+    The lexicon, years and lengths are loaded; postings and papers are
+    memory-mapped and only the pages a query touches are read.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != INDEX_FORMAT:
+            raise ValueError(f"Unsupported paper index format: {self.meta.get('format')}")
+        with open(self.path / "lexicon.json", encoding="utf-8") as f:
+            self.lexicon: Dict[str, List[int]] = json.load(f)
+        self.offsets = self._load_array("Q", "docs.offsets")
+        self.years = self._load_array("H", "years.bin")
+        self.lengths = self._load_array("I", "lengths.bin")
+        self.avg_length = self.meta["avg_length"] or 1.0
+        self._docs_file = open(self.path / "docs.jsonl", "rb")
+        self._postings_file = open(self.path / "postings.bin", "rb")
+        self._docs = self._map(self._docs_file)
+        self._postings = self._map(self._postings_file)
+        self._norm_np = None
+        self._years_np = None
+        self._embedder = None
+        self.embeddings = EmbeddingIndex(self.path) \
+            if (self.path / "embedding.json").exists() else None
+
+    def _load_array(self, typecode: str, name: str) -> array:
+        values = array(typecode)
+        with open(self.path / name, "rb") as f:
+            values.frombytes(f.read())
+        return values
+
+    @staticmethod
+    def _map(f) -> Optional[mmap.mmap]:
+        # Empty files can't be mapped
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else None
+
+    def __len__(self) -> int:
+        return len(self.years)
+
+    def paper(self, doc_id: int) -> Dict:
+        return json.loads(self._docs[self.offsets[doc_id]:self.offsets[doc_id + 1]])
+
+    def papers(self) -> Iterator[Dict]:
+        for doc_id in range(len(self)):
+            yield self.paper(doc_id)
+
+    def search(self, query: str, k: int = 10, min_year: Optional[int] = None) -> List[Tuple[float, Dict]]:
+        """Top-k papers for a query by BM25, best first, as (score, paper)"""
+        if self._postings is None:
+            return []
+        top = self._top_documents(query, k, min_year)
+        return [(round(float(score), 4), self.paper(int(doc_id))) for doc_id, score in top]
+
+    def _idf(self, df: int) -> float:
+        return bm25_idf(len(self), df)
+
+    def _term_idf(self, term: str) -> float:
+        entry = self.lexicon.get(term)
+        return self._idf(entry[1]) if entry else 0.0
+
+    def vector_search(self, texts: List[str], k: int = 10,
+                      min_year: Optional[int] = None) -> List[List[Tuple[float, Dict]]]:
+        """Top-k papers by embedding cosine similarity for each text, in one batched scan
+
+        Semantic when the index was built with a sentence embedding model;
+        with the hashing embedder it finds papers sharing words or word
+        prefixes with a text, not synonyms (see embedding_index).
+        """
+        if self.embeddings is None or not texts:
+            return [[] for _ in texts]
+        if self._embedder is None:
+            self._embedder = query_embedder(self.embeddings.meta, self._term_idf)
+            if self._embedder is None:
+                print(f"Paper index error: can't embed queries for {self.embeddings.meta.get('embedder')} vectors")
+                self.embeddings = None
+                return [[] for _ in texts]
+        queries = self._embedder.embed([tokenize(text) for text in texts] if self._embedder.tokenized else texts)
+        allowed = None
+        if min_year is not None:
+            allowed = np.frombuffer(self.years, dtype=np.uint16) >= min_year
+        results = self.embeddings.search(queries, k, allowed, probe=settings.embedding_ivf_probe)
+        return [[(round(score, 4), self.paper(doc_id)) for doc_id, score in hits] for hits in results]
+
+    def _top_documents(self, query: str, k: int, min_year: Optional[int]) -> List[Tuple[int, float]]:
+        """Score each term's postings as one vector operation over a dense score array"""
+        if self._norm_np is None:
+            # Length normalisation only depends on the paper, so it's computed once per index
+            lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float32)
+            self._norm_np = K1 * (1 - B) + (K1 * B / self.avg_length) * lengths
+            self._years_np = np.frombuffer(self.years, dtype=np.uint16)
+        scores = np.zeros(len(self), dtype=np.float32)
+        norm = self._norm_np
+        matched = False
+        for term in set(tokenize(query)):
+            entry = self.lexicon.get(term)
+            if entry is None:
+                continue
+            start, count = entry
+            pairs = np.frombuffer(self._postings, dtype=np.uint32, count=count * 2, offset=start * 8).reshape(-1, 2)
+            docs = pairs[:, 0]
+            tf = pairs[:, 1].astype(np.float32)
+            # A term lists each paper once, so plain fancy-index addition is safe
+            scores[docs] += self._idf(count) * tf * (K1 + 1) / (tf + norm[docs])
+            matched = True
+        if not matched:
+            return []
+        if min_year is not None:
+            scores[self._years_np < min_year] = 0
+        k = min(k, len(scores))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(doc_id, scores[doc_id]) for doc_id in top if scores[doc_id] > 0]
+
+    def close(self):
+        for mapped in (self._docs, self._postings):
+            if mapped is not None:
+                mapped.close()
+        self._docs_file.close()
+        self._postings_file.close()
+
+
+class PaperIndexStore:
+    """The process-wide paper index, reopened when it is rebuilt on disk"""
+
+    def __init__(self, path: Path, check_interval: float = 5.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._index: Optional[PaperIndex] = None
+        self._signature = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        # Live-search papers waiting for the next rebuild, by title key
+        self._pending: Dict[str, Dict] = {}
+        self._pending_since: Optional[float] = None
+        self._titles: set = set()
+        self._titles_index: Optional[PaperIndex] = None
+
+    def get(self) -> Optional[PaperIndex]:
+        """Current index, or None if there is none on disk"""
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            signature = self._meta_signature()
+            if signature != self._signature:
+                with self._lock:
+                    self._signature = signature
+                    # The old index is left to the garbage collector; searches may still hold it
+                    self._index = self._open() if signature else None
+        return self._index
+
+    def _meta_signature(self):
+        try:
+            stat = (self.path / "meta.json").stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_ino
+
+    def _open(self) -> Optional[PaperIndex]:
+        try:
+            return PaperIndex(self.path)
+        except (OSError, ValueError) as e:
+            print(f"Paper index error: {e}")
+            return None
+
+    def merge(self, records: Iterable) -> int:
+        """Queue papers not yet in the index and rebuild once enough have gathered; returns how many were written
+
+        A rebuild rewrites every paper, so it waits for
+        `paper_index_merge_min_new` new papers, or for the oldest queued one to
+        have waited `paper_index_merge_max_delay` seconds, instead of running on
+        every sweep that finds a handful.
+        """
+        index = self.get()
+        titles = self._titles_of(index)
+        for record in records:
+            paper = normalize_paper(record)
+            if paper is None:
+                continue
+            key = title_key(paper["title"])
+            if key not in titles and key not in self._pending:
+                self._pending[key] = paper
+                self._pending_since = self._pending_since or time.monotonic()
+        if not self._pending:
+            return 0
+        waited = time.monotonic() - self._pending_since
+        if index is not None and len(self._pending) < settings.paper_index_merge_min_new \
+                and waited < settings.paper_index_merge_max_delay:
+            return 0
+
+        writer = PaperIndexWriter()
+        if index is not None:
+            writer.add_all(index.papers())
+        added = writer.add_all(self._pending.values())
+        writer.write(self.path)
+        # Reopen now, carrying the title set over rather than rescanning the new index
+        self._last_check = 0.0
+        self._titles_index = self.get()
+        self._titles = titles | self._pending.keys()
+        self._pending = {}
+        self._pending_since = None
+        return added
+
+    def _titles_of(self, index: Optional[PaperIndex]) -> set:
+        """Title keys of the papers in `index`, read once per opened index"""
+        if index is None:
+            return set()
+        if index is not self._titles_index:
+            self._titles = {title_key(paper["title"]) for paper in index.papers()}
+            self._titles_index = index
+        return self._titles
+
+    def status(self) -> Dict:
+        index = self.get()
+        if index is None:
+            return {"path": str(self.path), "available": False, "pending_papers": len(self._pending)}
+        embeddings = index.embeddings.meta if index.embeddings is not None else None
+        return {"path": str(self.path), "available": True, **index.meta, "embeddings": embeddings,
+                "pending_papers": len(self._pending)}
+
+
+paper_index_store = PaperIndexStore(Path(settings.paper_index_dir))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Build or query the local paper index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build an index from Semantic Scholar / arXiv dumps (JSONL, .gz)")
+    build.add_argument("dumps", nargs="+", type=Path)
+    build.add_argument("--out", type=Path, default=Path(settings.paper_index_dir))
+    build.add_argument("--min-year", type=int, default=None)
+    build.add_argument("--append", action="store_true", help="Keep papers already in the index")
+    search = commands.add_parser("search", help="Run a BM25 or vector query")
+    search.add_argument("query")
+    search.add_argument("--index", type=Path, default=Path(settings.paper_index_dir))
+    search.add_argument("-k", type=int, default=10)
+    search.add_argument("--vector", action="store_true", help="Rank by embedding similarity instead of BM25")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        writer = PaperIndexWriter()
+        if args.append and (args.out / "meta.json").exists():
+            writer.add_all(PaperIndex(args.out).papers())
+        started = time.perf_counter()
+        for dump in args.dumps:
+            records = read_dump(dump)
+            if args.min_year:
+                records = (r for r in map(normalize_paper, records) if r and r["year"] >= args.min_year)
+            added = writer.add_all(records)
+            print(f"{dump}: {added} papers")
+        writer.write(args.out)
+        print(f"Wrote {len(writer.papers)} papers to {args.out} in {time.perf_counter() - started:.1f}s")
+    else:
+        index = PaperIndex(args.index)
+        started = time.perf_counter()
+        results = index.vector_search([args.query], args.k)[0] if args.vector \
+            else index.search(args.query, args.k)
+        elapsed = (time.perf_counter() - started) * 1000
+        for score, paper in results:
+            print(f"{score:8.3f}  {paper['year']}  {paper['title']}")
+        print(f"{len(results)} results in {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
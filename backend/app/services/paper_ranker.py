@@ -0,0 +1,120 @@
+import math
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.config import settings
+from app.services.paper_index import B, K1, term_counts, tokenize
+
+FEATURES = ("text_match", "recency", "citations", "experimental")
+
+
+@lru_cache(maxsize=settings.ranking_term_cache_entries)
+def _paper_terms(title: str, abstract: str) -> Tuple[np.ndarray, np.ndarray, int]:
+    """A paper's term hashes, their frequencies and its length, computed once per process
+
+    Jobs keep ranking the same papers (every job for a technique runs the
+    same searches), so tokenising is paid the first time a paper is seen.
+    Terms are kept as hashes so a pool's matches are found in one
+    vectorised lookup; str hashes are stable within a process.
+    """
+    counts, length = term_counts(title, abstract)
+    return (np.fromiter(map(hash, counts), dtype=np.int64, count=len(counts)),
+            np.fromiter(counts.values(), dtype=np.float64, count=len(counts)), length)
+
+
+def default_weights() -> Dict[str, float]:
+    return {
+        "text_match": settings.ranking_weight_text_match,
+        "recency": settings.ranking_weight_recency,
+        "citations": settings.ranking_weight_citations,
+        "experimental": settings.ranking_weight_experimental,
+    }
+
+
+class PaperRanker:
+    """Score a pool of candidate papers against the queries that found them, all at once
+
+    Every paper gets a row of features scaled to 0-1:
+    - text_match: BM25 of the paper against its query, IDF taken over the
+      pool, as a share of the best score the query's terms allow
+    - recency: halves every `ranking_recency_half_life` years
+    - citations: log-scaled, reaching 1 at `ranking_citation_scale`
+    - experimental: whether the paper reports experiments
+    The weighted sum, scaled to 0-100, becomes the paper's relevance_score.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, year: Optional[int] = None):
+        weights = {**default_weights(), **(weights or {})}
+        self.weights = np.array([weights[name] for name in FEATURES], dtype=np.float64)
+        self.year = year or datetime.now().year
+
+    def features(self, papers: Sequence[Dict], queries: Sequence[str]) -> np.ndarray:
+        """(len(papers), len(FEATURES)) matrix; queries[i] is the text paper i was searched with"""
+        matrix = np.zeros((len(papers), len(FEATURES)))
+        if not papers:
+            return matrix
+        matrix[:, 0] = self._text_match(papers, queries)
+        years = np.array([paper.get("year") or self.year for paper in papers], dtype=np.float64)
+        matrix[:, 1] = 0.5 ** (np.maximum(self.year - years, 0) / settings.ranking_recency_half_life)
+        citations = np.array([paper.get("citation_count") or 0 for paper in papers], dtype=np.float64)
+        matrix[:, 2] = np.minimum(1.0, np.log1p(citations) / math.log1p(settings.ranking_citation_scale))
+        matrix[:, 3] = [bool(paper.get("is_experimental")) for paper in papers]
+        return matrix
+
+    def _text_match(self, papers: Sequence[Dict], queries: Sequence[str]) -> np.ndarray:
+        # Columns are the query terms only; paper words no query uses can't affect the score
+        vocabulary: Dict[str, int] = {}
+        query_rows: Dict[str, int] = {}
+        query_columns: List[List[int]] = []
+        for query in queries:
+            if query not in query_rows:
+                query_rows[query] = len(query_columns)
+                query_columns.append([vocabulary.setdefault(term, len(vocabulary)) for term in set(tokenize(query))])
+        if not vocabulary:
+            return np.zeros(len(papers))
+
+        # Every paper's (term hash, frequency) pairs end to end, then kept where the term is a column
+        cached = [_paper_terms(paper["title"], paper["abstract"]) for paper in papers]
+        hashes = np.concatenate([terms for terms, _, _ in cached])
+        frequencies = np.concatenate([counts for _, counts, _ in cached])
+        lengths = np.array([length for _, _, length in cached], dtype=np.float64)
+        rows = np.repeat(np.arange(len(papers)), [len(terms) for terms, _, _ in cached])
+
+        vocabulary_hashes = np.array([hash(term) for term in vocabulary], dtype=np.int64)
+        order = np.argsort(vocabulary_hashes)
+        positions = np.minimum(np.searchsorted(vocabulary_hashes[order], hashes), len(order) - 1)
+        found = vocabulary_hashes[order][positions] == hashes
+        rows, columns, tf = rows[found], order[positions[found]], frequencies[found]
+
+        df = np.bincount(columns, minlength=len(vocabulary))
+        # Terms no candidate contains can't separate them, so they don't lower anyone's share
+        idf = np.where(df > 0, np.log(1 + (len(papers) - df + 0.5) / (df + 0.5)), 0.0)
+        norm = K1 * (1 - B + B * lengths / max(lengths.mean(), 1.0))
+
+        terms = np.zeros((len(query_columns), len(vocabulary)))
+        for i, query_terms in enumerate(query_columns):
+            terms[i, query_terms] = 1.0
+        paper_queries = np.array([query_rows[query] for query in queries], dtype=np.int64)
+        # A (paper, term) pair counts only if the term is in that paper's own query
+        weights = terms[paper_queries[rows], columns] * idf[columns]
+        matched = np.bincount(rows, weights=tf / (tf + norm[rows]) * weights, minlength=len(papers))
+        return matched / np.maximum((terms @ idf)[paper_queries], 1e-12)
+
+    def scores(self, papers: Sequence[Dict], queries: Sequence[str]) -> np.ndarray:
+        """Weighted feature sums, 0-100"""
+        return self.features(papers, queries) @ self.weights * (100 / max(self.weights.sum(), 1e-12))
+
+    def rank(self, papers: Sequence[Dict], queries: Sequence[str], k: int) -> List[Dict]:
+        """Best k papers, best first, with relevance_score set"""
+        if not papers or k <= 0:
+            return []
+        scores = self.scores(papers, queries)
+        k = min(k, len(papers))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        ranked = []
+        for i in top:
+            papers[i]["relevance_score"] = round(float(scores[i]), 1)
+            ranked.append(papers[i])
+        return ranked
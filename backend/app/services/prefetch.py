@@ -0,0 +1,157 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+from app.models.records import PaperRecord
+from app.services.budget import AnalysisBudget
+from app.services.insight_extractor import InsightExtractor
+from app.services.llm_router import llm_router
+from app.services.paper_index import paper_index_store
+from app.services.research_retriever import ResearchRetriever, research_sources
+from app.services.resilience import SourceUnavailable
+from app.services.rule_engine import rule_registry
+from app.services.result_cache import search_cache
+
+
+class ResearchPrefetcher:
+    """Keep search results (and their insights) for the known technique queries warm
+
+    Every `prefetch_interval` seconds, each search jobs would run is
+    refreshed once its cached result is older than `prefetch_refresh_after`
+    of the cache TTL, so jobs find it fresh. Requests go through the same
+    rate limiters as jobs, and only while a source's limiter is idle.
+    Prefetched papers then have insights extracted into the shared cache
+    and are added to the local paper index.
+    """
+
+    def __init__(self):
+        self.retriever = ResearchRetriever(AnalysisBudget("deep"))
+        self.sweeps = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.insight_papers = 0
+        self.indexed = 0
+        self.last_sweep_started: Optional[datetime] = None
+        self.last_sweep_duration: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def searches(self) -> List[Tuple[str, str, str]]:
+        """(technique type, source, query) for every search a job can run, in the order jobs run them"""
+        searches = []
+        for tech_type, queries in ResearchRetriever.TECHNIQUE_QUERIES.items():
+            searches.extend((tech_type, "semantic_scholar", query) for query in queries)
+            # Jobs only fall back to arXiv with the first query
+            searches.append((tech_type, "arxiv", queries[0]))
+        return searches
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Research prefetch error: {e}")
+            await asyncio.sleep(settings.prefetch_interval)
+
+    async def sweep(self):
+        """Refresh every search that is missing or close to expiring, then warm its insights"""
+        self.last_sweep_started = datetime.now()
+        started = time.monotonic()
+        refresh_after = settings.prefetch_refresh_after * search_cache.ttl
+        refreshed_types = set()
+
+        for tech_type, source_name, query in self.searches():
+            age = search_cache.age((source_name, query))
+            if age is not None and age < refresh_after:
+                continue
+            source = research_sources[source_name]
+            if source.breaker.state == "open":
+                continue
+            # Leave rate-limit capacity to jobs; prefetch only takes tokens nobody is waiting for
+            while not source.limiter.idle():
+                await asyncio.sleep(min(settings.prefetch_idle_poll, 1 / source.limiter.rate))
+            try:
+                await self.retriever.refresh(source_name, query)
+                self.refreshed += 1
+                refreshed_types.add(tech_type)
+            except SourceUnavailable:
+                self.failed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Research prefetch error for {query!r}: {e}")
+
+        if settings.prefetch_insights and llm_router.configured():
+            for tech_type in refreshed_types:
+                await self._warm_insights(tech_type)
+
+        if refreshed_types and settings.paper_index_accumulate:
+            # Grow the local index from live results; rebuilding is CPU-bound, so keep it off the loop
+            records = [record for results in search_cache.values() for record in results]
+            self.indexed += await asyncio.to_thread(paper_index_store.merge, records)
+
+        self.sweeps += 1
+        self.last_sweep_duration = round(time.monotonic() - started, 2)
+
+    async def _warm_insights(self, tech_type: str):
+        """Extract insights for the papers a job would get, from fresh cache entries only"""
+        queries = ResearchRetriever.TECHNIQUE_QUERIES[tech_type]
+        if any(search_cache.age(("semantic_scholar", query)) is None for query in queries):
+            return
+        # Jobs label papers with the technique's display name, as TechniqueDetector names it
+        technique_name = rule_registry.get().display_name(tech_type)
+        papers = []
+        for query in queries:
+            papers.extend(await self.retriever._search_semantic_scholar(query, technique_name))
+        extractor = InsightExtractor(AnalysisBudget("deep"))
+        await extractor.extract_from_papers(
+            [PaperRecord.from_dict(paper) for paper in papers[:settings.max_papers_per_technique]]
+        )
+        self.insight_papers += extractor.stats["papers"]
+
+    def status(self) -> Dict:
+        ttl = search_cache.ttl
+        entries = []
+        for tech_type, source_name, query in self.searches():
+            age = search_cache.age((source_name, query))
+            entries.append({
+                "technique": tech_type,
+                "source": source_name,
+                "query": query,
+                "age_seconds": round(age, 1) if age is not None else None,
+                "state": "missing" if age is None else "stale" if age > ttl else "fresh",
+            })
+        return {
+            "enabled": settings.prefetch_enabled,
+            "running": self.running,
+            "interval_seconds": settings.prefetch_interval,
+            "refresh_after_seconds": settings.prefetch_refresh_after * ttl,
+            "cache_ttl_seconds": ttl,
+            "sweeps": self.sweeps,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "insight_papers": self.insight_papers,
+            "indexed_papers": self.indexed,
+            "last_sweep_started": self.last_sweep_started.isoformat() if self.last_sweep_started else None,
+            "last_sweep_duration": self.last_sweep_duration,
+            "fresh": sum(1 for entry in entries if entry["state"] == "fresh"),
+            "entries": entries,
+        }
+
+
+research_prefetcher = ResearchPrefetcher()
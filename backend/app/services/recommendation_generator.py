@@ -1,15 +1,143 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime
 import re
+from app.config import settings
+from app.models.records import SEVERITIES, FailureModeRecord, RecommendationRecord, TechniqueRecord, normalize_level
+from app.services.insight_clusters import cluster_texts
+from app.services.symbol_index import SymbolIndex
+
+# Fix templates for latency anti-patterns found by TechniqueDetector
+ANTIPATTERN_FIXES = {
+    "sequential_await_in_loop": {
+        "type": "Critical",
+        "priority": 1,
+        "impact": "High",
+        "effort": "Low",
+        "title": "Run independent LLM calls concurrently",
+        "description": "LLM calls are awaited one at a time inside a loop, so total latency grows with every item.",
+        "action_steps": [
+            "Build the request coroutines first and await them together with asyncio.gather",
+            "Bound concurrency with an asyncio.Semaphore to stay within provider rate limits",
+            "Compare end-to-end latency before and after the change"
+        ],
+        "caveats": [
+            "Only calls that do not depend on each other's output can run concurrently; chained prompts must stay sequential",
+            "Unbounded gather can trip provider rate limits, so size the semaphore to your quota"
+        ],
+        "code_example": (
+            "semaphore = asyncio.Semaphore(8)\n\n"
+            "async def summarize(doc):\n"
+            "    async with semaphore:\n"
+            "        return await client.chat.completions.create(model=MODEL, messages=[...])\n\n"
+            "results = await asyncio.gather(*(summarize(doc) for doc in docs))"
+        ),
+    },
+    "client_per_request": {
+        "type": "Important",
+        "priority": 2,
+        "impact": "Medium",
+        "effort": "Low",
+        "title": "Reuse SDK clients across requests",
+        "description": "A new SDK client is built per call, which discards its connection pool and repeats TLS handshakes.",
+        "action_steps": [
+            "Create the client once at module level or at application startup",
+            "Pass the shared client into functions that need it",
+            "Check connection reuse under load"
+        ],
+        "caveats": [
+            "Clients created inside a worker process or per event loop may need to stay per-process rather than truly global",
+            "Per-request clients are sometimes deliberate (per-tenant API keys or base URLs); keep one client per configuration instead"
+        ],
+        "code_example": (
+            "client = AsyncOpenAI()  # module level, created once\n\n"
+            "async def answer(question):\n"
+            "    return await client.chat.completions.create(model=MODEL, messages=[...])"
+        ),
+    },
+    "sync_client_in_async": {
+        "type": "Critical",
+        "priority": 1,
+        "impact": "High",
+        "effort": "Low",
+        "title": "Use async clients inside async functions",
+        "description": "A blocking LLM call runs inside an async function and stalls the event loop for every concurrent request.",
+        "action_steps": [
+            "Switch to the async client (AsyncOpenAI, AsyncAnthropic) or the LangChain ainvoke/aembed methods",
+            "Await the call instead of calling it synchronously",
+            "Load test concurrent requests to confirm the event loop stays responsive"
+        ],
+        "caveats": [
+            "If the async function is only ever run from a script or a single-request worker, the blocking call costs little",
+            "Where no async client exists, move the call to asyncio.to_thread rather than leaving it on the loop"
+        ],
+        "code_example": (
+            "client = AsyncOpenAI()\n\n"
+            "async def handler(question):\n"
+            "    return await client.chat.completions.create(model=MODEL, messages=[...])"
+        ),
+    },
+    "unbatched_embedding": {
+        "type": "Important",
+        "priority": 2,
+        "impact": "High",
+        "effort": "Low",
+        "title": "Batch embedding requests",
+        "description": "Embeddings are requested one item per call inside a loop instead of sending the inputs as a batch.",
+        "action_steps": [
+            "Collect the texts and send them as one input list per request",
+            "Chunk very large inputs to respect the provider's batch size limit",
+            "Verify result order matches input order"
+        ],
+        "caveats": [
+            "Providers cap inputs and tokens per batch, so very large lists still need chunking",
+            "A single bad input can fail the whole batch; handle and retry failures per chunk"
+        ],
+        "code_example": (
+            "response = await client.embeddings.create(model=MODEL, input=texts)\n"
+            "vectors = [item.embedding for item in response.data]"
+        ),
+    },
+    "non_streaming_user_facing": {
+        "type": "Nice-to-have",
+        "priority": 3,
+        "impact": "Medium",
+        "effort": "Medium",
+        "title": "Stream responses in user-facing endpoints",
+        "description": "Request handlers wait for the full completion before responding, delaying the first visible token.",
+        "action_steps": [
+            "Pass stream=True and forward chunks as they arrive",
+            "Return a StreamingResponse (or server-sent events) from the handler",
+            "Track time to first token alongside total latency"
+        ],
+        "caveats": [
+            "Streaming only helps when a person or client consumes the output incrementally; background jobs gain nothing",
+            "Structured outputs (JSON, tool calls) need incremental parsing or must be buffered before use"
+        ],
+        "code_example": (
+            "stream = await client.chat.completions.create(model=MODEL, messages=[...], stream=True)\n"
+            "async for chunk in stream:\n"
+            "    yield chunk.choices[0].delta.content or \"\""
+        ),
+    },
+}
 
 class RecommendationGenerator:
     """Generate prioritized recommendations based on insights and codebase"""
 
-    def __init__(self, techniques: List[Dict], parsed_data: Dict, insights: List[Dict]):
+    def __init__(
+        self,
+        techniques: List[TechniqueRecord],
+        parsed_data: Dict,
+        insights: List[Dict],
+        symbol_index: Optional[SymbolIndex] = None
+    ):
         self.techniques = techniques
         self.parsed_data = parsed_data
         self.insights = insights
+        self.symbol_index = symbol_index or SymbolIndex.build(parsed_data)
+        self.symbol_index.register_techniques(techniques)
 
-    async def generate(self) -> Tuple[List[Dict], List[Dict]]:
+    async def generate(self) -> Tuple[List[RecommendationRecord], List[FailureModeRecord]]:
         """Generate recommendations and failure modes"""
         recommendations = []
         failure_modes = []
@@ -17,13 +145,7 @@ class RecommendationGenerator:
         # Extract all failure modes
         for insight in self.insights:
             for fm in insight.get("failure_modes", []):
-                failure_mode = {
-                    "description": fm.get("description", ""),
-                    "conditions": fm.get("conditions", ""),
-                    "severity": fm.get("severity", "Medium"),
-                    "mitigation": fm.get("mitigation", ""),
-                    "source_paper": insight["paper_title"]
-                }
+                failure_mode = self._failure_mode(fm, insight)
                 failure_modes.append(failure_mode)
 
                 # Generate recommendation for each failure mode
@@ -45,15 +167,46 @@ class RecommendationGenerator:
                 if rec:
                     recommendations.append(rec)
 
+        # Generate code-located fixes for detected latency anti-patterns
+        recommendations.extend(self._antipattern_recommendations())
+
         # Deduplicate and sort
         recommendations = self._deduplicate_recommendations(recommendations)
-        recommendations = sorted(recommendations, key=lambda x: (x["priority"], -self._impact_score(x)))
-
-        return recommendations[:10], failure_modes  # Limit to top 10
-
-    def _failure_mode_to_recommendation(self, failure_mode: Dict, insight: Dict) -> Dict:
+        recommendations = sorted(recommendations, key=lambda x: (x.priority, -self._impact_score(x)))
+
+        return recommendations[:10], self._deduplicate_failure_modes(failure_modes)  # Limit to top 10
+
+    def preview(
+        self, insight: Dict, section: str, item: Dict
+    ) -> Tuple[Optional[FailureModeRecord], Optional[RecommendationRecord]]:
+        """Turn one streamed insight item into (failure mode, recommendation) before generate() runs
+
+        `insight` needs only the paper metadata; `section` is "failure_modes",
+        "best_practices" or "recommendations". The final list from generate()
+        is still deduplicated and ranked over every insight.
+        """
+        if section == "failure_modes":
+            insight = {**insight, "failure_modes": [item]}
+            failure_mode = self._failure_mode(item, insight)
+            return failure_mode, self._failure_mode_to_recommendation(failure_mode, insight)
+        if section == "best_practices":
+            return None, self._best_practice_to_recommendation(item, insight)
+        if section == "recommendations":
+            return None, self._implementation_to_recommendation(item, insight)
+        return None, None
+
+    def _failure_mode(self, fm: Dict, insight: Dict) -> FailureModeRecord:
+        return FailureModeRecord(
+            description=str(fm.get("description") or ""),
+            conditions=str(fm.get("conditions") or ""),
+            severity=normalize_level(fm.get("severity"), SEVERITIES),
+            mitigation=str(fm.get("mitigation") or ""),
+            source_paper=insight["paper_title"]
+        )
+
+    def _failure_mode_to_recommendation(self, failure_mode: FailureModeRecord, insight: Dict) -> RecommendationRecord:
         """Convert failure mode to recommendation"""
-        severity = failure_mode.get("severity", "Medium")
+        severity = failure_mode.severity
 
         # Map severity to recommendation type
         if severity in ["Critical", "High"]:
@@ -66,96 +219,122 @@ class RecommendationGenerator:
         # Try to find code locations
         locations = self._find_relevant_code_locations(insight["technique"])
 
-        return {
-            "type": rec_type,
-            "title": f"Mitigate: {failure_mode['description']}",
-            "description": f"{failure_mode['description']}. {failure_mode['conditions']}",
-            "action_steps": [
-                failure_mode.get("mitigation", "Review implementation"),
+        return RecommendationRecord(
+            type=rec_type,
+            title=f"Mitigate: {failure_mode.description}",
+            description=f"{failure_mode.description}. {failure_mode.conditions}",
+            action_steps=[
+                failure_mode.mitigation or "Review implementation",
                 "Test the mitigation in staging",
                 "Monitor for the failure condition"
             ],
-            "code_example": None,
-            "evidence": {
+            code_example=None,
+            evidence={
                 "paper": insight["paper_title"],
-                "finding": failure_mode["description"],
+                "finding": failure_mode.description,
                 "year": str(insight["paper_year"])
             },
-            "impact": self._severity_to_impact(severity),
-            "effort": self._estimate_effort(failure_mode),
-            "confidence": "High" if insight.get("paper_year", 2023) >= 2023 else "Medium",
-            "caveats": self._generate_caveats(insight),
-            "code_locations": locations,
-            "priority": priority
-        }
-
-    def _best_practice_to_recommendation(self, best_practice: Dict, insight: Dict) -> Dict:
+            impact=self._severity_to_impact(severity),
+            effort=self._estimate_effort(failure_mode),
+            confidence="High" if insight.get("paper_year", 2023) >= 2023 else "Medium",
+            caveats=self._generate_caveats(insight),
+            code_locations=locations,
+            priority=priority
+        )
+
+    def _best_practice_to_recommendation(self, best_practice: Dict, insight: Dict) -> RecommendationRecord:
         """Convert best practice to recommendation"""
         locations = self._find_relevant_code_locations(insight["technique"])
 
-        return {
-            "type": "Important",
-            "title": best_practice.get("practice", "Implement best practice"),
-            "description": best_practice.get("rationale", ""),
-            "action_steps": self._generate_action_steps(best_practice),
-            "code_example": None,
-            "evidence": {
+        return RecommendationRecord(
+            type="Important",
+            title=str(best_practice.get("practice") or "Implement best practice"),
+            description=str(best_practice.get("rationale") or ""),
+            action_steps=self._generate_action_steps(best_practice),
+            code_example=None,
+            evidence={
                 "paper": insight["paper_title"],
-                "finding": best_practice.get("evidence", ""),
+                "finding": str(best_practice.get("evidence") or ""),
                 "year": str(insight["paper_year"])
             },
-            "impact": "Medium",
-            "effort": "Medium",
-            "confidence": "High" if insight.get("paper_year", 2023) >= 2023 else "Medium",
-            "caveats": self._generate_caveats(insight),
-            "code_locations": locations,
-            "priority": 2
-        }
-
-    def _implementation_to_recommendation(self, impl_rec: Dict, insight: Dict) -> Dict:
+            impact="Medium",
+            effort="Medium",
+            confidence="High" if insight.get("paper_year", 2023) >= 2023 else "Medium",
+            caveats=self._generate_caveats(insight),
+            code_locations=locations,
+            priority=2
+        )
+
+    def _implementation_to_recommendation(self, impl_rec: Dict, insight: Dict) -> RecommendationRecord:
         """Convert implementation recommendation to recommendation"""
-        impact = impl_rec.get("impact", "Medium")
-        effort = impl_rec.get("effort", "Medium")
+        impact = normalize_level(impl_rec.get("impact"))
+        effort = normalize_level(impl_rec.get("effort"))
 
         # Lower priority for optimizations
         priority = 3
 
         locations = self._find_relevant_code_locations(insight["technique"])
 
-        return {
-            "type": "Nice-to-have",
-            "title": impl_rec.get("recommendation", "Optimization opportunity"),
-            "description": f"Based on research findings from {insight['paper_title']}",
-            "action_steps": [
-                impl_rec.get("recommendation", ""),
+        return RecommendationRecord(
+            type="Nice-to-have",
+            title=str(impl_rec.get("recommendation") or "Optimization opportunity"),
+            description=f"Based on research findings from {insight['paper_title']}",
+            action_steps=[
+                str(impl_rec.get("recommendation") or ""),
                 "Measure baseline performance",
                 "Implement and compare results"
             ],
-            "code_example": None,
-            "evidence": {
+            code_example=None,
+            evidence={
                 "paper": insight["paper_title"],
-                "finding": impl_rec.get("recommendation", ""),
+                "finding": str(impl_rec.get("recommendation") or ""),
                 "year": str(insight["paper_year"])
             },
-            "impact": impact,
-            "effort": effort,
-            "confidence": "Medium",
-            "caveats": self._generate_caveats(insight),
-            "code_locations": locations,
-            "priority": priority
-        }
+            impact=impact,
+            effort=effort,
+            confidence="Medium",
+            caveats=self._generate_caveats(insight),
+            code_locations=locations,
+            priority=priority
+        )
+
+    def _antipattern_recommendations(self) -> List[RecommendationRecord]:
+        """Turn anti-pattern findings into one recommendation per kind, pointing at the code"""
+        findings_by_kind = {}
+        for tech in self.techniques:
+            for finding in tech.findings:
+                findings_by_kind.setdefault(finding["kind"], []).append(finding)
+
+        recommendations = []
+        for kind, findings in findings_by_kind.items():
+            fix = ANTIPATTERN_FIXES.get(kind)
+            if not fix:
+                continue
+            locations = list(dict.fromkeys(f["location"] for f in findings))
+            recommendations.append(RecommendationRecord(
+                type=fix["type"],
+                title=fix["title"],
+                description=f"{fix['description']} Found at {len(locations)} location(s).",
+                action_steps=fix["action_steps"],
+                code_example=fix["code_example"],
+                evidence={
+                    "paper": "Static analysis of this codebase",
+                    "finding": f"{findings[0]['message']} ({findings[0]['call']})",
+                    "year": str(datetime.now().year)
+                },
+                impact=fix["impact"],
+                effort=fix["effort"],
+                confidence="High",
+                caveats=fix["caveats"],
+                code_locations=locations[:10],
+                priority=fix["priority"]
+            ))
+        return recommendations
 
     def _find_relevant_code_locations(self, technique: str) -> List[str]:
         """Find code locations relevant to a technique"""
-        locations = []
-
-        # Find techniques that match
-        matching_techniques = [t for t in self.techniques if technique in t.get("name", "")]
-
-        for tech in matching_techniques:
-            locations.extend(tech.get("locations", [])[:3])  # Limit to 3
-
-        return locations[:5]  # Total limit
+        # Insights carry the technique display name; the index maps it directly
+        return self.symbol_index.locations_for_technique(technique)[:5]  # Total limit
 
     def _severity_to_impact(self, severity: str) -> str:
         """Convert severity to impact"""
@@ -167,9 +346,9 @@ class RecommendationGenerator:
         }
         return mapping.get(severity, "Medium")
 
-    def _estimate_effort(self, failure_mode: Dict) -> str:
+    def _estimate_effort(self, failure_mode: FailureModeRecord) -> str:
         """Estimate implementation effort"""
-        mitigation = failure_mode.get("mitigation", "").lower()
+        mitigation = failure_mode.mitigation.lower()
 
         # Simple heuristics
         if any(word in mitigation for word in ["threshold", "check", "validate", "log"]):
@@ -181,7 +360,7 @@ class RecommendationGenerator:
 
     def _generate_action_steps(self, best_practice: Dict) -> List[str]:
         """Generate action steps for best practice"""
-        practice = best_practice.get("practice", "")
+        practice = best_practice.get("practice") or ""
 
         steps = [
             f"Implement: {practice}",
@@ -204,20 +383,64 @@ class RecommendationGenerator:
 
         return caveats
 
-    def _deduplicate_recommendations(self, recommendations: List[Dict]) -> List[Dict]:
-        """Remove duplicate recommendations"""
-        seen_titles = set()
+    def _deduplicate_recommendations(self, recommendations: List[RecommendationRecord]) -> List[RecommendationRecord]:
+        """Merge recommendations that say the same thing, pooling their evidence
+
+        The most urgent recommendation of each cluster is kept. Evidence from
+        the other papers goes into supporting_evidence, which makes the
+        recommendation high-confidence, and only caveats every member shares
+        survive.
+        """
+        ordered = sorted(recommendations, key=lambda x: (x.priority, -self._impact_score(x)))
+        clusters = cluster_texts([rec.title for rec in ordered], settings.similarity_threshold)
+
         unique = []
+        for cluster in clusters:
+            group = [ordered[i] for i in cluster]
+            rec = group[0]
+            if len(group) > 1:
+                papers = {rec.evidence["paper"]}
+                supporting = []
+                for other in group[1:]:
+                    if other.evidence["paper"] not in papers:
+                        papers.add(other.evidence["paper"])
+                        supporting.append(other.evidence)
+                rec = rec._replace(
+                    supporting_evidence=supporting,
+                    confidence="High" if supporting else rec.confidence,
+                    caveats=[c for c in rec.caveats if all(c in other.caveats for other in group)],
+                    code_locations=list(dict.fromkeys(
+                        location for member in group for location in member.code_locations
+                    ))[:10],
+                )
+            unique.append(rec)
 
-        for rec in recommendations:
-            title = rec["title"].lower()
-            if title not in seen_titles:
-                seen_titles.add(title)
-                unique.append(rec)
+        return unique
+
+    def _deduplicate_failure_modes(self, failure_modes: List[FailureModeRecord]) -> List[FailureModeRecord]:
+        """Merge failure modes that describe the same problem, keeping the worst severity"""
+        clusters = cluster_texts([fm.description for fm in failure_modes], settings.similarity_threshold)
+
+        unique = []
+        for cluster in clusters:
+            group = [failure_modes[i] for i in cluster]
+            fm = group[0]
+            if len(group) > 1:
+                fm = fm._replace(
+                    severity=max((member.severity for member in group), key=self._severity_rank),
+                    mitigation=next((member.mitigation for member in group if member.mitigation), ""),
+                    supporting_papers=list(dict.fromkeys(
+                        member.source_paper for member in group[1:] if member.source_paper != fm.source_paper
+                    )),
+                )
+            unique.append(fm)
 
         return unique
 
-    def _impact_score(self, rec: Dict) -> int:
+    def _severity_rank(self, severity: str) -> int:
+        return {"Critical": 4, "High": 3, "Medium": 2, "Low": 1}.get(severity, 2)
+
+    def _impact_score(self, rec: RecommendationRecord) -> int:
         """Calculate numeric impact score for sorting"""
         impact_map = {"High": 3, "Medium": 2, "Low": 1}
-        return impact_map.get(rec.get("impact", "Medium"), 2)
+        return impact_map.get(rec.impact, 2)
@@ -0,0 +1,88 @@
+import gzip
+import hashlib
+import json
+from typing import Dict, List, Optional, Tuple
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:  # The standard library encoder; several times slower on large reports
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Offer gzip only
+    brotli = None
+
+
+def dumps(value) -> bytes:
+    """Compact UTF-8 JSON"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def supported_encodings() -> List[str]:
+    """Content codings we can produce, preferred first"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate(accept_encoding: Optional[str]) -> str:
+    """Best supported coding the client accepts (RFC 9110 Accept-Encoding), or "identity" """
+    if not accept_encoding:
+        return "identity"
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    candidates = [coding for coding in supported_encodings() if weights.get(coding, weights.get("*", 0.0)) > 0]
+    if not candidates:
+        return "identity"
+    # Highest q wins; ties go to the better compressor (earlier in supported_encodings)
+    return max(candidates, key=lambda coding: weights.get(coding, weights.get("*", 0.0)))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison, as If-None-Match uses: W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+class EncodedReport:
+    """A finished report serialized once, with compressed copies made on first request per coding
+
+    The ETag is weak because the gzip and brotli bodies differ byte for byte
+    while carrying the same report.
+    """
+
+    __slots__ = ("body", "etag", "_encoded")
+
+    def __init__(self, report: Dict):
+        self.body = dumps(report)
+        self.etag = f'W/"{hashlib.blake2b(self.body, digest_size=16).hexdigest()}"'
+        self._encoded: Dict[str, bytes] = {}
+
+    def encoded(self, accept_encoding: Optional[str]) -> Tuple[str, bytes]:
+        """(content coding, body) for a request's Accept-Encoding"""
+        coding = negotiate(accept_encoding)
+        if coding == "identity" or len(self.body) < settings.report_compression_min_bytes:
+            return "identity", self.body
+        body = self._encoded.get(coding)
+        if body is None:
+            if coding == "br":
+                body = brotli.compress(self.body, quality=settings.report_brotli_quality)
+            else:
+                body = gzip.compress(self.body, compresslevel=settings.report_gzip_level, mtime=0)
+            self._encoded[coding] = body
+        return coding, body
@@ -1,8 +1,58 @@
 import httpx
 import asyncio
-from typing import List, Dict
+import re
+from typing import List, Dict, Optional
 from app.config import settings
 import arxiv
+from app.models.records import PaperRecord, TechniqueRecord
+from app.services.budget import AnalysisBudget
+from app.services.job_trace import span
+from app.services.keyword_matcher import get_matcher
+from app.services.near_duplicates import deduplicate_papers
+from app.services.paper_index import paper_index_store
+from app.services.paper_ranker import PaperRanker
+from app.services.resilience import (
+    CircuitBreaker, GuardedSource, RetryableError, SourceUnavailable, TokenBucket, parse_retry_after
+)
+from app.services.result_cache import search_cache
+from app.services.single_flight import SingleFlight
+
+SEMANTIC_SCHOLAR_URL = "https://api.semanticscholar.org/graph/v1/paper/search"
+
+# Seconds per request; fixed rather than per job, since one request may serve several jobs
+SEARCH_TIMEOUTS = {"semantic_scholar": 30.0, "arxiv": 60.0}
+
+SOURCE_NAMES = {"semantic_scholar": "Semantic Scholar", "arxiv": "arXiv"}
+
+# Reciprocal rank fusion constant for merging local BM25 and vector search rankings
+RRF_K = 60
+
+# Words in identifiers and paths ("vector_store.py", "retrieveDocs"); extensions and noise are dropped
+IDENTIFIER_WORDS = re.compile(r"[A-Z]?[a-z]{3,}")
+INDICATOR_BOILERPLATE = frozenset({"library", "dependency", "call", "pattern", "match", "file", "app", "src"})
+
+
+def _guarded_source(name: str, rate: float) -> GuardedSource:
+    return GuardedSource(
+        name,
+        TokenBucket(rate, settings.research_burst),
+        CircuitBreaker(settings.research_breaker_failures, settings.research_breaker_reset),
+        max_retries=settings.research_max_retries,
+        backoff_base=settings.research_backoff_base,
+        backoff_max=settings.research_backoff_max
+    )
+
+
+# Shared by every job so the documented limits hold for the whole process
+research_sources = {
+    "semantic_scholar": _guarded_source(
+        "semantic_scholar",
+        settings.semantic_scholar_rate_with_key if settings.semantic_scholar_api_key else settings.semantic_scholar_rate_public
+    ),
+    "arxiv": _guarded_source("arxiv", settings.arxiv_rate),
+}
+
+search_flight = SingleFlight("research_search")
 
 class ResearchRetriever:
     """Retrieve research papers from Semantic Scholar and arXiv"""
@@ -38,43 +88,72 @@ class ResearchRetriever:
             "prompt engineering best practices evaluation",
             "prompt optimization techniques empirical",
             "prompt design effectiveness study"
+        ],
+        "PERFORMANCE_ANTIPATTERNS": [
+            "LLM application latency optimization",
+            "large language model serving request batching",
+            "streaming inference time to first token"
         ]
     }
 
-    async def retrieve_for_techniques(self, techniques: List[Dict]) -> List[Dict]:
-        """Retrieve papers for all detected techniques"""
+    # Keywords signalling experimental work
+    EXPERIMENTAL_KEYWORDS = (
+        'experiment', 'evaluation', 'benchmark', 'dataset',
+        'results', 'performance', 'measured', 'tested',
+        'empirical', 'study', 'analysis', 'comparison',
+        'ablation', 'metrics'
+    )
+
+    def __init__(self, budget: Optional[AnalysisBudget] = None, ranker: Optional[PaperRanker] = None):
+        self.budget = budget or AnalysisBudget()
+        self.ranker = ranker or PaperRanker()
+
+    async def retrieve_for_techniques(self, techniques: List[TechniqueRecord]) -> List[PaperRecord]:
+        """Retrieve papers for all detected techniques
+
+        Search results stay dicts while they are merged and ranked; only the
+        papers kept leave as records.
+        """
         all_papers = []
+        ranking_queries = {}
+        vector_hits = await self._search_vectors(techniques)
 
-        for technique in techniques:
-            tech_type = technique.get("type", "")
-            queries = self.TECHNIQUE_QUERIES.get(tech_type, [])
+        for i, technique in enumerate(techniques):
+            if self.budget.expired():
+                self.budget.degrade(f"Skipped research for {len(techniques) - i} technique(s) (deadline reached)")
+                break
+            queries = self.TECHNIQUE_QUERIES.get(technique.type, [])
 
             if queries:
-                papers = await self._retrieve_papers(queries, technique["name"])
+                ranking_queries[technique.name] = self._ranking_query(technique)
+                papers = await self._retrieve_papers(queries, technique.name, vector_hits.get(technique.name, []))
                 all_papers.extend(papers)
 
-        # Deduplicate by title
-        unique_papers = {}
-        for paper in all_papers:
-            if paper["title"] not in unique_papers:
-                unique_papers[paper["title"]] = paper
-
-        # Sort by relevance score
-        sorted_papers = sorted(
-            unique_papers.values(),
-            key=lambda x: x["relevance_score"],
-            reverse=True
-        )
+        # The same paper often comes back from several sources and techniques
+        with span("deduplicate_papers", "cpu", papers=len(all_papers)) as args:
+            candidates = deduplicate_papers(all_papers)
+            args["unique"] = len(candidates)
 
-        # Limit total papers
-        return sorted_papers[:15]
+        # Rank the whole pool in one pass against what each paper was searched for
+        with span("rank_papers", "cpu", candidates=len(candidates)):
+            ranked = self.ranker.rank(
+                candidates, [ranking_queries[paper["technique"]] for paper in candidates], settings.max_papers_total
+            )
+        return [PaperRecord.from_dict(paper) for paper in ranked]
 
-    async def _retrieve_papers(self, queries: List[str], technique_name: str) -> List[Dict]:
+    async def _retrieve_papers(self, queries: List[str], technique_name: str,
+                               vector_hits: Optional[List[Dict]] = None) -> List[Dict]:
         """Retrieve papers for a specific technique"""
-        papers = []
-
-        # Try Semantic Scholar first
-        for query in queries[:2]:  # Limit queries
+        # The local index answers without egress; live search only fills a miss. BM25 over a large
+        # index is CPU-bound, so it runs off the event loop like vector search
+        papers = await asyncio.to_thread(self._search_local, queries, technique_name, vector_hits or [])
+        if len(papers) >= settings.paper_index_min_results:
+            return papers[:settings.max_papers_per_technique]
+
+        # Try Semantic Scholar next
+        for query in queries[:self.budget.queries_per_technique()]:  # Limit queries
+            if self.budget.expired():
+                break
             semantic_papers = await self._search_semantic_scholar(query, technique_name)
             papers.extend(semantic_papers)
 
@@ -82,68 +161,208 @@ class ResearchRetriever:
             if len(papers) >= settings.max_papers_per_technique:
                 break
 
-        # Fallback to arXiv if needed
-        if len(papers) < 3:
+        # Fallback to arXiv if needed and the budget allows; repeats across queries don't count
+        papers = deduplicate_papers(papers)
+        if len(papers) < 3 and self.budget.arxiv_fallback():
             for query in queries[:1]:
                 arxiv_papers = await self._search_arxiv(query, technique_name)
                 papers.extend(arxiv_papers)
 
-        return papers[:settings.max_papers_per_technique]
+        return deduplicate_papers(papers)[:settings.max_papers_per_technique]
+
+    def _search_local(self, queries: List[str], technique: str, vector_hits: List[Dict]) -> List[Dict]:
+        """BM25 hits from the local paper index, fused by reciprocal rank with the vector search hits"""
+        index = paper_index_store.get()
+        if index is None:
+            return []
+
+        rankings = [vector_hits]
+        with span("paper_index.search", "cpu", queries=len(queries)) as args:
+            for query in queries:
+                hits = index.search(query, k=settings.max_papers_per_technique, min_year=settings.paper_min_year)
+                rankings.append([record for _, record in hits])
+
+            fused: Dict[str, float] = {}
+            records: Dict[str, Dict] = {}
+            for ranking in rankings:
+                for rank, record in enumerate(ranking):
+                    records.setdefault(record["title"], record)
+                    fused[record["title"]] = fused.get(record["title"], 0.0) + 1 / (RRF_K + rank)
+            papers = [
+                self._format_index_paper(records[title], technique)
+                for title in sorted(fused, key=fused.get, reverse=True)
+            ]
+            args["results"] = len(papers)
+        return papers
+
+    async def _search_vectors(self, techniques: List[TechniqueRecord]) -> Dict[str, List[Dict]]:
+        """Embedding search of the local index for every detected technique in one batch, by technique name"""
+        index = paper_index_store.get()
+        techniques = [t for t in techniques if t.type in self.TECHNIQUE_QUERIES]
+        if index is None or index.embeddings is None or not techniques:
+            return {}
+
+        texts = [self._detection_query(technique) for technique in techniques]
+        with span("paper_index.vector_search", "cpu", queries=len(texts)) as args:
+            # Scanning a large corpus takes a while, so keep it off the event loop
+            results = await asyncio.to_thread(
+                index.vector_search, texts, settings.embedding_vector_k, settings.paper_min_year
+            )
+            args["results"] = sum(len(hits) for hits in results)
+        return {
+            technique.name: [record for score, record in hits if score >= settings.embedding_min_similarity]
+            for technique, hits in zip(techniques, results)
+        }
+
+    def _ranking_query(self, technique: TechniqueRecord) -> str:
+        """Text a technique's papers are ranked against: every search query plus what was detected"""
+        return " ".join(self.TECHNIQUE_QUERIES[technique.type][1:] + [self._detection_query(technique)])
+
+    def _detection_query(self, technique: TechniqueRecord) -> str:
+        """What was detected and where: the research topic plus library, call, file and function names"""
+        code_words = IDENTIFIER_WORDS.findall(" ".join(technique.indicators + technique.locations))
+        return " ".join([
+            technique.name,
+            technique.description,
+            self.TECHNIQUE_QUERIES[technique.type][0],
+            *dict.fromkeys(word.lower() for word in code_words if word.lower() not in INDICATOR_BOILERPLATE),
+        ])
 
     async def _search_semantic_scholar(self, query: str, technique: str) -> List[Dict]:
         """Search Semantic Scholar API"""
-        try:
-            url = "https://api.semanticscholar.org/graph/v1/paper/search"
-            params = {
-                'query': query,
-                'limit': 5,
-                'fields': 'title,abstract,year,citationCount,authors,venue,isOpenAccess,externalIds',
-                'year': f'{settings.paper_min_year}-2025'
-            }
+        papers = []
+        for item in await self._guarded_search("semantic_scholar", query, self._fetch_semantic_scholar):
+            paper = self._format_semantic_scholar_paper(item, technique)
+            if paper:
+                papers.append(paper)
+        return papers
 
-            headers = {}
-            if settings.semantic_scholar_api_key:
-                headers['x-api-key'] = settings.semantic_scholar_api_key
+    async def _search_arxiv(self, query: str, technique: str) -> List[Dict]:
+        """Search arXiv API"""
+        return [
+            self._format_arxiv_paper(result, technique)
+            for result in await self._guarded_search("arxiv", query, self._fetch_arxiv)
+            if result.published.year >= settings.paper_min_year
+        ]
 
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(url, params=params, headers=headers)
+    async def _guarded_search(self, source_name: str, query: str, fetch) -> List:
+        """Run a search through the shared cache, rate limiter and circuit breaker
 
-                if response.status_code == 200:
-                    data = response.json()
-                    papers = []
+        Fresh cached results skip the network and concurrent identical
+        searches share one request. The shared request runs under no job's
+        budget; each caller waits for it only until its own deadline, and
+        a caller that gives up leaves it running to fill the cache. While
+        the source is unavailable, stale results are served if there are any.
+        """
+        key = (source_name, query)
+        cached = search_cache.get(key)
+        if cached is not None:
+            return cached
 
-                    for item in data.get('data', []):
-                        paper = self._format_semantic_scholar_paper(item, technique)
-                        if paper:
-                            papers.append(paper)
+        try:
+            with span(f"{source_name}.search", "http", query=query) as args:
+                # Identical searches from concurrent jobs share one request
+                args["coalesced"] = search_flight.in_flight(key)
+                results = await asyncio.wait_for(
+                    search_flight.do(key, lambda: self._call_source(source_name, query, fetch, args)),
+                    self.budget.remaining()
+                )
+        except (SourceUnavailable, asyncio.TimeoutError) as e:
+            reason = "deadline reached" if isinstance(e, asyncio.TimeoutError) else "unavailable"
+            print(f"{SOURCE_NAMES[source_name]} {reason}: {e or 'job deadline passed while waiting'}")
+            stale = search_cache.get(key, allow_stale=True)
+            if stale is not None:
+                self.budget.degrade(f"{SOURCE_NAMES[source_name]} {reason}; used cached results")
+                return stale
+            self.budget.degrade(f"{SOURCE_NAMES[source_name]} {reason}; some searches returned no papers")
+            return []
+        except Exception as e:
+            print(f"{SOURCE_NAMES[source_name]} error: {e}")
+            return []
 
-                    return papers
+        return results
 
-        except Exception as e:
-            print(f"Semantic Scholar error: {e}")
+    async def refresh(self, source_name: str, query: str) -> List:
+        """Fetch a search again whatever the cache holds (used by the prefetcher)"""
+        fetch = self._fetch_semantic_scholar if source_name == "semantic_scholar" else self._fetch_arxiv
+        return await search_flight.do(
+            (source_name, query), lambda: self._call_source(source_name, query, fetch, {})
+        )
 
-        return []
+    async def _call_source(self, source_name: str, query: str, fetch, args: Dict) -> List:
+        """Fetch through the source's limiter and breaker and cache the result
+
+        Possibly shared by several jobs, so it uses no job's budget: callers
+        apply their own deadlines while waiting for it.
+        """
+        attempts = 0
+
+        async def attempt():
+            nonlocal attempts
+            attempts += 1
+            return await fetch(query, args)
 
-    async def _search_arxiv(self, query: str, technique: str) -> List[Dict]:
-        """Search arXiv API"""
         try:
-            search = arxiv.Search(
-                query=query,
-                max_results=5,
-                sort_by=arxiv.SortCriterion.Relevance
-            )
+            results = await research_sources[source_name].call(attempt)
+        finally:
+            args["retries"] = max(0, attempts - 1)
+        search_cache.set((source_name, query), results)
+        return results
+
+    async def _fetch_semantic_scholar(self, query: str, args: Dict) -> List[Dict]:
+        """One Semantic Scholar request; raw result items"""
+        params = {
+            'query': query,
+            'limit': 5,
+            'fields': 'title,abstract,year,citationCount,authors,venue,isOpenAccess,externalIds',
+            'year': f'{settings.paper_min_year}-2025'
+        }
+
+        headers = {}
+        if settings.semantic_scholar_api_key:
+            headers['x-api-key'] = settings.semantic_scholar_api_key
 
-            papers = []
-            for result in search.results():
-                if result.published.year >= settings.paper_min_year:
-                    paper = self._format_arxiv_paper(result, technique)
-                    papers.append(paper)
+        timeout = SEARCH_TIMEOUTS["semantic_scholar"]
+        try:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                # httpx timeouts don't cover DNS resolution, so bound the whole call
+                response = await asyncio.wait_for(client.get(SEMANTIC_SCHOLAR_URL, params=params, headers=headers), timeout)
+        except (httpx.TransportError, asyncio.TimeoutError) as e:
+            raise RetryableError(f"{type(e).__name__}: {e}") from e
+
+        args["status"] = response.status_code
+        args["bytes"] = len(response.content)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableError(f"HTTP {response.status_code}", parse_retry_after(response.headers.get("retry-after")))
+        response.raise_for_status()
+        return response.json().get('data', [])
+
+    async def _fetch_arxiv(self, query: str, args: Dict) -> List:
+        """One arXiv request; raw results"""
+        search = arxiv.Search(
+            query=query,
+            max_results=5,
+            sort_by=arxiv.SortCriterion.Relevance
+        )
+        # Pacing and retries are handled by the shared limiter, not the arxiv client
+        client = arxiv.Client(page_size=5, delay_seconds=0, num_retries=0)
 
-            return papers
+        try:
+            # The arxiv client blocks, so run it off the event loop within the budget
+            results = await asyncio.wait_for(
+                asyncio.to_thread(lambda: list(client.results(search))),
+                timeout=SEARCH_TIMEOUTS["arxiv"]
+            )
+        except arxiv.HTTPError as e:
+            args["status"] = e.status
+            if e.status == 429 or e.status >= 500:
+                raise RetryableError(str(e)) from e
+            raise
+        except (OSError, asyncio.TimeoutError, arxiv.UnexpectedEmptyPageError) as e:
+            raise RetryableError(f"{type(e).__name__}: {e}") from e
 
-        except Exception as e:
-            print(f"arXiv error: {e}")
-            return []
+        args["results"] = len(results)
+        return results
 
     def _format_semantic_scholar_paper(self, item: Dict, technique: str) -> Dict:
         """Format Semantic Scholar paper data"""
@@ -169,7 +388,27 @@ class ResearchRetriever:
             "url": url,
             "is_experimental": is_exp,
             "relevance_score": relevance,
-            "technique": technique
+            "technique": technique,
+            "source": "semantic_scholar"
+        }
+
+    def _format_index_paper(self, record: Dict, technique: str) -> Dict:
+        """Format a local paper index record"""
+        is_exp, _ = self._is_experimental(record["title"], record["abstract"])
+
+        return {
+            "title": record["title"],
+            "abstract": record["abstract"],
+            "year": record["year"],
+            "authors": record["authors"],
+            "citation_count": record["citation_count"],
+            "url": record["url"],
+            "is_experimental": is_exp,
+            "relevance_score": self._calculate_relevance(
+                {"year": record["year"], "citationCount": record["citation_count"]}, is_exp
+            ),
+            "technique": technique,
+            "source": record["source"]
         }
 
     def _format_arxiv_paper(self, result, technique: str) -> Dict:
@@ -185,20 +424,15 @@ class ResearchRetriever:
             "url": result.entry_id,
             "is_experimental": is_exp,
             "relevance_score": 50.0 if is_exp else 30.0,  # Default scores
-            "technique": technique
+            "technique": technique,
+            "source": "arxiv"
         }
 
     def _is_experimental(self, title: str, abstract: str) -> tuple[bool, str]:
         """Check if paper contains experimental work"""
-        EXPERIMENTAL_KEYWORDS = [
-            'experiment', 'evaluation', 'benchmark', 'dataset',
-            'results', 'performance', 'measured', 'tested',
-            'empirical', 'study', 'analysis', 'comparison',
-            'ablation', 'metrics'
-        ]
-
         text = f"{title} {abstract}".lower()
-        keyword_count = sum(1 for kw in EXPERIMENTAL_KEYWORDS if kw in text)
+        # Counts above 3 don't change the outcome, so stop scanning there
+        keyword_count = get_matcher(self.EXPERIMENTAL_KEYWORDS).count_distinct(text, limit=3)
 
         if keyword_count >= 3:
             return True, "High"
@@ -0,0 +1,224 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from app.services.budget import AnalysisBudget
+
+T = TypeVar("T")
+
+
+class SourceUnavailable(Exception):
+    """An external source can't be called now: circuit open, rate limit past the deadline, or retries used up"""
+
+
+class RetryableError(Exception):
+    """A failed call worth retrying (429, 5xx, timeouts), with the server's Retry-After if it sent one"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds; HTTP-date values are ignored in favour of our own backoff"""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """Process-wide token bucket; callers reserve a slot and sleep until it comes up
+
+    Reservations are made without awaiting, so concurrent jobs on the event
+    loop queue up in order instead of racing for tokens.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.waiting = 0
+
+    def _refill(self, now: float):
+        # While paused, `updated` sits in the future and nothing refills until then
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before using it"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        deficit = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(0.0, self.updated - now) + deficit
+
+    def refund(self):
+        """Give back a reserved token that won't be used"""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def pause(self, seconds: float):
+        """Hold every caller back, e.g. for a server's Retry-After; they resume one token at a time"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        self.updated = max(self.updated, now + seconds)
+
+    def idle(self) -> bool:
+        """True if a token is free right now and nobody is queued for one"""
+        self._refill(time.monotonic())
+        return self.tokens >= 1 and self.waiting == 0
+
+    async def acquire(self, max_wait: Optional[float] = None) -> bool:
+        """Wait for a token; False (and nothing taken) if that would take longer than max_wait"""
+        wait = self.reserve()
+        if max_wait is not None and wait > max_wait:
+            self.refund()
+            return False
+        if wait > 0:
+            self.waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self.waiting -= 1
+        return True
+
+    def to_dict(self) -> Dict:
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "tokens": round(self.tokens, 2),
+            "waiting": self.waiting,
+            "paused_for": round(max(0.0, self.updated - now), 2),
+        }
+
+
+class CircuitBreaker:
+    """Stop calling a source after repeated failures, then let one probe through after a cooldown
+
+    closed -> open after `failure_threshold` consecutive failed requests; open ->
+    half-open once `reset_timeout` has passed; a successful probe closes it
+    again and a failed one reopens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        return False
+
+    def success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probing = False
+
+    def failure(self):
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """End a probe that neither succeeded nor failed (e.g. gave up waiting for a token)"""
+        self._probing = False
+
+    def to_dict(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.opened,
+            "rejected_calls": self.rejected,
+            "retry_in": round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 2)
+            if self.state == "open" else 0.0,
+        }
+
+
+class GuardedSource:
+    """Rate limit, retry with jittered backoff and circuit-break calls to one external source
+
+    One instance per source is shared by every job in the process, so the
+    limiter and breaker see the combined load.
+    """
+
+    def __init__(self, name: str, limiter: TokenBucket, breaker: CircuitBreaker,
+                 max_retries: int, backoff_base: float, backoff_max: float):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    async def call(self, fetch: Callable[[], Awaitable[T]], budget: Optional[AnalysisBudget] = None) -> T:
+        """Run `fetch` within the limits; raises SourceUnavailable instead of waiting or failing blindly
+
+        `fetch` raises RetryableError for transient failures; anything else
+        propagates without a retry and without counting against the breaker.
+        """
+        if not self.breaker.allow():
+            raise SourceUnavailable(f"{self.name} circuit open")
+        self.calls += 1
+
+        for attempt in range(self.max_retries + 1):
+            max_wait = budget.remaining() if budget else None
+            if not await self.limiter.acquire(max_wait):
+                self.breaker.release()
+                raise SourceUnavailable(f"{self.name} rate limit wait exceeds the deadline")
+            try:
+                result = await fetch()
+            except RetryableError as e:
+                # Every failed attempt counts, so a dead source trips the breaker within one or two calls
+                self.breaker.failure()
+                if attempt == self.max_retries or self.breaker.state == "open":
+                    self.failures += 1
+                    raise SourceUnavailable(f"{self.name} failed after {attempt + 1} attempts: {e}") from e
+                self.retries += 1
+                if e.retry_after is not None:
+                    # Everyone waits out the server's Retry-After, plus jitter so they don't return together
+                    self.limiter.pause(e.retry_after + random.uniform(0, self.backoff_base))
+                else:
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                    if budget and budget.remaining() is not None and delay > budget.remaining():
+                        self.breaker.release()
+                        raise SourceUnavailable(f"{self.name} backoff exceeds the deadline") from e
+                    await asyncio.sleep(delay)
+                continue
+            except Exception:
+                self.breaker.release()
+                raise
+            self.breaker.success()
+            return result
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "limiter": self.limiter.to_dict(),
+            "breaker": self.breaker.to_dict(),
+        }
@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from app.config import settings
+
+
+class ResultCache:
+    """In-memory results of external calls, shared by every job in the process
+
+    Entries older than `ttl` are misses for normal lookups but stay (up to
+    `max_entries`, least recently used evicted first) so they can still be
+    served while a source is unavailable.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, allow_stale: bool = False) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        stored, value = entry
+        if time.monotonic() - stored > self.ttl:
+            if not allow_stale:
+                self.misses += 1
+                return None
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def age(self, key: Hashable) -> Optional[float]:
+        """Seconds since the entry was stored, or None if there is none (not counted as a lookup)"""
+        entry = self._entries.get(key)
+        return None if entry is None else time.monotonic() - entry[0]
+
+    def values(self) -> List[Any]:
+        """Every stored value, fresh or stale"""
+        return [value for _, value in self._entries.values()]
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def to_dict(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+        }
+
+
+# Raw search results per (source, query)
+search_cache = ResultCache(settings.research_cache_ttl, settings.research_cache_max_entries)
+
+# LLM-extracted findings per paper (title and abstract hash)
+insight_cache = ResultCache(settings.insight_cache_ttl, settings.insight_cache_max_entries)
@@ -0,0 +1,234 @@
+import json
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.keyword_matcher import KeywordMatcher, get_matcher, normalize_library
+
+try:
+    import yaml
+except ImportError:  # YAML packs are optional; JSON packs always work
+    yaml = None
+
+RULE_KINDS = ("library", "regex", "call", "antipattern")
+PACK_SUFFIXES = (".json", ".yaml", ".yml")
+DEFAULT_RULES_DIR = Path(__file__).resolve().parent.parent / "rules"
+
+logger = logging.getLogger(__name__)
+
+
+class RulePackError(ValueError):
+    """Raised when a rule pack can't be loaded or compiled"""
+
+
+@dataclass
+class RegexRule:
+    rule_id: str
+    technique: str
+    pattern: "re.Pattern"
+    weight: float
+
+
+@dataclass
+class CallRule:
+    rule_id: str
+    technique: str
+    name: str
+    weight: float
+
+
+@dataclass
+class AntipatternRule:
+    rule_id: str
+    technique: str
+    check: str  # Name of a built-in AST check in TechniqueDetector
+    weight: float
+
+
+@dataclass
+class CompiledRules:
+    """Rule packs compiled into the matcher structures TechniqueDetector uses"""
+    packs: List[str]
+    techniques: Dict[str, Dict[str, str]]
+    confidence_thresholds: Dict[str, float]
+    rule_kinds: Dict[str, Tuple[str, str]]
+    # Normalized library name -> (technique, rule_id, weight)
+    library_index: Dict[str, Tuple[str, str, float]]
+    library_matcher: KeywordMatcher
+    regex_rules: List[RegexRule]
+    # Dotted call-name suffix -> rules matching it
+    call_rules: Dict[str, List[CallRule]] = field(default_factory=dict)
+    antipattern_rules: List[AntipatternRule] = field(default_factory=list)
+
+    def display_name(self, technique: str) -> str:
+        """Get display name for technique"""
+        return self.techniques.get(technique, {}).get("display_name", technique)
+
+    def description(self, technique: str) -> str:
+        """Get description for technique"""
+        return self.techniques.get(technique, {}).get(
+            "description", "GenAI technique detected in codebase"
+        )
+
+    def confidence_for(self, weight: float) -> str:
+        """Map the strongest matched rule weight to a confidence label"""
+        if weight >= self.confidence_thresholds.get("High", 0.9):
+            return "High"
+        if weight >= self.confidence_thresholds.get("Medium", 0.4):
+            return "Medium"
+        return "Low"
+
+    def match_call(self, call_name: str) -> List[CallRule]:
+        """Get call rules matching a dotted call name by its trailing segments"""
+        parts = call_name.split('.')
+        matched = {}
+        for start in range(len(parts)):
+            for rule in self.call_rules.get('.'.join(parts[start:]), ()):
+                # A rule listing several suffixes of one name matches once
+                matched.setdefault(rule.rule_id, rule)
+        return list(matched.values())
+
+
+def load_pack(path: Path) -> Dict:
+    """Load a single JSON or YAML rule pack"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix == ".json":
+            try:
+                pack = json.load(f)
+            except json.JSONDecodeError as e:
+                raise RulePackError(f"{path.name}: invalid JSON: {e}") from e
+        elif yaml is None:
+            raise RulePackError(f"{path.name}: PyYAML is not installed, can't load YAML rule packs")
+        else:
+            try:
+                pack = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise RulePackError(f"{path.name}: invalid YAML: {e}") from e
+
+    if not isinstance(pack, dict) or not pack.get("name") or not pack.get("version"):
+        raise RulePackError(f"{path.name}: rule pack needs a name and version")
+    if not isinstance(pack.get("techniques"), list):
+        raise RulePackError(f"{path.name}: rule pack needs a techniques list")
+    return pack
+
+
+def compile_packs(packs: List[Dict]) -> CompiledRules:
+    """Compile rule packs into lookup tables, regexes and call-suffix maps"""
+    techniques = {}
+    thresholds = {"High": 0.9, "Medium": 0.4}
+    rule_kinds = {}
+    library_index = {}
+    regex_rules = []
+    call_rules = {}
+    antipattern_rules = []
+
+    # Later packs override technique metadata and add rules
+    for pack in packs:
+        try:
+            thresholds.update(pack.get("confidence_thresholds", {}))
+            for technique in pack["techniques"]:
+                tech_id = technique["id"]
+                meta = techniques.setdefault(tech_id, {})
+                for key in ("display_name", "description"):
+                    if technique.get(key):
+                        meta[key] = technique[key]
+
+                for rule in technique.get("rules", []):
+                    rule_id = rule.get("id")
+                    kind = rule.get("kind")
+                    weight = float(rule.get("weight", 0.5))
+                    if not rule_id or kind not in RULE_KINDS:
+                        raise RulePackError(f"{pack['name']}: invalid rule {rule!r} in {tech_id}")
+                    rule_kinds[rule_id] = (kind, tech_id)
+
+                    if kind == "library":
+                        for name in rule.get("names", []):
+                            library_index[normalize_library(name)] = (tech_id, rule_id, weight)
+                    elif kind == "regex":
+                        flags = 0 if rule.get("case_sensitive") else re.IGNORECASE
+                        try:
+                            pattern = re.compile(rule["pattern"], flags)
+                        except (KeyError, re.error) as e:
+                            raise RulePackError(f"{pack['name']}: bad pattern in rule {rule_id}: {e}")
+                        regex_rules.append(RegexRule(rule_id, tech_id, pattern, weight))
+                    elif kind == "call":
+                        for name in rule.get("names", []):
+                            call_rules.setdefault(name, []).append(CallRule(rule_id, tech_id, name, weight))
+                    else:
+                        if not rule.get("check"):
+                            raise RulePackError(f"{pack['name']}: antipattern rule {rule_id} needs a check")
+                        antipattern_rules.append(AntipatternRule(rule_id, tech_id, rule["check"], weight))
+        except (KeyError, TypeError, AttributeError) as e:
+            # Missing ids and wrongly typed fields; a hand-edited pack must not take detection down
+            raise RulePackError(f"{pack['name']}: malformed technique or rule ({type(e).__name__}: {e})") from e
+
+    return CompiledRules(
+        packs=[f"{pack['name']}@{pack['version']}" for pack in packs],
+        techniques=techniques,
+        confidence_thresholds=thresholds,
+        rule_kinds=rule_kinds,
+        library_index=library_index,
+        library_matcher=get_matcher(tuple(sorted(library_index))),
+        regex_rules=regex_rules,
+        call_rules=call_rules,
+        antipattern_rules=antipattern_rules,
+    )
+
+
+class RuleRegistry:
+    """Process-wide compiled rules, recompiled when pack files change on disk"""
+
+    def __init__(self, rules_dir: Path, check_interval: float):
+        self.rules_dir = Path(rules_dir)
+        self.check_interval = check_interval
+        self._rules: Optional[CompiledRules] = None
+        self._signature: Tuple = ()
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.last_error: Optional[str] = None
+
+    def get(self) -> CompiledRules:
+        """Get the current compiled rules, reloading if pack files changed"""
+        now = time.monotonic()
+        if self._rules is None or now - self._last_check >= self.check_interval:
+            self._last_check = now
+            if self._rules is None or self._pack_signature() != self._signature:
+                self.reload()
+        return self._rules
+
+    def reload(self) -> CompiledRules:
+        """Recompile all packs; keep serving the previous rules if this fails"""
+        with self._lock:
+            signature = self._pack_signature()
+            try:
+                packs = [load_pack(path) for path, _ in signature]
+                if not packs:
+                    raise RulePackError(f"No rule packs found in {self.rules_dir}")
+                self._rules = compile_packs(packs)
+                self.last_error = None
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # Pack errors arrive as RulePackError (a ValueError); the rest guard against a pack shape we missed
+                self.last_error = str(e)
+                logger.error("Rule pack error, keeping the previous rules: %s", e)
+                if self._rules is None:
+                    raise
+            self._signature = signature
+            return self._rules
+
+    def _pack_signature(self) -> Tuple:
+        """Pack files in load order with their modification times"""
+        if not self.rules_dir.is_dir():
+            return ()
+        paths = sorted(p for p in self.rules_dir.iterdir() if p.suffix in PACK_SUFFIXES)
+        return tuple((path, path.stat().st_mtime_ns) for path in paths)
+
+
+rule_registry = RuleRegistry(
+    Path(settings.rules_dir) if settings.rules_dir else DEFAULT_RULES_DIR,
+    settings.rules_reload_interval,
+)
@@ -0,0 +1,62 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent identical requests
+
+    The first caller for a key starts the call in its own task; callers
+    arriving while it runs await the same task. The key is dropped as soon
+    as the call finishes, so results aren't cached here and a failure only
+    reaches the callers that were already waiting; the next call for that
+    key starts afresh. A caller that gives up (e.g. its deadline passes)
+    doesn't cancel the call for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.calls = 0
+        self.executions = 0
+        self.shared = 0
+        self.failures = 0
+        self.max_fan_in = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self._calls.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 1
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.shared += 1
+            self._waiters[key] += 1
+            self.max_fan_in = max(self.max_fan_in, self._waiters[key])
+        # Shielded so one caller's cancellation leaves the call running for the rest
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.failures += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "shared": self.shared,
+            "failures": self.failures,
+            "in_flight": len(self._calls),
+            "max_fan_in": self.max_fan_in,
+        }
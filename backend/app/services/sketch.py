@@ -0,0 +1,74 @@
+import math
+from typing import Dict, Optional
+
+
+class DDSketch:
+    """Mergeable quantile sketch with bounded relative error (DDSketch)
+
+    Values land in logarithmic buckets, so any quantile is returned within
+    `relative_accuracy` of the true value using at most `max_bins` buckets,
+    however many values are added. Non-positive values are counted apart.
+    """
+
+    __slots__ = ("relative_accuracy", "max_bins", "_gamma", "_log_gamma", "bins", "zero_count", "count", "min", "max")
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: Dict[int, float] = {}
+        self.zero_count = 0.0
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, weight: float = 1.0):
+        """Add a value; weight > 1 stands in for sampled-out values"""
+        if value > 0:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            bins = self.bins
+            bins[key] = bins.get(key, 0.0) + weight
+            if len(bins) > self.max_bins:
+                self._collapse()
+        else:
+            self.zero_count += weight
+        self.count += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "DDSketch"):
+        """Fold another sketch with the same accuracy into this one"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Can't merge sketches with different relative accuracy")
+        for key, weight in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0.0) + weight
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        while len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the q-quantile (0 <= q <= 1), or None if the sketch is empty"""
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return min(self.min, 0.0)
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # Bucket midpoint in relative terms; clamp to what was actually seen
+                value = 2 * self._gamma ** key / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def _collapse(self):
+        """Fold the two lowest buckets together, trading low-end accuracy for memory"""
+        lowest, second = sorted(self.bins)[:2]
+        self.bins[second] += self.bins.pop(lowest)
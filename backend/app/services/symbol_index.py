@@ -0,0 +1,128 @@
+import sys
+from typing import Dict, List, NamedTuple, Optional
+from app.models.records import TechniqueRecord
+from app.services.line_index import format_location
+
+
+class Symbol(NamedTuple):
+    name: str  # Fully qualified, e.g. "pkg.rag.retrieve"
+    kind: str  # "function" or "class"
+    path: str
+    line: int
+
+    @property
+    def location(self) -> str:
+        return format_location(self.path, self.line)
+
+
+class CallSite(NamedTuple):
+    name: str  # Dotted call name with import aliases resolved
+    path: str
+    line: int
+    scope: str  # Qualified name of the enclosing function, class or module
+
+    @property
+    def location(self) -> str:
+        return format_location(self.path, self.line)
+
+
+class SymbolIndex:
+    """Project-wide definitions, import aliases and call graph, built once per job"""
+
+    def __init__(self):
+        self.definitions: Dict[str, Symbol] = {}
+        self.aliases: Dict[str, Dict[str, str]] = {}  # path -> local name -> qualified name
+        # Every trailing segment run of a resolved call name -> call sites,
+        # so "chat.completions.create" finds "openai.OpenAI().chat.completions.create"
+        self.calls_by_suffix: Dict[str, List[CallSite]] = {}
+        self.calls_by_scope: Dict[str, List[CallSite]] = {}
+        self.callers: Dict[str, List[CallSite]] = {}  # definition -> call sites targeting it
+        self.technique_locations: Dict[str, List[str]] = {}
+
+    @classmethod
+    def build(cls, parsed_data: Dict) -> "SymbolIndex":
+        """Build the index from CodeParser output in one pass over the collected facts"""
+        index = cls()
+        intern = sys.intern
+        code_patterns = parsed_data.get("code_patterns", {})
+
+        for path, data in code_patterns.items():
+            index.aliases[path] = data.get("aliases", {})
+            for name, kind, line in data.get("definitions", []):
+                index.definitions[name] = Symbol(name, kind, path, line)
+
+        # Call names repeat heavily across files, so their suffix lists are shared
+        suffix_lists: Dict[str, List[List[CallSite]]] = {}
+        calls_by_suffix = index.calls_by_suffix
+        calls_by_scope = index.calls_by_scope
+        definitions = index.definitions
+
+        for path, data in code_patterns.items():
+            module = data.get("module", "")
+            for name, line, scope in data.get("calls", []):
+                resolved = index._resolve(path, module, scope, name)
+                call = CallSite(resolved, path, line, scope)
+                calls_by_scope.setdefault(scope, []).append(call)
+
+                buckets = suffix_lists.get(resolved)
+                if buckets is None:
+                    parts = resolved.split('.')
+                    buckets = suffix_lists[resolved] = [
+                        calls_by_suffix.setdefault(intern('.'.join(parts[start:])), [])
+                        for start in range(len(parts))
+                    ]
+                for bucket in buckets:
+                    bucket.append(call)
+
+                if resolved in definitions:
+                    index.callers.setdefault(resolved, []).append(call)
+
+        return index
+
+    def _resolve(self, path: str, module: str, scope: str, name: str) -> str:
+        """Resolve the first segment of a call name through aliases and local definitions"""
+        head, _, rest = name.partition('.')
+        head_name = head[:-2] if head.endswith("()") else head
+        suffix = head[len(head_name):] + ('.' + rest if rest else "")
+
+        aliases = self.aliases.get(path, {})
+        if head_name in aliases:
+            return aliases[head_name] + suffix
+
+        local = f"{module}.{head_name}" if module else head_name
+        if local in self.definitions:
+            return local + suffix
+
+        if head_name in ("self", "cls") and rest:
+            # Methods resolve against the class enclosing the calling function
+            owner = scope.rpartition('.')[0]
+            if owner in self.definitions:
+                return f"{owner}.{rest}"
+
+        return name
+
+    def calls_matching(self, name: str) -> List[CallSite]:
+        """Get call sites whose resolved name ends with the dotted name"""
+        return self.calls_by_suffix.get(name, [])
+
+    def calls_in(self, scope: str) -> List[CallSite]:
+        """Get call sites made directly inside a function, class or module"""
+        return self.calls_by_scope.get(scope, [])
+
+    def callers_of(self, name: str) -> List[CallSite]:
+        """Get call sites resolved to a project definition"""
+        return self.callers.get(name, [])
+
+    def definition(self, name: str) -> Optional[Symbol]:
+        return self.definitions.get(name)
+
+    def register_techniques(self, techniques: List[TechniqueRecord]):
+        """Index detected technique locations by both technique type and display name"""
+        for tech in techniques:
+            for key in (tech.type, tech.name):
+                if key:
+                    self.technique_locations[key] = tech.locations
+
+    def locations_for_technique(self, technique: str) -> List[str]:
+        """Get detected locations for a technique type or display name"""
+        return self.technique_locations.get(technique, [])
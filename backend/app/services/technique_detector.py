@@ -1,64 +1,30 @@
-import re
-from typing import Dict, List, Literal
+import time
+from typing import Dict, List, Optional
+from app.config import settings
+from app.models.records import TechniqueRecord
+from app.services.cost_profiler import LLMCostProfiler, PROVIDER_MODULES, literal_value
+from app.services.keyword_matcher import normalize_library
+from app.services.line_index import LineIndex, format_location
+from app.services.rule_engine import CompiledRules, rule_registry
+from app.services.symbol_index import SymbolIndex
 
 class TechniqueDetector:
-    """Detect GenAI techniques from parsed codebase"""
-
-    # Library mappings for GenAI techniques
-    GENAI_LIBRARIES = {
-        'openai': 'LLM_API',
-        'anthropic': 'LLM_API',
-        'langchain': 'RAG',
-        'llama-index': 'RAG',
-        'llamaindex': 'RAG',
-        'chromadb': 'VECTOR_DB',
-        'pinecone': 'VECTOR_DB',
-        'weaviate': 'VECTOR_DB',
-        'faiss': 'VECTOR_DB',
-        'qdrant': 'VECTOR_DB',
-        'transformers': 'MODEL_INFERENCE',
-        'sentence-transformers': 'EMBEDDINGS',
-        'sentencetransformers': 'EMBEDDINGS',
-        'cohere': 'LLM_API',
-        'together': 'LLM_API',
-    }
-
-    # Code patterns for different techniques
-    RAG_PATTERNS = [
-        r'similarity_search',
-        r'vector_search',
-        r'retrieve',
-        r'query_embedding',
-        r'get_relevant_documents',
-        r'VectorStore',
-        r'Retriever',
-    ]
-
-    AGENT_PATTERNS = [
-        r'agent',
-        r'tool',
-        r'function_calling',
-        r'while.*step',
-        r'max_iterations',
-        r'thought',
-        r'reasoning',
-        r'plan',
-    ]
-
-    PROMPT_PATTERNS = [
-        r'prompt\s*=',
-        r'template\s*=',
-        r'f".*{.*}"',
-        r'\.format\(',
-        r'PromptTemplate',
-        r'ChatPromptTemplate',
-    ]
-
-    def __init__(self, parsed_data: Dict):
+    """Detect GenAI techniques from parsed codebase using the loaded rule packs"""
+
+    def __init__(
+        self,
+        parsed_data: Dict,
+        rules: Optional[CompiledRules] = None,
+        symbol_index: Optional[SymbolIndex] = None
+    ):
         self.parsed_data = parsed_data
+        # Snapshot the rules so a hot reload can't change them mid-job
+        self.rules = rules or rule_registry.get()
+        self.symbol_index = symbol_index or SymbolIndex.build(parsed_data)
         self.techniques = []
+        self.rule_stats = {}
 
-    async def detect(self) -> List[Dict]:
+    async def detect(self) -> List[TechniqueRecord]:
         """Detect all GenAI techniques"""
         # Detect from libraries
         await self._detect_from_libraries()
@@ -66,99 +32,284 @@ class TechniqueDetector:
         # Detect from code patterns
         await self._detect_from_patterns()
 
+        # Detect from call sites
+        await self._detect_from_calls()
+
+        # Detect latency anti-patterns from AST facts
+        await self._detect_antipatterns()
+
         # Deduplicate and enrich
         return self._finalize_techniques()
 
+    def get_rule_stats(self) -> List[Dict]:
+        """Per-rule match counts and CPU time, most expensive first"""
+        return sorted(self.rule_stats.values(), key=lambda s: s["cpu_ms"], reverse=True)
+
+    def _record_rule(self, rule_id: str, matches: int, cpu_ns: int = 0):
+        """Accumulate match count and CPU time for a rule"""
+        kind, technique = self.rules.rule_kinds.get(rule_id, ("", ""))
+        stats = self.rule_stats.setdefault(rule_id, {
+            "rule_id": rule_id,
+            "technique": technique,
+            "kind": kind,
+            "matches": 0,
+            "cpu_ms": 0.0
+        })
+        stats["matches"] += matches
+        stats["cpu_ms"] += cpu_ns / 1e6
+
     async def _detect_from_libraries(self):
         """Detect techniques based on imported libraries"""
         imports = set(self.parsed_data.get("imports", []))
         dependencies = self.parsed_data.get("dependencies", {})
+        import_locations = self.parsed_data.get("import_locations", {})
 
         all_libs = imports.union(set(dependencies.keys()))
 
+        library_index = self.rules.library_index
+        matcher = self.rules.library_matcher
+
+        started = time.thread_time_ns()
         technique_libs = {}
         for lib in all_libs:
-            lib_lower = lib.lower().replace('-', '').replace('_', '')
-            for pattern, technique in self.GENAI_LIBRARIES.items():
-                pattern_clean = pattern.replace('-', '').replace('_', '')
-                if pattern_clean in lib_lower or lib_lower in pattern_clean:
-                    if technique not in technique_libs:
-                        technique_libs[technique] = []
-                    technique_libs[technique].append(lib)
+            lib_clean = normalize_library(lib)
+            # Exact lookup first, then known library names embedded in the
+            # name (e.g. "langchain_openai")
+            match = library_index.get(lib_clean)
+            matches = [match] if match else [library_index[name] for name in matcher.find_all(lib_clean)]
+            for technique, rule_id, weight in matches:
+                technique_libs.setdefault(technique, []).append((lib, rule_id, weight))
+
+        # Library rules share one lookup pass; split its CPU time across matches
+        elapsed = time.thread_time_ns() - started
+        matched_count = sum(len(libs) for libs in technique_libs.values()) or 1
 
         # Convert to technique detections
+        max_hits = settings.max_locations_per_technique
         for technique, libs in technique_libs.items():
-            self.techniques.append({
-                "name": self._technique_display_name(technique),
-                "confidence": "High",
-                "indicators": [f"Library: {lib}" for lib in libs],
-                "locations": [],
-                "description": self._technique_description(technique),
-                "type": technique
-            })
+            indicators = []
+            locations = []
+            for lib, rule_id, _ in libs:
+                self._record_rule(rule_id, 1, elapsed // matched_count)
+                lib_locations = import_locations.get(lib, [])
+                if lib_locations:
+                    indicators.append(f"Library: {lib} at {lib_locations[0]}")
+                else:
+                    indicators.append(f"Library: {lib} ({dependencies.get(lib, 'dependency')})")
+                locations.extend(lib_locations[:max_hits - len(locations)])
+
+            self._add_detection(technique, max(w for _, _, w in libs), indicators, locations)
 
     async def _detect_from_patterns(self):
-        """Detect techniques based on code patterns"""
+        """Detect techniques based on regex rules"""
         code_patterns = self.parsed_data.get("code_patterns", {})
+        max_hits = settings.max_locations_per_technique
+
+        # Per technique: files with a match, (capped) path:line hits, strongest weight
+        matched_files = {}
+        hits = {}
+        weights = {}
+
+        # Rule-outer loop so each rule's CPU time is measured with two clock reads
+        for rule in self.rules.regex_rules:
+            technique_files = matched_files.setdefault(rule.technique, set())
+            technique_hits = hits.setdefault(rule.technique, [])
+            search = rule.pattern.search
+            matches = 0
+
+            started = time.thread_time_ns()
+            for file_path, data in code_patterns.items():
+                content = data.get("content", "")
+                match = search(content)
+                if not match:
+                    continue
+                matches += 1
+                technique_files.add(file_path)
+                if len(technique_hits) < max_hits:
+                    line_index = data.get("line_index") or LineIndex(content)
+                    location = format_location(file_path, line_index.line_of(match.start()))
+                    technique_hits.append((rule.pattern.pattern, location))
+            self._record_rule(rule.rule_id, matches, time.thread_time_ns() - started)
+
+            if matches:
+                weights[rule.technique] = max(weights.get(rule.technique, 0.0), rule.weight)
+
+        for technique, files in matched_files.items():
+            if not files:
+                continue
+            technique_hits = hits[technique]
+            indicators = [f"Pattern match in {len(files)} file(s)"] + [
+                f"Pattern '{pattern}' at {location}" for pattern, location in technique_hits
+            ]
+            locations = list(dict.fromkeys(location for _, location in technique_hits))
+            self._add_detection(technique, weights[technique], indicators, locations)
+
+    async def _detect_from_calls(self):
+        """Detect techniques by looking up call rules in the symbol index"""
+        max_hits = settings.max_locations_per_technique
+        hits = {}
+        weights = {}
+        scopes = {}
+        # A rule lists several names whose matches can overlap, so count each call site once per rule
+        rule_sites = {}
+        rule_cpu = {}
+
+        for name, rules in self.rules.call_rules.items():
+            started = time.thread_time_ns()
+            calls = self.symbol_index.calls_matching(name)
+            elapsed = time.thread_time_ns() - started
+            for rule in rules:
+                rule_sites.setdefault(rule.rule_id, set()).update(call.location for call in calls)
+                rule_cpu[rule.rule_id] = rule_cpu.get(rule.rule_id, 0) + elapsed // len(rules)
+                if not calls:
+                    continue
+                weights[rule.technique] = max(weights.get(rule.technique, 0.0), rule.weight)
+                scopes.setdefault(rule.technique, set()).update(call.scope for call in calls)
+                technique_hits = hits.setdefault(rule.technique, {})
+                for call in calls:
+                    if len(technique_hits) >= max_hits:
+                        break
+                    technique_hits.setdefault(call.location, call)
+
+        for rule_id, sites in rule_sites.items():
+            self._record_rule(rule_id, len(sites), rule_cpu[rule_id])
+
+        for technique, technique_hits in hits.items():
+            indicators = [f"Call '{call.name}' at {location}" for location, call in technique_hits.items()]
+            self._add_detection(technique, weights[technique], indicators, list(technique_hits))
+
+        self._link_retrieval_to_generation(scopes.get("RAG", set()))
 
-        # Check each file for patterns
-        rag_files = []
-        agent_files = []
-        prompt_files = []
-
-        for file_path, data in code_patterns.items():
-            content = data.get("content", "")
-
-            # RAG patterns
-            if any(re.search(pattern, content, re.IGNORECASE) for pattern in self.RAG_PATTERNS):
-                rag_files.append(file_path)
-
-            # Agent patterns
-            if any(re.search(pattern, content, re.IGNORECASE) for pattern in self.AGENT_PATTERNS):
-                agent_files.append(file_path)
-
-            # Prompt patterns
-            if any(re.search(pattern, content, re.IGNORECASE) for pattern in self.PROMPT_PATTERNS):
-                prompt_files.append(file_path)
-
-        # Add RAG detection if not already detected
-        if rag_files and not any(t["type"] == "RAG" for t in self.techniques):
-            self.techniques.append({
-                "name": "RAG (Retrieval-Augmented Generation)",
-                "confidence": "Medium",
-                "indicators": [f"Pattern match in {len(rag_files)} file(s)"],
-                "locations": rag_files[:5],  # Limit to 5 files
-                "description": self._technique_description("RAG"),
-                "type": "RAG"
-            })
-
-        # Add Agent detection
-        if agent_files:
-            existing_agent = next((t for t in self.techniques if t["type"] == "AGENTS"), None)
-            if existing_agent:
-                existing_agent["locations"].extend(agent_files[:5])
+    def _link_retrieval_to_generation(self, retrieval_scopes: set):
+        """Follow the call graph from functions that retrieve to the LLM calls consuming their output"""
+        indicators = []
+        locations = []
+
+        for scope in retrieval_scopes:
+            for caller in self.symbol_index.callers_of(scope):
+                for call in self.symbol_index.calls_in(caller.scope):
+                    if any(rule.technique == "LLM_API" for rule in self.rules.match_call(call.name)):
+                        indicators.append(
+                            f"Retrieval in {scope} feeds LLM call at {call.location} (via {caller.location})"
+                        )
+                        locations.extend([caller.location, call.location])
+
+        if indicators:
+            self._add_detection("RAG", self.rules.confidence_thresholds.get("High", 0.9), indicators, locations)
+
+    async def _detect_antipatterns(self):
+        """Run the anti-pattern checks enabled by rule packs over LLM call sites"""
+        if not self.rules.antipattern_rules:
+            return
+
+        # Identify LLM calls once; every check reuses the result
+        profiler = LLMCostProfiler(self.parsed_data, self.symbol_index)
+        code_patterns = self.parsed_data.get("code_patterns", {})
+        llm_calls = []
+        for path, data in code_patterns.items():
+            for call in data.get("llm_calls", []):
+                identified = profiler.identify(path, data, call)
+                if identified:
+                    llm_calls.append((path, call) + identified)
+
+        max_hits = settings.max_locations_per_technique
+        findings = {}
+        weights = {}
+        for rule in self.rules.antipattern_rules:
+            check = getattr(self, f"_check_{rule.check}", None)
+            if check is None:
+                continue
+            started = time.thread_time_ns()
+            rule_findings = check(llm_calls, code_patterns, profiler)
+            self._record_rule(rule.rule_id, len(rule_findings), time.thread_time_ns() - started)
+            if rule_findings:
+                weights[rule.technique] = max(weights.get(rule.technique, 0.0), rule.weight)
+                technique_findings = findings.setdefault(rule.technique, [])
+                technique_findings.extend(
+                    {"kind": rule.check, **finding} for finding in rule_findings[:max_hits]
+                )
+
+        for technique, technique_findings in findings.items():
+            indicators = [f"{f['message']} at {f['location']}" for f in technique_findings]
+            locations = list(dict.fromkeys(f["location"] for f in technique_findings))
+            self._add_detection(technique, weights[technique], indicators, locations)
+            self.techniques[-1]["findings"] = technique_findings
+
+    def _finding(self, path: str, line: int, call: str, message: str) -> Dict:
+        return {"location": format_location(path, line), "call": call, "message": message}
+
+    def _check_sequential_await_in_loop(self, llm_calls, code_patterns, profiler) -> List[Dict]:
+        """Awaiting LLM calls one by one inside a loop serializes their latency"""
+        return [
+            self._finding(path, call["line"], call["name"], f"Sequential awaited {operation} call in loop")
+            for path, call, _, operation, _, _ in llm_calls
+            if call["awaited"] and call["in_loop"] and operation != "embedding"
+        ]
+
+    def _check_unbatched_embedding(self, llm_calls, code_patterns, profiler) -> List[Dict]:
+        """Embedding inside a loop sends one input per request instead of a batch"""
+        return [
+            self._finding(path, call["line"], call["name"], "Embedding call per item inside loop")
+            for path, call, _, operation, _, _ in llm_calls
+            if operation == "embedding" and call["in_loop"]
+        ]
+
+    def _check_sync_client_in_async(self, llm_calls, code_patterns, profiler) -> List[Dict]:
+        """Blocking SDK calls inside async def stall the event loop for the whole request"""
+        findings = []
+        for path, call, provider, operation, _, client_class in llm_calls:
+            if not call["in_async"] or call["awaited"]:
+                continue
+            method = call["name"].rpartition('.')[2]
+            if client_class.startswith("langchain"):
+                blocking = not method.startswith("a")
             else:
-                self.techniques.append({
-                    "name": "AI Agents",
-                    "confidence": "Medium",
-                    "indicators": [f"Pattern match in {len(agent_files)} file(s)"],
-                    "locations": agent_files[:5],
-                    "description": self._technique_description("AGENTS"),
-                    "type": "AGENTS"
-                })
-
-        # Add Prompt Engineering detection
-        if prompt_files:
-            self.techniques.append({
-                "name": "Prompt Engineering",
-                "confidence": "Medium",
-                "indicators": [f"Pattern match in {len(prompt_files)} file(s)"],
-                "locations": prompt_files[:5],
-                "description": self._technique_description("PROMPT_ENGINEERING"),
-                "type": "PROMPT_ENGINEERING"
-            })
-
-    def _finalize_techniques(self) -> List[Dict]:
+                # Only flag clients known to be synchronous
+                client = client_class.rpartition('.')[2]
+                blocking = bool(client_class) and not client.startswith("Async")
+            if blocking:
+                findings.append(self._finding(
+                    path, call["line"], call["name"], f"Blocking {provider} {operation} call inside async function"
+                ))
+        return findings
+
+    def _check_client_per_request(self, llm_calls, code_patterns, profiler) -> List[Dict]:
+        """Constructing SDK clients inside functions rebuilds connection pools per call"""
+        findings = []
+        for path, data in code_patterns.items():
+            for name, line, scope, in_function in data.get("client_constructions", []):
+                if not in_function or scope.endswith("__init__"):
+                    continue
+                root = profiler.resolve_alias(path, name).split('.')[0]
+                if root in PROVIDER_MODULES or root.startswith("langchain"):
+                    findings.append(self._finding(path, line, name, f"New {name} client created per call"))
+        return findings
+
+    def _check_non_streaming_user_facing(self, llm_calls, code_patterns, profiler) -> List[Dict]:
+        """Chat calls in request handlers without streaming delay the first visible token"""
+        findings = []
+        for path, call, _, operation, config, _ in llm_calls:
+            if operation != "chat" or not call["in_handler"]:
+                continue
+            kwargs = {**config, **call["kwargs"]}
+            streamed = literal_value(kwargs.get("stream") or kwargs.get("streaming")) is True
+            if not streamed and not call["name"].endswith(("stream", "astream")):
+                findings.append(self._finding(path, call["line"], call["name"], "Non-streaming chat call in request handler"))
+        return findings
+
+    def _add_detection(self, technique: str, weight: float, indicators: List[str], locations: List[str]):
+        """Append a detection whose confidence comes from the strongest matched rule"""
+        self.techniques.append({
+            "name": self.rules.display_name(technique),
+            "confidence": self.rules.confidence_for(weight),
+            "indicators": indicators,
+            "locations": locations,
+            "description": self.rules.description(technique),
+            "type": technique,
+            "weight": weight
+        })
+
+    def _finalize_techniques(self) -> List[TechniqueRecord]:
         """Deduplicate and enrich technique detections"""
         # Merge duplicates by type
         final = {}
@@ -170,34 +321,15 @@ class TechniqueDetector:
                 # Merge indicators and locations
                 final[tech_type]["indicators"].extend(tech["indicators"])
                 final[tech_type]["locations"].extend(tech["locations"])
-                # Upgrade confidence if library was detected
-                if tech["confidence"] == "High":
-                    final[tech_type]["confidence"] = "High"
-
-        return list(final.values())
-
-    def _technique_display_name(self, technique: str) -> str:
-        """Get display name for technique"""
-        names = {
-            "LLM_API": "LLM API Integration",
-            "RAG": "RAG (Retrieval-Augmented Generation)",
-            "VECTOR_DB": "Vector Database",
-            "EMBEDDINGS": "Embedding Generation",
-            "MODEL_INFERENCE": "Model Inference",
-            "AGENTS": "AI Agents",
-            "PROMPT_ENGINEERING": "Prompt Engineering",
-        }
-        return names.get(technique, technique)
-
-    def _technique_description(self, technique: str) -> str:
-        """Get description for technique"""
-        descriptions = {
-            "LLM_API": "Using Large Language Model APIs for text generation and completion",
-            "RAG": "Retrieval-Augmented Generation: combining document retrieval with LLM generation",
-            "VECTOR_DB": "Vector database for storing and searching embeddings",
-            "EMBEDDINGS": "Converting text to vector embeddings for semantic search",
-            "MODEL_INFERENCE": "Running ML model inference locally",
-            "AGENTS": "Autonomous AI agents with tool usage and reasoning capabilities",
-            "PROMPT_ENGINEERING": "Structured prompt templates and prompt optimization techniques",
-        }
-        return descriptions.get(technique, "GenAI technique detected in codebase")
+                if "findings" in tech:
+                    final[tech_type].setdefault("findings", []).extend(tech["findings"])
+                # Keep the confidence of the strongest evidence
+                if tech["weight"] > final[tech_type]["weight"]:
+                    final[tech_type]["weight"] = tech["weight"]
+                    final[tech_type]["confidence"] = tech["confidence"]
+
+        # Keep merged locations unique and within the per-technique cap
+        for tech in final.values():
+            tech["locations"] = list(dict.fromkeys(tech["locations"]))[:settings.max_locations_per_technique]
+
+        return [TechniqueRecord.from_dict(tech) for tech in final.values()]
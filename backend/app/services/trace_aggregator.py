@@ -0,0 +1,305 @@
+import asyncio
+import json
+import zlib
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from app.config import settings
+from app.services.sketch import DDSketch
+
+OVERFLOW_SITE = "<other>"
+QUANTILES = (0.5, 0.95, 0.99)
+
+# OpenTelemetry attribute names for call sites and GenAI usage
+OTEL_ATTRIBUTES = {
+    "filepath": ("code.filepath", "code.file.path"),
+    "lineno": ("code.lineno", "code.line.number"),
+    "provider": ("gen_ai.system", "gen_ai.provider.name", "db.system"),
+    "operation": ("gen_ai.operation.name", "db.operation", "db.operation.name"),
+    "model": ("gen_ai.request.model", "gen_ai.response.model"),
+    "prompt_tokens": ("gen_ai.usage.input_tokens", "gen_ai.usage.prompt_tokens"),
+    "completion_tokens": ("gen_ai.usage.output_tokens", "gen_ai.usage.completion_tokens"),
+}
+
+
+class SiteStats:
+    """Streaming aggregates for one call site"""
+
+    __slots__ = ("site", "provider", "operation", "model", "calls", "sampled", "errors", "retries",
+                 "latency", "prompt_tokens", "completion_tokens")
+
+    def __init__(self, site: str):
+        self.site = site
+        self.provider = ""
+        self.operation = ""
+        self.model: Optional[str] = None
+        self.calls = 0.0  # Estimated from sample rates
+        self.sampled = 0
+        self.errors = 0.0
+        self.retries = 0.0
+        self.latency = DDSketch(settings.trace_sketch_accuracy)
+        self.prompt_tokens = DDSketch(settings.trace_sketch_accuracy)
+        self.completion_tokens = DDSketch(settings.trace_sketch_accuracy)
+
+    def add(self, call: Dict):
+        weight = call["weight"]
+        self.provider = self.provider or call["provider"]
+        self.operation = self.operation or call["operation"]
+        self.model = self.model or call["model"]
+        self.calls += weight
+        self.sampled += 1
+        self.retries += call["retries"] * weight
+        if call["error"]:
+            self.errors += weight
+        if call["latency_ms"] is not None:
+            self.latency.add(call["latency_ms"], weight)
+        if call["prompt_tokens"] is not None:
+            self.prompt_tokens.add(call["prompt_tokens"], weight)
+        if call["completion_tokens"] is not None:
+            self.completion_tokens.add(call["completion_tokens"], weight)
+
+    def summary(self) -> Dict:
+        def quantiles(sketch: DDSketch) -> Dict[str, Optional[float]]:
+            return {f"p{round(q * 100)}": _rounded(sketch.quantile(q)) for q in QUANTILES}
+
+        return {
+            "site": self.site,
+            "provider": self.provider,
+            "operation": self.operation,
+            "model": self.model,
+            "calls": round(self.calls),
+            "sampled_calls": self.sampled,
+            "error_rate": round(self.errors / self.calls, 4) if self.calls else 0.0,
+            "retries_per_call": round(self.retries / self.calls, 4) if self.calls else 0.0,
+            "latency_ms": quantiles(self.latency),
+            "prompt_tokens": quantiles(self.prompt_tokens),
+            "completion_tokens": quantiles(self.completion_tokens),
+            "techniques": [],
+        }
+
+
+def _rounded(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class TraceAggregator:
+    """Aggregate runtime trace records per call site in one streaming pass
+
+    Accepts genai_trace JSONL records, OTLP/JSON export lines
+    (resourceSpans -> scopeSpans -> spans) and flat span objects. Memory is
+    bounded by the number of sites (capped at `trace_max_sites`, the rest
+    pooled under "<other>") times the sketch size, not by trace length.
+    """
+
+    def __init__(self, max_sites: Optional[int] = None):
+        self.max_sites = max_sites or settings.trace_max_sites
+        self.sites: Dict[str, SiteStats] = {}
+        self.lines = 0
+        self.records = 0
+        self.skipped = 0
+
+    async def consume(self, chunks: AsyncIterator[bytes], compressed: bool = False):
+        """Feed raw (optionally gzipped) bytes, splitting lines across chunk boundaries
+
+        Only reading happens on the event loop; each chunk is decompressed and
+        parsed in a worker thread, so a large upload doesn't stall other requests.
+        """
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if compressed else None
+        tail = b""
+        discarding = False  # Inside an oversized line, dropping bytes until its newline
+        async for chunk in chunks:
+            tail, discarding = await asyncio.to_thread(self._consume_chunk, chunk, decompressor, tail, discarding)
+        await asyncio.to_thread(self._finish, decompressor, tail, discarding)
+
+    def _consume_chunk(self, chunk: bytes, decompressor, tail: bytes, discarding: bool) -> Tuple[bytes, bool]:
+        """Process one chunk; returns the unfinished line and whether it is being discarded"""
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        if discarding:
+            newline = chunk.find(b"\n")
+            if newline == -1:
+                return tail, True
+            chunk = chunk[newline + 1:]
+        tail = self.feed(tail + chunk)
+        if len(tail) > settings.trace_max_line_bytes:
+            self.lines += 1
+            self.skipped += 1
+            return b"", True
+        return tail, False
+
+    def _finish(self, decompressor, tail: bytes, discarding: bool):
+        if decompressor and not discarding:
+            tail = self.feed(tail + decompressor.flush())
+        if tail.strip():
+            self.add_line(tail)
+
+    def feed(self, data: bytes) -> bytes:
+        """Process every complete line in data and return the unfinished remainder"""
+        start = 0
+        find = data.find
+        end = find(b"\n")
+        while end != -1:
+            self.add_line(data[start:end])
+            start = end + 1
+            end = find(b"\n", start)
+        return data[start:]
+
+    def add_line(self, line: bytes):
+        """Parse one trace line; malformed lines are counted and skipped"""
+        line = line.strip()
+        if not line:
+            return
+        self.lines += 1
+        if len(line) > settings.trace_max_line_bytes:
+            self.skipped += 1
+            return
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            self.skipped += 1
+            return
+        if not isinstance(obj, dict) or "format" in obj:
+            return  # Header line
+
+        if "resourceSpans" in obj:
+            calls = self._otlp_calls(obj)
+        elif "site" in obj:
+            calls = [self._trace_call(obj)]
+        else:
+            calls = [self._span_call(obj)]
+
+        for call in calls:
+            if call is None:
+                self.skipped += 1
+                continue
+            self.records += 1
+            self._site(call["site"]).add(call)
+
+    def _site(self, site: str) -> SiteStats:
+        stats = self.sites.get(site)
+        if stats is None:
+            if len(self.sites) >= self.max_sites:
+                site = OVERFLOW_SITE
+                stats = self.sites.get(site)
+            if stats is None:
+                stats = self.sites[site] = SiteStats(site)
+        return stats
+
+    def _trace_call(self, obj: Dict) -> Optional[Dict]:
+        """Normalize a genai_trace record"""
+        sample_rate = obj.get("sample_rate") or 1.0
+        return {
+            "site": str(obj["site"]),
+            "provider": obj.get("provider") or "",
+            "operation": obj.get("op") or "",
+            "model": obj.get("model"),
+            "latency_ms": _number(obj.get("latency_ms")),
+            "prompt_tokens": _number(obj.get("prompt_tokens")),
+            "completion_tokens": _number(obj.get("completion_tokens")),
+            "retries": _number(obj.get("retries")) or 0,
+            "error": bool(obj.get("error")),
+            "weight": 1.0 / sample_rate,
+        }
+
+    def _otlp_calls(self, obj: Dict) -> Iterable[Optional[Dict]]:
+        """Flatten an OTLP/JSON export request into normalized calls"""
+        for resource_spans in obj.get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for span in scope_spans.get("spans", []):
+                    yield self._span_call(span)
+
+    def _span_call(self, span: Dict) -> Optional[Dict]:
+        """Normalize a span with OTel-style attributes; spans without a code location are skipped"""
+        attributes = span.get("attributes") or {}
+        if isinstance(attributes, list):
+            # OTLP/JSON: [{"key": ..., "value": {"stringValue": ...}}]
+            attributes = {a.get("key"): _otlp_value(a.get("value") or {}) for a in attributes}
+
+        def attribute(field: str):
+            for name in OTEL_ATTRIBUTES[field]:
+                if attributes.get(name) is not None:
+                    return attributes[name]
+            return None
+
+        filepath = attribute("filepath")
+        if not filepath:
+            return None
+        lineno = attribute("lineno")
+        site = f"{filepath}:{lineno}" if lineno is not None else str(filepath)
+
+        latency_ms = _number(span.get("duration_ms"))
+        start, end = _number(span.get("startTimeUnixNano")), _number(span.get("endTimeUnixNano"))
+        if latency_ms is None and start is not None and end is not None:
+            latency_ms = (end - start) / 1e6
+
+        status = span.get("status") or {}
+        error = status.get("code") in (2, "STATUS_CODE_ERROR", "ERROR") or bool(attributes.get("error.type"))
+
+        return {
+            "site": site.replace("\\", "/"),
+            "provider": str(attribute("provider") or ""),
+            "operation": str(attribute("operation") or span.get("name") or ""),
+            "model": attribute("model"),
+            "latency_ms": latency_ms,
+            "prompt_tokens": _number(attribute("prompt_tokens")),
+            "completion_tokens": _number(attribute("completion_tokens")),
+            "retries": _number(attributes.get("http.request.resend_count")) or 0,
+            "error": error,
+            "weight": 1.0,
+        }
+
+    def summary(self, techniques: Optional[List[Dict]] = None) -> List[Dict]:
+        """Per-site tables, slowest p95 first, joined with static technique locations"""
+        join = LocationJoin(techniques or [])
+        rows = []
+        for stats in self.sites.values():
+            row = stats.summary()
+            row["techniques"] = join.techniques_for(stats.site)
+            rows.append(row)
+        return sorted(rows, key=lambda r: r["latency_ms"]["p95"] or 0.0, reverse=True)
+
+
+class LocationJoin:
+    """Match runtime path:line sites to static technique locations
+
+    Trace paths are relative to wherever the service ran while report paths
+    are relative to the uploaded archive, so both sides are indexed by every
+    trailing run of path segments and the longest common suffix wins.
+    """
+
+    def __init__(self, techniques: List[Dict]):
+        self.by_suffix: Dict[str, List[str]] = {}
+        for tech in techniques:
+            for location in tech.get("locations", []):
+                for suffix in self._suffixes(location):
+                    names = self.by_suffix.setdefault(suffix, [])
+                    if tech["name"] not in names:
+                        names.append(tech["name"])
+
+    def techniques_for(self, site: str) -> List[str]:
+        for suffix in self._suffixes(site):
+            if suffix in self.by_suffix:
+                return self.by_suffix[suffix]
+        return []
+
+    @staticmethod
+    def _suffixes(location: str) -> List[str]:
+        """'a/b/c.py:10' -> ['a/b/c.py:10', 'b/c.py:10', 'c.py:10'], longest first"""
+        parts = location.lstrip("/").split("/")
+        return ["/".join(parts[start:]) for start in range(len(parts))]
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)  # OTLP encodes 64-bit integers as strings
+    except (TypeError, ValueError):
+        return None
+
+
+def _otlp_value(value: Dict):
+    for key in ("stringValue", "intValue", "doubleValue", "boolValue"):
+        if key in value:
+            return value[key]
+    return None
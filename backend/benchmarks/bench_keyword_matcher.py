@@ -0,0 +1,128 @@
+"""Micro-benchmark: per-keyword substring scans vs. an Aho-Corasick automaton
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_keyword_matcher
+
+KeywordMatcher scans once per keyword. The automaton below is the
+alternative it was measured against: one pass over the text whatever the
+number of keywords, but a Python-level step per character. Scanning wins
+until a set reaches a few hundred keywords; the app's sets have tens.
+"""
+import random
+import string
+import timeit
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+from app.services.keyword_matcher import KeywordMatcher, normalize_library
+from app.services.research_retriever import ResearchRetriever
+from app.services.rule_engine import rule_registry
+
+NUMBER = 5
+
+
+class Automaton:
+    """Aho-Corasick automaton, kept here as the reference for KeywordMatcher"""
+
+    def __init__(self, keywords: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[str, ...]] = [()]
+        for keyword in dict.fromkeys(k for k in keywords if k):
+            state = 0
+            for char in keyword:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = self._goto[state][char] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] += (keyword,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def find_all(self, text: str) -> Set[str]:
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+def _random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10)))
+
+
+def _best_ms(func) -> float:
+    return min(timeit.repeat(func, number=NUMBER, repeat=3)) / NUMBER * 1000
+
+
+def bench_libraries(rng: random.Random):
+    """Previous bidirectional substring loop vs. exact lookup plus matcher"""
+    rules = rule_registry.get()
+    libraries = list(rules.library_index)
+    names = [_random_word(rng) for _ in range(2000)] + libraries + ["langchain_openai", "llama_index"]
+
+    def previous():
+        for lib in names:
+            lib_lower = lib.lower().replace('-', '').replace('_', '')
+            for pattern in libraries:
+                pattern_clean = pattern.replace('-', '').replace('_', '')
+                if pattern_clean in lib_lower or lib_lower in pattern_clean:
+                    pass
+
+    index = rules.library_index
+    matcher = rules.library_matcher
+
+    def current():
+        for lib in names:
+            lib_clean = normalize_library(lib)
+            if lib_clean not in index:
+                matcher.find_all(lib_clean)
+
+    print(f"library lookups ({len(names)} names, {len(libraries)} libraries): "
+          f"previous {_best_ms(previous):.2f} ms, current {_best_ms(current):.2f} ms")
+
+
+def bench_keyword_counts(rng: random.Random):
+    """Substring scans vs. automaton pass as the keyword set grows"""
+    experimental = list(ResearchRetriever.EXPERIMENTAL_KEYWORDS)
+    # Roughly one experimental keyword per 40 words, as in typical abstracts
+    vocabulary = [_random_word(rng) for _ in range(40 * len(experimental))] + experimental
+    abstracts = [" ".join(rng.choice(vocabulary) for _ in range(250)) for _ in range(100)]
+
+    for extra in (0, 50, 200, 400):
+        keywords = experimental + [_random_word(rng) for _ in range(extra)]
+        matcher = KeywordMatcher(keywords)
+        automaton = Automaton(keywords)
+        scan_ms = _best_ms(lambda: [matcher.find_all(t) for t in abstracts])
+        pass_ms = _best_ms(lambda: [automaton.find_all(t) for t in abstracts])
+        print(f"keyword counts ({len(keywords)} keywords, {len(abstracts)} abstracts): "
+              f"scanning {scan_ms:.2f} ms, automaton {pass_ms:.2f} ms")
+
+
+def main():
+    rng = random.Random(0)
+    bench_libraries(rng)
+    bench_keyword_counts(rng)
+
+
+if __name__ == "__main__":
+    main()
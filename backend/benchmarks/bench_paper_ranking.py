@@ -0,0 +1,176 @@
+"""Offline evaluation of paper ranking: quality on a labelled set, and speed
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_paper_ranking [--labels FILE] [--tune]
+
+The labelled set is JSON Lines, one detected technique per line with its
+candidate papers graded 0 (irrelevant), 1 (related) or 2 (what the
+recommendations should cite). The bundled set pairs each technique with
+on-topic papers and highly cited, experimental, off-topic ones, the case
+the previous recency/citations/experimental score got wrong. Its
+abstracts are short paraphrases and citation counts are approximate.
+
+--tune grid-searches the feature weights (steps of 0.1, summing to 1) and
+prints the best settings for RANKING_WEIGHT_*.
+"""
+import argparse
+import itertools
+import json
+import math
+import random
+import timeit
+from pathlib import Path
+from typing import Dict, List
+
+from app.models.records import TechniqueRecord
+from app.services.paper_ranker import FEATURES, PaperRanker, _paper_terms
+from app.services.research_retriever import ResearchRetriever
+
+LABELS = Path(__file__).parent / "data" / "paper_ranking_labels.jsonl"
+K = 5
+NUMBER = 5
+# Speed target for ranking papers already tokenised: within this many times the previous score's
+# time (which read no text), or under SPEED_TARGET_MS, which covers a job's usual 15-100 candidates
+SPEED_TARGET_RATIO = 4.0
+SPEED_TARGET_MS = 1.0
+
+
+def load_cases(path: Path, retriever: ResearchRetriever) -> List[Dict]:
+    """Labelled papers in the shape the retriever produces, each with the query it is ranked against"""
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            technique = TechniqueRecord.from_dict({"confidence": "High", **case["technique"]})
+            papers = []
+            for labelled in case["papers"]:
+                is_exp, _ = retriever._is_experimental(labelled["title"], labelled["abstract"])
+                papers.append({
+                    **labelled,
+                    "authors": [],
+                    "url": "",
+                    "is_experimental": is_exp,
+                    "relevance_score": retriever._calculate_relevance(
+                        {"year": labelled["year"], "citationCount": labelled["citation_count"]}, is_exp
+                    ),
+                    "technique": technique.name,
+                })
+            cases.append({"technique": technique, "papers": papers, "query": retriever._ranking_query(technique)})
+    return cases
+
+
+def ndcg(labels: List[int], ideal: List[int], k: int = K) -> float:
+    def dcg(values):
+        return sum((2 ** label - 1) / math.log2(rank + 2) for rank, label in enumerate(values[:k]))
+    best = dcg(sorted(ideal, reverse=True))
+    return dcg(labels) / best if best else 0.0
+
+
+def reciprocal_rank(labels: List[int]) -> float:
+    return next((1 / (rank + 1) for rank, label in enumerate(labels) if label == 2), 0.0)
+
+
+def evaluate(cases: List[Dict], order) -> Dict[str, float]:
+    """Mean NDCG@K, precision@3 (grade 2) and MRR over the cases; `order` ranks one case's papers"""
+    totals = {"ndcg": 0.0, "p@3": 0.0, "mrr": 0.0}
+    for case in cases:
+        labels = [paper["label"] for paper in order(case)]
+        totals["ndcg"] += ndcg(labels, [paper["label"] for paper in case["papers"]])
+        totals["p@3"] += sum(label == 2 for label in labels[:3]) / 3
+        totals["mrr"] += reciprocal_rank(labels)
+    return {name: total / len(cases) for name, total in totals.items()}
+
+
+def previous_order(case: Dict) -> List[Dict]:
+    return sorted(case["papers"], key=lambda paper: paper["relevance_score"], reverse=True)
+
+
+def ranker_order(ranker: PaperRanker):
+    def order(case):
+        papers = [dict(paper) for paper in case["papers"]]
+        return ranker.rank(papers, [case["query"]] * len(papers), len(papers))
+    return order
+
+
+def _format(metrics: Dict[str, float]) -> str:
+    return ", ".join(f"{name} {value:.3f}" for name, value in metrics.items())
+
+
+def bench_quality(cases: List[Dict]):
+    print(f"quality ({len(cases)} techniques, {sum(len(c['papers']) for c in cases)} labelled papers)")
+    print(f"  previous score: {_format(evaluate(cases, previous_order))}")
+    print(f"  ranker:         {_format(evaluate(cases, ranker_order(PaperRanker())))}")
+
+
+def tune(cases: List[Dict]):
+    """Grid search over weights summing to 1, best NDCG first"""
+    steps = range(11)
+    results = []
+    for combo in itertools.product(steps, repeat=len(FEATURES) - 1):
+        last = 10 - sum(combo)
+        if last < 0:
+            continue
+        weights = dict(zip(FEATURES, [step / 10 for step in (*combo, last)]))
+        results.append((evaluate(cases, ranker_order(PaperRanker(weights))), weights))
+    results.sort(key=lambda result: (result[0]["ndcg"], result[0]["mrr"]), reverse=True)
+    print(f"tuning ({len(results)} weight settings), best:")
+    for metrics, weights in results[:5]:
+        print(f"  {_format(metrics)}  <- " + ", ".join(f"{name}={value:.1f}" for name, value in weights.items()))
+
+
+def bench_speed(cases: List[Dict], retriever: ResearchRetriever):
+    """Previous per-paper scoring and full sort vs. one ranking pass, as candidate pools grow
+
+    The ranker is timed cold (no paper tokenised before, as for a process's
+    first job) and warm (every paper already in the term cache, as for jobs
+    meeting papers earlier jobs ranked). Cold cost is tokenising, paid once
+    per paper per process; the target applies to warm runs.
+    """
+    rng = random.Random(0)
+    labelled = [(paper, case["query"]) for case in cases for paper in case["papers"]]
+    ranker = PaperRanker()
+    for size in (15, 100, 1000, 10000):
+        pool = [(dict(paper, title=f"{paper['title']} {i}"), query) for i, (paper, query) in
+                enumerate(rng.choice(labelled) for _ in range(size))]
+        papers = [paper for paper, _ in pool]
+        queries = [query for _, query in pool]
+
+        def previous():
+            for paper in papers:
+                paper["relevance_score"] = retriever._calculate_relevance(
+                    {"year": paper["year"], "citationCount": paper["citation_count"]}, paper["is_experimental"]
+                )
+            return sorted(papers, key=lambda paper: paper["relevance_score"], reverse=True)[:15]
+
+        def cold():
+            _paper_terms.cache_clear()
+            return ranker.rank(papers, queries, 15)
+
+        previous_ms = min(timeit.repeat(previous, number=NUMBER, repeat=3)) / NUMBER * 1000
+        cold_ms = min(timeit.repeat(cold, number=NUMBER, repeat=3)) / NUMBER * 1000
+        warm_ms = min(timeit.repeat(lambda: ranker.rank(papers, queries, 15), number=NUMBER, repeat=3)) / NUMBER * 1000
+        target_ms = max(previous_ms * SPEED_TARGET_RATIO, SPEED_TARGET_MS)
+        verdict = f"target {target_ms:.2f} ms " + ("ok" if warm_ms <= target_ms else "MISSED")
+        print(f"ranking {size} candidates: previous {previous_ms:.2f} ms, ranker cold {cold_ms:.2f} ms, "
+              f"warm {warm_ms:.2f} ms ({warm_ms * 1000 / size:.1f} us/paper) {verdict}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--labels", type=Path, default=LABELS)
+    parser.add_argument("--tune", action="store_true", help="Grid-search the feature weights")
+    args = parser.parse_args()
+
+    retriever = ResearchRetriever()
+    cases = load_cases(args.labels, retriever)
+    bench_quality(cases)
+    if args.tune:
+        tune(cases)
+    bench_speed(cases, retriever)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Cost of the report's entities between stages, building the report, and serializing it
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_report [--sizes 15,150,1500]
+
+For synthetic jobs with N papers (and as many failure modes and
+recommendations) it compares three ways of passing techniques, papers,
+failure modes and recommendations between stages:
+- dicts: loose dicts, as the pipeline used to
+- records: the NamedTuple records in app.models.records, turned into
+  dicts once by _build_report and validated once against AnalysisReport
+- models: Pydantic models built at every stage and dumped at the end
+It reports memory held by the entities (tracemalloc), the time to make
+the entities and build and validate the report, json.dumps time for the
+finished report, and the one-off cost of EncodedReport (the fast encoder
+plus gzip), which is all a completed job pays before every later fetch is
+served from bytes.
+"""
+import argparse
+import json
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from app.models.records import FailureModeRecord, PaperRecord, RecommendationRecord, TechniqueRecord
+from app.models.schemas import AnalysisReport, FailureMode, Paper, Recommendation, TechniqueDetection
+from app.services.analyzer import CodebaseAnalyzer
+from app.services.report_payload import EncodedReport
+
+NUMBER = 5
+SEVERITIES = ("Critical", "High", "Medium", "Low")
+TYPES = ("Critical", "Important", "Nice-to-have")
+
+
+def entity_dicts(n: int) -> Dict[str, List[Dict]]:
+    """Entities as the stages produce them; enum-like values are built at runtime, as parsed JSON's are"""
+    def level(i: int) -> str:
+        return "".join(["High", "Medium", "Low"][i % 3])
+
+    techniques = [{
+        "name": f"Technique {i}", "type": f"TECH_{i}", "confidence": level(i),
+        "indicators": [f"Library: lib{i} at app/mod{i}.py:{j}" for j in range(5)],
+        "locations": [f"app/mod{i}.py:{j}" for j in range(5)],
+        "description": f"Description of technique {i}", "findings": [],
+    } for i in range(10)]
+    papers = [{
+        "title": f"Paper {i} on retrieval augmented generation", "abstract": "We evaluate retrieval. " * 40,
+        "year": 2020 + i % 5, "authors": [f"Author {j}" for j in range(4)], "citation_count": i * 7,
+        "url": f"https://example.org/{i}", "is_experimental": i % 2 == 0, "relevance_score": 50.0 + i % 50,
+        "technique": "".join(["Technique ", str(i % 10)]), "source": "".join(["semantic", "_scholar"]),
+        "urls": [f"https://example.org/{i}"], "sources": ["".join(["semantic", "_scholar"])],
+    } for i in range(n)]
+    failure_modes = [{
+        "description": f"Failure {i}: retrieval returns irrelevant documents", "conditions": "Large corpora",
+        "severity": "".join(SEVERITIES[i % 4]), "mitigation": "Rerank the retrieved documents",
+        "source_paper": papers[i]["title"], "supporting_papers": [],
+    } for i in range(n)]
+    recommendations = [{
+        "type": "".join(TYPES[i % 3]), "title": f"Mitigate: failure {i}", "description": f"Failure {i}. Large corpora",
+        "action_steps": ["Rerank the retrieved documents", "Test the mitigation in staging", "Monitor"],
+        "code_example": None,
+        "evidence": {"paper": papers[i]["title"], "finding": f"Failure {i}", "year": str(papers[i]["year"])},
+        "impact": level(i), "effort": level(i + 1), "confidence": level(i + 2),
+        "caveats": [], "code_locations": [f"app/mod{i % 10}.py:{i}"], "priority": i % 3 + 1,
+        "supporting_evidence": [],
+    } for i in range(n)]
+    return {"techniques": techniques, "papers": papers, "failure_modes": failure_modes,
+            "recommendations": recommendations}
+
+
+def as_records(entities: Dict[str, List[Dict]]) -> Dict[str, list]:
+    return {
+        "techniques": [TechniqueRecord.from_dict(t) for t in entities["techniques"]],
+        "papers": [PaperRecord.from_dict(p) for p in entities["papers"]],
+        "failure_modes": [FailureModeRecord(**fm) for fm in entities["failure_modes"]],
+        "recommendations": [RecommendationRecord(**r) for r in entities["recommendations"]],
+    }
+
+
+def as_models(entities: Dict[str, List[Dict]]) -> Dict[str, list]:
+    return {
+        "techniques": [TechniqueDetection(**t) for t in entities["techniques"]],
+        "papers": [Paper(**p) for p in entities["papers"]],
+        "failure_modes": [FailureMode(**fm) for fm in entities["failure_modes"]],
+        "recommendations": [Recommendation(**r) for r in entities["recommendations"]],
+    }
+
+
+def retained_kb(build: Callable[[], object]) -> float:
+    """KiB still allocated by what `build` returns, beyond its inputs"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del kept
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename")) / 1024
+
+
+def report_builders(analyzer: CodebaseAnalyzer, entities: Dict[str, List[Dict]]) -> Dict[str, Callable[[], Dict]]:
+    """Each builder includes making its entities, which is where models pay for validation"""
+    rest = {"llm_call_sites": [], "duration": 1.0, "rule_packs": [], "rule_stats": []}
+    summary = analyzer._build_report(**as_records(entities), **rest)
+
+    def build_dicts():
+        # Previously the stages' dicts went into the report as they were, unchecked
+        return {**summary, **entities}
+
+    def build_records():
+        report = analyzer._build_report(**as_records(entities), **rest)
+        AnalysisReport.model_validate(report)
+        return report
+
+    def build_models():
+        models = as_models(entities)
+        return {**summary, **{name: [model.model_dump() for model in values] for name, values in models.items()}}
+
+    return {"dicts": build_dicts, "records": build_records, "models": build_models}
+
+
+def bench(n: int, analyzer: CodebaseAnalyzer):
+    print(f"{n} papers, failure modes and recommendations")
+    memory = {
+        "dicts": retained_kb(lambda: entity_dicts(n)),
+        "records": retained_kb(lambda: as_records(entity_dicts(n))),
+        "models": retained_kb(lambda: as_models(entity_dicts(n))),
+    }
+    for name, build in report_builders(analyzer, entity_dicts(n)).items():
+        build_ms = min(timeit.repeat(build, number=NUMBER, repeat=3)) / NUMBER * 1000
+        report = build()
+        dumps_ms = min(timeit.repeat(lambda: json.dumps(report), number=NUMBER, repeat=3)) / NUMBER * 1000
+        print(f"  {name:8} entities {memory[name]:8.0f} KiB   build {build_ms:7.2f} ms   "
+              f"json.dumps {dumps_ms:7.2f} ms ({len(json.dumps(report)) / 1024:.0f} KiB)")
+
+    report = report_builders(analyzer, entity_dicts(n))["records"]()
+
+    def encode():
+        return EncodedReport(report).encoded("gzip")
+
+    encode_ms = min(timeit.repeat(encode, number=NUMBER, repeat=3)) / NUMBER * 1000
+    print(f"  EncodedReport + gzip {encode_ms:7.2f} ms once ({len(encode()[1]) / 1024:.0f} KiB sent)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="15,150,1500", help="Comma-separated paper counts")
+    args = parser.parse_args()
+
+    analyzer = CodebaseAnalyzer(Path("bench.zip"), "bench")
+    for n in map(int, args.sizes.split(",")):
+        bench(n, analyzer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+"""Opt-in runtime tracing for LLM and vector-DB client calls
+
+    import genai_trace
+    genai_trace.instrument("traces/app.jsonl", sample_rate=0.1)
+
+Trace files can be uploaded to the profiler's /api/v1 trace endpoint.
+"""
+from genai_trace.patches import instrument, uninstrument
+from genai_trace.recorder import TRACE_FORMAT, TraceRecorder
+
+__all__ = ["instrument", "uninstrument", "TraceRecorder", "TRACE_FORMAT"]
@@ -0,0 +1,213 @@
+import contextvars
+import functools
+import importlib
+import inspect
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from genai_trace.recorder import TraceRecorder
+
+# (module, class, method, provider, operation) for SDK calls worth timing
+LLM_METHODS = [
+    ("openai.resources.chat.completions", "Completions", "create", "openai", "chat"),
+    ("openai.resources.chat.completions", "AsyncCompletions", "create", "openai", "chat"),
+    ("openai.resources.completions", "Completions", "create", "openai", "completion"),
+    ("openai.resources.completions", "AsyncCompletions", "create", "openai", "completion"),
+    ("openai.resources.embeddings", "Embeddings", "create", "openai", "embedding"),
+    ("openai.resources.embeddings", "AsyncEmbeddings", "create", "openai", "embedding"),
+    ("openai.resources.responses", "Responses", "create", "openai", "chat"),
+    ("openai.resources.responses", "AsyncResponses", "create", "openai", "chat"),
+    ("anthropic.resources.messages", "Messages", "create", "anthropic", "chat"),
+    ("anthropic.resources.messages", "AsyncMessages", "create", "anthropic", "chat"),
+]
+
+VECTOR_DB_METHODS = [
+    ("chromadb.api.models.Collection", "Collection", "query", "chromadb", "query"),
+    ("chromadb.api.models.Collection", "Collection", "add", "chromadb", "upsert"),
+    ("chromadb.api.models.Collection", "Collection", "upsert", "chromadb", "upsert"),
+    ("pinecone", "Index", "query", "pinecone", "query"),
+    ("pinecone", "Index", "upsert", "pinecone", "upsert"),
+    ("qdrant_client", "QdrantClient", "search", "qdrant", "query"),
+    ("qdrant_client", "QdrantClient", "query_points", "qdrant", "query"),
+    ("qdrant_client", "QdrantClient", "upsert", "qdrant", "upsert"),
+    ("qdrant_client", "AsyncQdrantClient", "search", "qdrant", "query"),
+    ("qdrant_client", "AsyncQdrantClient", "query_points", "qdrant", "query"),
+    ("qdrant_client", "AsyncQdrantClient", "upsert", "qdrant", "upsert"),
+]
+
+# SDK base clients whose _retry_request runs once per retry of a request
+RETRY_HOOKS = [
+    ("openai._base_client", "SyncAPIClient"),
+    ("openai._base_client", "AsyncAPIClient"),
+    ("anthropic._base_client", "SyncAPIClient"),
+    ("anthropic._base_client", "AsyncAPIClient"),
+]
+
+# Retry counter for the call in flight on this thread or task
+_retries: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("genai_trace_retries", default=None)
+
+_recorder: Optional[TraceRecorder] = None
+_originals: List[Tuple[type, str, object]] = []
+
+
+def _usage(response) -> Tuple[Optional[int], Optional[int]]:
+    """Read (prompt, completion) token counts from an OpenAI or Anthropic response"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None, None
+    prompt = getattr(usage, "prompt_tokens", None)
+    if prompt is None:
+        prompt = getattr(usage, "input_tokens", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if completion is None:
+        completion = getattr(usage, "output_tokens", None)
+    return prompt, completion
+
+
+def _entry(site: Tuple[str, str], provider: str, operation: str, kwargs: Dict,
+           started: float, retries: List[int], response, error: Optional[BaseException]) -> Dict:
+    prompt_tokens, completion_tokens = _usage(response) if error is None else (None, None)
+    return {
+        "ts": round(time.time(), 3),
+        "site": site[0],
+        "func": site[1],
+        "provider": provider,
+        "op": operation,
+        "model": kwargs.get("model") if isinstance(kwargs.get("model"), str) else None,
+        # Streaming calls are timed to the first response, not the end of the stream
+        "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "retries": retries[0],
+        "error": type(error).__name__ if error is not None else None,
+        "stream": bool(kwargs.get("stream")),
+    }
+
+
+def _wrap(original, provider: str, operation: str):
+    """Wrap a sync or async client method so sampled calls are timed and recorded"""
+    # SDK methods are often wrapped by sync decorators around an async def
+    if inspect.iscoroutinefunction(inspect.unwrap(original)):
+        @functools.wraps(original)
+        async def traced_async(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None or not recorder.sampled():
+                return await original(*args, **kwargs)
+            site = recorder.call_site()
+            retries = [0]
+            token = _retries.set(retries)
+            started = time.perf_counter()
+            try:
+                response = await original(*args, **kwargs)
+            except BaseException as e:
+                recorder.record(_entry(site, provider, operation, kwargs, started, retries, None, e))
+                raise
+            finally:
+                _retries.reset(token)
+            recorder.record(_entry(site, provider, operation, kwargs, started, retries, response, None))
+            return response
+        return traced_async
+
+    @functools.wraps(original)
+    def traced(*args, **kwargs):
+        recorder = _recorder
+        if recorder is None or not recorder.sampled():
+            return original(*args, **kwargs)
+        site = recorder.call_site()
+        retries = [0]
+        token = _retries.set(retries)
+        started = time.perf_counter()
+        try:
+            response = original(*args, **kwargs)
+        except BaseException as e:
+            recorder.record(_entry(site, provider, operation, kwargs, started, retries, None, e))
+            raise
+        finally:
+            _retries.reset(token)
+        recorder.record(_entry(site, provider, operation, kwargs, started, retries, response, None))
+        return response
+    return traced
+
+
+def _wrap_retry(original):
+    """Count SDK retries against the traced call that triggered them"""
+    @functools.wraps(original)
+    def counted(*args, **kwargs):
+        retries = _retries.get()
+        if retries is not None:
+            retries[0] += 1
+        return original(*args, **kwargs)
+    return counted
+
+
+def _patch(module_name: str, class_name: str, method: str, wrapper) -> bool:
+    """Replace a class method if its library is installed; returns whether it was patched"""
+    try:
+        owner = getattr(importlib.import_module(module_name), class_name)
+        original = owner.__dict__[method]
+    except (ImportError, AttributeError, KeyError):
+        return False
+    _originals.append((owner, method, original))
+    setattr(owner, method, wrapper(original))
+    return True
+
+
+def instrument(
+    path: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    buffer_size: int = 1024,
+    flush_interval: float = 5.0,
+    root: Optional[str] = None,
+    vector_dbs: bool = True,
+) -> TraceRecorder:
+    """Start tracing LLM and vector-DB client calls into a JSONL trace file
+
+    Defaults come from GENAI_TRACE_FILE and GENAI_TRACE_SAMPLE_RATE. Calling
+    this again replaces the recorder without patching twice.
+    """
+    global _recorder
+    if _recorder is not None:
+        _recorder.flush()
+    _recorder = TraceRecorder(
+        path or os.environ.get("GENAI_TRACE_FILE", "genai_trace.jsonl"),
+        sample_rate=sample_rate if sample_rate is not None else float(os.environ.get("GENAI_TRACE_SAMPLE_RATE", "1.0")),
+        buffer_size=buffer_size,
+        flush_interval=flush_interval,
+        root=root,
+        skip_paths=_sdk_paths(),
+    )
+    if _originals:
+        return _recorder
+
+    methods = LLM_METHODS + (VECTOR_DB_METHODS if vector_dbs else [])
+    for module_name, class_name, method, provider, operation in methods:
+        _patch(module_name, class_name, method,
+               lambda original, p=provider, o=operation: _wrap(original, p, o))
+    for module_name, class_name in RETRY_HOOKS:
+        _patch(module_name, class_name, "_retry_request", _wrap_retry)
+    return _recorder
+
+
+def uninstrument():
+    """Restore the original client methods and flush the remaining records"""
+    global _recorder
+    while _originals:
+        owner, method, original = _originals.pop()
+        setattr(owner, method, original)
+    if _recorder is not None:
+        _recorder.flush()
+        _recorder = None
+
+
+def _sdk_paths() -> Tuple[str, ...]:
+    """Install directories of client libraries, skipped when finding the call site"""
+    paths = []
+    for name in ("openai", "anthropic", "httpx", "chromadb", "pinecone", "qdrant_client", "asyncio"):
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        if getattr(module, "__file__", None):
+            paths.append(os.path.dirname(os.path.abspath(module.__file__)) + os.sep)
+    return tuple(paths)
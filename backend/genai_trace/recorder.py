@@ -0,0 +1,132 @@
+import atexit
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+TRACE_FORMAT = "genai-trace/1"
+
+# Frames from these packages are skipped when looking for the calling line
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+class TraceRecorder:
+    """Sample LLM and retrieval calls into a fixed-size ring buffer flushed as JSONL
+
+    Each line of the trace file is one call:
+
+        {"ts": 1712345678.123, "site": "app/rag.py:42", "func": "answer",
+         "provider": "openai", "op": "chat", "model": "gpt-4o-mini",
+         "latency_ms": 812.4, "prompt_tokens": 950, "completion_tokens": 120,
+         "retries": 0, "error": null, "stream": false, "sample_rate": 1.0}
+
+    The first line is a header ({"format": "genai-trace/1", ...}) written when
+    the file is created. Sites use the same path:line form as static analysis
+    locations, relative to `root`, so the two can be joined.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: float = 1.0,
+        buffer_size: int = 1024,
+        flush_interval: float = 5.0,
+        root: Optional[str] = None,
+        skip_paths: Tuple[str, ...] = (),
+    ):
+        self.path = path
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.flush_interval = flush_interval
+        self.root = os.path.abspath(root or os.getcwd())
+        self.skip_paths = (_PACKAGE_DIR,) + tuple(skip_paths)
+        self.recorded = 0
+        self.dropped = 0  # Records lost to write errors
+
+        # Preallocated ring buffer; a full buffer is swapped out and written in one go
+        self._buffer: List[Optional[Dict]] = [None] * max(1, buffer_size)
+        self._next = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._sites: Dict[Tuple[str, int], str] = {}
+        self._files: Dict[str, str] = {}
+        self._random = random.random
+
+        atexit.register(self.flush)
+
+    def sampled(self) -> bool:
+        """Decide up front whether to time a call; unsampled calls pass straight through"""
+        return self.sample_rate >= 1.0 or self._random() < self.sample_rate
+
+    def call_site(self) -> Tuple[str, str]:
+        """Get the (path:line, function) of the first frame outside instrumented packages"""
+        frame = sys._getframe(1)
+        skip = self.skip_paths
+        while frame is not None and frame.f_code.co_filename.startswith(skip):
+            frame = frame.f_back
+        if frame is None:
+            return "<unknown>", ""
+
+        code = frame.f_code
+        key = (code.co_filename, frame.f_lineno)
+        site = self._sites.get(key)
+        if site is None:
+            site = self._sites[key] = f"{self._relative(code.co_filename)}:{frame.f_lineno}"
+        return site, code.co_name
+
+    def _relative(self, filename: str) -> str:
+        """Make a source path relative to the project root, as static analysis reports it"""
+        relative = self._files.get(filename)
+        if relative is None:
+            absolute = os.path.abspath(filename)
+            if absolute.startswith(self.root + os.sep):
+                relative = os.path.relpath(absolute, self.root).replace(os.sep, "/")
+            else:
+                relative = absolute
+            self._files[filename] = relative
+        return relative
+
+    def record(self, entry: Dict):
+        """Add one call record, flushing when the buffer fills or the interval passes"""
+        entry["sample_rate"] = self.sample_rate
+        full = None
+        with self._lock:
+            self._buffer[self._next] = entry
+            self._next += 1
+            self.recorded += 1
+            now = time.monotonic()
+            if self._next == len(self._buffer) or now - self._last_flush >= self.flush_interval:
+                full = self._swap(now)
+        if full:
+            self._write(full)
+
+    def flush(self):
+        """Write buffered records to the trace file"""
+        with self._lock:
+            pending = self._swap(time.monotonic())
+        if pending:
+            self._write(pending)
+
+    def _swap(self, now: float) -> List[Dict]:
+        """Take the filled part of the buffer (caller holds the lock)"""
+        pending = self._buffer[:self._next]
+        self._buffer = [None] * len(self._buffer)
+        self._next = 0
+        self._last_flush = now
+        return pending
+
+    def _write(self, records: List[Dict]):
+        """Append records as compact JSON lines; tracing never raises into the caller"""
+        with self._write_lock:
+            try:
+                new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+                with open(self.path, "a", encoding="utf-8") as f:
+                    if new_file:
+                        f.write(json.dumps({"format": TRACE_FORMAT, "root": self.root}) + "\n")
+                    f.write("".join(json.dumps(r, separators=(",", ":"), default=str) + "\n" for r in records))
+            except OSError as e:
+                self.dropped += len(records)
+                print(f"Trace write error: {e}")
@@ -248,6 +248,12 @@ export default function ReportView({ result, onReset }: ReportViewProps) {
                       <p className="text-sm">
                         <span className="font-medium">Finding:</span> {rec.evidence.finding}
                       </p>
+                      {rec.supporting_evidence?.length > 0 && (
+                        <p className="text-sm mt-1">
+                          <span className="font-medium">Also supported by:</span>{' '}
+                          {rec.supporting_evidence.map((e: any) => `${e.paper} (${e.year})`).join('; ')}
+                        </p>
+                      )}
                     </div>
 
                     {/* Code Locations */}